@@ -1,27 +1,105 @@
 from django.contrib import admin
 
-from api.models import Customer, Wishlist, Product
+from api.core.admin import LargeTableAdminMixin, PaginatedInlineMixin
+from api.core.deletion import soft_delete
+from api.filters import search_customers, search_products
+from api.models import Customer, DeletionJob, Wishlist, Product
 
 
-class WishlistInline(admin.TabularInline):
+class SoftDeleteAdminMixin:
+    """Remove os objetos como a API: ocultos imediatamente e removidos definitivamente em segundo plano."""
+    def delete_model(self, request, obj):
+        soft_delete(obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            soft_delete(obj)
+
+
+class WishlistInline(PaginatedInlineMixin, admin.TabularInline):
+    """
+    Produtos da lista de favoritos do cliente, paginados, lidos com o produto no mesmo SELECT. Os produtos são apenas
+    exibidos ou removidos, a inclusão é feita em WishlistAddInline.
+    """
     model = Wishlist
     fields = ['product']
+    readonly_fields = ['product']
     extra = 0
+    page_query_param = 'wishlist_page'
+
+    def get_queryset(self, request):
+        # O cliente é usado na descrição de cada item
+        return super().get_queryset(request).filter(product__deleted_at__isnull=True).select_related(
+            'customer', 'product').order_by('-id')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class WishlistAddInline(admin.TabularInline):
+    """Inclusão de produtos na lista de favoritos, com a busca de produtos do ProductAdmin (autocomplete)."""
+    model = Wishlist
+    fields = ['product']
+    autocomplete_fields = ['product']
+    extra = 1
+    can_delete = False
+    verbose_name_plural = 'Incluir produtos favoritos'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).none()
+
+
+class BrandListFilter(admin.SimpleListFilter):
+    """Filtro por marca, com as marcas lidas pelo índice (brand, id) em vez de um DISTINCT sobre todos os produtos."""
+    title = 'marca'
+    parameter_name = 'brand'
+    max_brands = 500
+
+    def lookups(self, request, model_admin):
+        return [(brand, brand) for brand in Product.objects.brands(self.max_brands)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(brand=self.value())
+        return queryset
 
 
 @admin.register(Customer)
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(SoftDeleteAdminMixin, LargeTableAdminMixin, admin.ModelAdmin):
     list_per_page = 10
     list_display = ('id', 'name', 'email')
     fields = ['name', 'email', ]
     search_fields = ['name', 'email']
-    inlines = [WishlistInline, ]
+    inlines = [WishlistInline, WishlistAddInline, ]
+
+    def get_search_results(self, request, queryset, search_term):
+        """Busca pelo e-mail exato ou pelo prefixo das palavras do nome, ambos indexados, em vez de icontains"""
+        if not search_term:
+            return queryset, False
+        return search_customers(queryset, search_term), False
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(SoftDeleteAdminMixin, LargeTableAdminMixin, admin.ModelAdmin):
     list_per_page = 10
-    list_display = ('id', 'title', 'brand', 'price', 'image')
-    fields = ['title', 'brand', 'price', 'image', 'review_score']
-    list_filter = ('brand', )
-    search_fields = ['title', 'brand']
+    list_display = ('id', 'sku', 'title', 'brand', 'price', 'image')
+    fields = ['sku', 'title', 'brand', 'price', 'image', 'review_score']
+    list_filter = (BrandListFilter, )
+    search_fields = ['title', 'brand', 'sku']
+
+    def get_search_results(self, request, queryset, search_term):
+        """Busca pelo tsvector indexado (GIN) em vez de icontains, que percorre toda a tabela"""
+        if not search_term:
+            return queryset, False
+        return search_products(queryset, search_term), False
+
+
+@admin.register(DeletionJob)
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_per_page = 20
+    list_display = ('id', 'model', 'object_id', 'status', 'deleted', 'total', 'progress', 'attempts', 'updated_at')
+    list_filter = ('status', 'model')
+    readonly_fields = [field.name for field in DeletionJob._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Registra os receivers dos signals dos modelos e as verificações da configuração
+        from api import checks, signals  # noqa: F401
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+from api.db import router
+
+
+# Backends de cache que não são compartilhados pelos processos do servidor
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, Tags.database)
+def check_replica_pin_cache(app_configs, **kwargs):
+    """
+    Com réplicas de leitura, a leitura das próprias escritas depende das marcações no cache CACHE_ALIAS: em um cache
+    do processo, a leitura seguinte atendida por outro worker não encontra a marcação e pode ler a réplica atrasada.
+    """
+    if not router.replicas_enabled():
+        return []
+
+    alias = router.get_config().get('CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend in LOCAL_CACHE_BACKENDS:
+        return [Error(
+            'O cache {!r} ({}) não é compartilhado pelos processos do servidor.'.format(alias, backend),
+            hint='Configure CACHE_BACKEND (ex.: Redis ou Memcached) ao habilitar as réplicas (DB_REPLICA_HOSTS).',
+            id='api.E001',
+        )]
+    return []
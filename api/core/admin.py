@@ -0,0 +1,88 @@
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.forms.models import BaseInlineFormSet
+from django.utils.functional import cached_property
+
+
+def estimate_count(queryset):
+    """Quantidade de linhas da queryset estimada pelo planner do PostgreSQL (EXPLAIN), sem percorrer as linhas."""
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+
+    # O psycopg2 converte o JSON, exceto quando o tipo json não está registrado
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator para tabelas grandes: quando a estimativa do planner passa de exact_count_limit linhas, ela é usada
+    como a quantidade de objetos, então o custo da contagem não cresce com a tabela. Abaixo disso, os objetos são
+    contados com um COUNT(*) sobre uma subquery com LIMIT. A última página pode ficar vazia ou incompleta quando a
+    estimativa é maior que a quantidade real.
+    """
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate > self.exact_count_limit:
+            return estimate
+        count = self.object_list[:self.exact_count_limit].count()
+        return count if count < self.exact_count_limit else max(estimate, count)
+
+
+class LargeTableAdminMixin:
+    """
+    Mixin para ModelAdmins de tabelas grandes: a listagem não executa o COUNT(*) de toda a tabela (total sem os
+    filtros) e a quantidade de registros encontrados é estimada acima de EstimatedCountPaginator.exact_count_limit.
+    A ordenação deve usar um índice, ex.: a chave primária.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-pk', )
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """
+    Formset de inline que edita apenas uma página dos objetos relacionados, lida com LIMIT / OFFSET. A página é
+    informada pela PaginatedInlineMixin, a partir do parâmetro da URL, e é mantida no POST (o formulário do admin é
+    enviado para a própria URL).
+    """
+    per_page = 20
+    page_number = 1
+    page_query_param = 'page'
+    page = None
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            paginator = Paginator(super().get_queryset(), self.per_page)
+            self.page = paginator.get_page(self.page_number)
+
+            # Carrega a página uma única vez, os formulários são montados a partir dos objetos carregados
+            self._queryset = self.page.object_list
+            len(self._queryset)
+        return self._queryset
+
+
+class PaginatedInlineMixin:
+    """
+    Mixin para inlines com muitos objetos relacionados (ex.: a lista de favoritos de um cliente), que exibe
+    per_page objetos por página, com os links de paginação abaixo do inline.
+    """
+    formset = PaginatedInlineFormSet
+    template = 'admin/api/edit_inline/paginated_tabular.html'
+    per_page = 20
+    page_query_param = 'page'
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.per_page = self.per_page
+        formset.page_query_param = self.page_query_param
+        formset.page_number = request.GET.get(self.page_query_param, 1)
+        return formset
@@ -0,0 +1,130 @@
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed
+from rest_framework.permissions import BasePermission
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from api.core.instrumentation import get_timings, query_timer, timed
+from api.core.values import UnsupportedSerializer, ValuesSerializer
+
+
+class AsyncReadView:
+    """
+    View assíncrona (async def, executada diretamente no event loop do servidor ASGI) das operações list e retrieve
+    de um ViewSet.
+
+    O ORM do Django 3.2 não é assíncrono: a autenticação, as permissões e as queries da operação são executadas em
+    uma única chamada sync_to_async por requisição, com as mesmas classes de autenticação, permissão, filtros e
+    paginação do ViewSet. A serialização a partir de .values() (ValuesSerializer) e a renderização do JSON são
+    executadas no event loop, então a thread é ocupada apenas durante as queries e conexões ociosas não ocupam
+    nenhuma thread.
+
+    A resposta é idêntica à da operação síncrona, exceto pelos links de paginação, que apontam para a própria view.
+    Quando o ViewSet possui permissões por objeto, retrieve carrega o objeto por get_object(), que as verifica.
+    As requisições condicionais, o cache de produtos e a lista de favoritos serializada não são usados.
+    """
+    renderer_classes = [JSONRenderer]
+    http_method_names = ['get', 'head']
+
+    def __init__(self, viewset_class, action):
+        self.viewset_class = viewset_class
+        self.action = action
+
+    @classmethod
+    def as_view(cls, viewset_class, action):
+        instance = cls(viewset_class, action)
+
+        async def view(request, *args, **kwargs):
+            return await instance.dispatch(request, *args, **kwargs)
+
+        # Assim como nas views do DRF, o CSRF é verificado pela SessionAuthentication
+        view.csrf_exempt = True
+        view.view_class = viewset_class
+        view.view_initkwargs = {'action': action}
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method.lower() not in self.http_method_names:
+            return HttpResponseNotAllowed([method.upper() for method in self.http_method_names])
+
+        viewset, response, serialize = await sync_to_async(self.run, thread_sensitive=True)(request, args, kwargs)
+        if serialize is not None:
+            response = serialize()
+        return self.render(viewset, response)
+
+    def get_viewset(self, request, args, kwargs):
+        """Instancia o ViewSet como ViewSetMixin.as_view, com os renderers da view assíncrona."""
+        viewset = self.viewset_class(renderer_classes=self.renderer_classes)
+        viewset.action_map = {'get': self.action}
+        viewset.action = self.action
+        viewset.args = args
+        viewset.kwargs = kwargs
+        viewset.request = viewset.initialize_request(request, *args, **kwargs)
+        viewset.headers = viewset.default_response_headers
+        return viewset
+
+    def run(self, request, args, kwargs):
+        """
+        Executado em uma thread: autentica, verifica as permissões e executa as queries da operação. Retorna o ViewSet,
+        a resposta e, quando a serialização não consulta o banco de dados, uma função que monta a resposta no event
+        loop.
+        """
+        viewset = self.get_viewset(request, args, kwargs)
+        with query_timer(get_timings(request)):
+            try:
+                viewset.initial(viewset.request, *args, **kwargs)
+                try:
+                    values_serializer = ValuesSerializer(viewset.get_serializer())
+                except UnsupportedSerializer:
+                    return viewset, getattr(viewset, self.action)(viewset.request, *args, **kwargs), None
+                return (viewset, None) + (getattr(self, self.action)(viewset, values_serializer), )
+            except Exception as exc:
+                return viewset, viewset.handle_exception(exc), None
+
+    def deferred(self, values_serializer, rows, build_response):
+        # As relações "para muitos" são consultadas na serialização, que nesse caso é executada na thread
+        if values_serializer.plan.related:
+            response = build_response(values_serializer.to_representation(rows))
+            return lambda: response
+        return lambda: build_response(values_serializer.to_representation(rows))
+
+    def list(self, viewset, values_serializer):
+        queryset = viewset.get_values_queryset(values_serializer, viewset.filter_queryset(viewset.get_queryset()))
+        page = viewset.paginate_queryset(queryset)
+        if page is not None:
+            return self.deferred(values_serializer, page, viewset.get_paginated_response)
+        return self.deferred(values_serializer, list(queryset), Response)
+
+    def has_object_permissions(self, viewset):
+        """Verifica se alguma das permissões do ViewSet implementa has_object_permission."""
+        return any(type(permission).has_object_permission is not BasePermission.has_object_permission
+                   for permission in viewset.get_permissions())
+
+    def retrieve(self, viewset, values_serializer):
+        # As permissões por objeto precisam do objeto: ele é carregado e serializado como na operação síncrona, por
+        # get_object(), que executa check_object_permissions
+        if self.has_object_permissions(viewset):
+            response = Response(viewset.get_serializer(viewset.get_object()).data)
+            return lambda: response
+
+        lookup_url_kwarg = viewset.lookup_url_kwarg or viewset.lookup_field
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        try:
+            queryset = queryset.filter(**{viewset.lookup_field: viewset.kwargs[lookup_url_kwarg]})
+            rows = list(values_serializer.values(queryset)[:2])
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        if len(rows) != 1:
+            raise Http404
+        return self.deferred(values_serializer, rows, lambda data: Response(data[0]))
+
+    def render(self, viewset, response):
+        """Renderiza a resposta no event loop, retornando um HttpResponse que o Django não precisa renderizar."""
+        response = viewset.finalize_response(viewset.request, response)
+        with timed(viewset.request, 'render'):
+            content = response.rendered_content
+        rendered = HttpResponse(content, status=response.status_code)
+        for header, value in response.items():
+            rendered[header] = value
+        return rendered
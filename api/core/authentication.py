@@ -0,0 +1,150 @@
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import caches
+from drf_spectacular.extensions import OpenApiAuthenticationExtension
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+from api.models import RevokedToken
+
+
+# Separa as assinaturas dos tokens de outros usos da SECRET_KEY
+TOKEN_SALT = 'api.core.authentication.token'
+
+
+def get_config():
+    return getattr(settings, 'API_TOKEN', None) or {}
+
+
+def get_lifetime():
+    return get_config().get('LIFETIME', 3600)
+
+
+def _cache():
+    return caches[get_config().get('CACHE_ALIAS', 'default')]
+
+
+def _revoked_key(jti):
+    return 'api:token-revoked:{}'.format(jti)
+
+
+def _not_before_key(user_pk):
+    return 'api:token-not-before:{}'.format(user_pk)
+
+
+def issue_token(user):
+    """
+    Emite um token de acesso do usuário, assinado com HMAC-SHA256 (SECRET_KEY), contendo o id, o nome e as permissões
+    de administrador do usuário, a emissão, a expiração (LIFETIME segundos) e um identificador para a revogação.
+    Retorna o token e a expiração, em segundos desde a época.
+    """
+    now = time.time()
+    expires_at = int(now) + get_lifetime()
+    claims = {
+        'u': user.pk, 'n': user.get_username(), 's': user.is_staff, 'a': user.is_superuser,
+        'i': int(now * 1000), 'e': expires_at, 'j': uuid.uuid4().hex,
+    }
+    return signing.Signer(salt=TOKEN_SALT).sign_object(claims, compress=False), expires_at
+
+
+def decode_token(token):
+    """Verifica a assinatura e a expiração do token, retornando o seu conteúdo. Não consulta o banco de dados."""
+    try:
+        claims = signing.Signer(salt=TOKEN_SALT).unsign_object(token)
+    except (signing.BadSignature, ValueError):
+        raise exceptions.AuthenticationFailed('Token inválido.')
+    if not isinstance(claims, dict) or claims.get('e', 0) < time.time():
+        raise exceptions.AuthenticationFailed('Token expirado.')
+    return claims
+
+
+def is_revoked(claims):
+    """
+    Verifica se o token foi revogado ou se todos os tokens do usuário emitidos antes dele foram revogados. As
+    revogações ficam no banco de dados; o resultado de cada token fica no cache por CACHE_TIMEOUT segundos, então a
+    maioria das requisições não consulta o banco de dados. Uma entrada removida do cache é lida novamente do banco.
+    """
+    cache = _cache()
+    revoked_key, not_before_key = _revoked_key(claims['j']), _not_before_key(claims['u'])
+    values = cache.get_many([revoked_key, not_before_key])
+    if claims['i'] < values.get(not_before_key, 0):
+        return True
+
+    revoked = values.get(revoked_key)
+    if revoked is None:
+        revoked = RevokedToken.objects.is_revoked(claims['j'], claims['u'], claims['i'])
+        cache.set(revoked_key, revoked, timeout=get_config().get('CACHE_TIMEOUT', 5))
+    return revoked
+
+
+def revoke_token(claims):
+    """Revoga o token até a sua expiração."""
+    if claims['e'] > time.time():
+        RevokedToken.objects.revoke(claims['j'], datetime.fromtimestamp(claims['e'], tz=timezone.utc))
+        _cache().set(_revoked_key(claims['j']), True, timeout=get_config().get('CACHE_TIMEOUT', 5))
+
+
+def revoke_user_tokens(user_pk):
+    """
+    Revoga todos os tokens do usuário emitidos até agora. Com um cache por processo, os outros processos com o
+    resultado de um dos tokens em cache o consideram revogado após no máximo CACHE_TIMEOUT segundos.
+    """
+    not_before = int(time.time() * 1000) + 1
+    RevokedToken.objects.revoke_user(user_pk, not_before)
+    _cache().set(_not_before_key(user_pk), not_before, timeout=get_lifetime() + 1)
+
+
+def get_token_user(claims):
+    """Usuário do token, montado a partir do seu conteúdo, sem consultar o banco de dados."""
+    user_model = get_user_model()
+    user = user_model(**{user_model._meta.pk.attname: claims['u'], user_model.USERNAME_FIELD: claims['n']},
+                      is_staff=claims['s'], is_superuser=claims['a'], is_active=True)
+    user._state.adding = False
+    return user
+
+
+class BearerTokenAuthentication(BaseAuthentication):
+    """
+    Autenticação por token de acesso assinado (header Authorization: Bearer <token>), emitido em /api/token/.
+
+    O token é verificado com um HMAC e a revogação com uma leitura do cache (ver is_revoked), sem consultar os
+    usuários e as sessões e sem o hash da senha (PBKDF2) da autenticação básica em cada requisição. As alterações do
+    usuário (ex.: remoção ou perda da permissão de administrador) revogam os seus tokens (api.signals). As revogações
+    ficam no banco de dados, compartilhadas por todos os processos.
+    """
+    keyword = b'bearer'
+
+    def authenticate(self, request):
+        header = get_authorization_header(request).split()
+        if not header or header[0].lower() != self.keyword:
+            return None
+        if len(header) != 2:
+            raise exceptions.AuthenticationFailed('Token inválido.')
+
+        try:
+            claims = decode_token(header[1].decode('ascii'))
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Token inválido.')
+        if is_revoked(claims):
+            raise exceptions.AuthenticationFailed('Token revogado.')
+        return get_token_user(claims), claims
+
+    def authenticate_header(self, request):
+        # Sem o token na requisição mantém o status 403 das requisições sem autenticação
+        header = get_authorization_header(request).split()
+        if header and header[0].lower() == self.keyword:
+            return 'Bearer realm="api"'
+
+
+class BearerTokenScheme(OpenApiAuthenticationExtension):
+    """Documenta a autenticação por token de acesso no schema OpenAPI."""
+    target_class = BearerTokenAuthentication
+    name = 'bearerAuth'
+
+    def get_security_definition(self, auto_schema):
+        return {'type': 'http', 'scheme': 'bearer'}
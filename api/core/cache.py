@@ -0,0 +1,263 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.http import Http404
+from django.urls import reverse
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema
+from rest_framework import permissions
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from api.core.fields import SparseFieldsetMixin
+from api.core.optimizer import load_ordering_columns
+from api.core.values import ValuesSerializerMixin
+
+
+class LocalLRUCache:
+    """
+    Cache em memória do processo, limitado a max_size itens (remove o item usado há mais tempo) e com tempo de
+    expiração por item.
+    """
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SerializerCache:
+    """
+    Cache de objetos serializados em duas camadas: um LRU em memória do processo e o cache framework do Django,
+    compartilhado entre os processos. As chaves são versionadas pelo VERSION da configuração, permitindo descartar
+    todo o cache quando o formato do serializer mudar.
+
+    A invalidação remove o item das duas camadas no processo corrente, nos demais processos o item em memória expira
+    em LOCAL_TIMEOUT segundos.
+
+    A configuração é lida do dict informado em setting_name, com as chaves ALIAS, TIMEOUT, VERSION, LOCAL_MAX_SIZE e
+    LOCAL_TIMEOUT.
+    """
+    defaults = {
+        'ALIAS': 'default',
+        'TIMEOUT': 300,
+        'VERSION': 1,
+        'LOCAL_MAX_SIZE': 10000,
+        'LOCAL_TIMEOUT': 5,
+    }
+
+    def __init__(self, prefix, setting_name):
+        self.prefix = prefix
+        self.setting_name = setting_name
+        self._local = None
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def config(self):
+        return dict(self.defaults, **getattr(settings, self.setting_name, {}))
+
+    @property
+    def shared(self):
+        return caches[self.config['ALIAS']]
+
+    @property
+    def local(self):
+        if self._local is None:
+            self._local = LocalLRUCache(self.config['LOCAL_MAX_SIZE'], self.config['LOCAL_TIMEOUT'])
+        return self._local
+
+    def key(self, pk):
+        return '{}:{}'.format(self.prefix, pk)
+
+    def _count(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                self._stats[name] += value
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['local_size'] = len(self._local) if self._local is not None else 0
+        return stats
+
+    def get_many(self, pks):
+        """Retorna um dict {pk: objeto serializado} com os itens encontrados no cache."""
+        found = {}
+        missing = []
+        for pk in pks:
+            value = self.local.get(self.key(pk))
+            if value is None:
+                missing.append(pk)
+            else:
+                found[pk] = value
+        local_hits = len(found)
+
+        if missing:
+            shared = self.shared.get_many([self.key(pk) for pk in missing], version=self.config['VERSION'])
+            for pk in missing:
+                value = shared.get(self.key(pk))
+                if value is not None:
+                    found[pk] = value
+                    self.local.set(self.key(pk), value)
+
+        self._count(local_hits=local_hits, shared_hits=len(found) - local_hits, misses=len(pks) - len(found))
+        return found
+
+    def get(self, pk):
+        return self.get_many([pk]).get(pk)
+
+    def set_many(self, data):
+        """Armazena um dict {pk: objeto serializado} nas duas camadas."""
+        config = self.config
+        for pk, value in data.items():
+            self.local.set(self.key(pk), value)
+        self.shared.set_many({self.key(pk): value for pk, value in data.items()}, timeout=config['TIMEOUT'],
+                             version=config['VERSION'])
+
+    def invalidate_many(self, pks):
+        for pk in pks:
+            self.local.delete(self.key(pk))
+        self.shared.delete_many([self.key(pk) for pk in pks], version=self.config['VERSION'])
+
+    def invalidate(self, pk):
+        self.invalidate_many([pk])
+
+    def clear(self):
+        """Descarta o cache em memória e os contadores, usado nos testes."""
+        if self._local is not None:
+            self._local.clear()
+        self._local = None
+        self.reset_stats()
+
+
+product_cache = SerializerCache('api:product', 'PRODUCT_CACHE')
+
+
+class SerializerCacheMixin(SparseFieldsetMixin, ValuesSerializerMixin):
+    """
+    Mixin para ViewSets que atende list e retrieve a partir do cache de objetos serializados (read-through). Os objetos
+    ausentes no cache são serializados pelo ValuesSerializer quando FAST_SERIALIZATION estiver habilitado.
+
+    O cache armazena os objetos inteiros e os campos pedidos (parâmetros fields e exclude) são selecionados em cada
+    resposta. O campo de URL depende do host da requisição, por isso não é armazenado no cache e é montado a cada
+    resposta, apenas quando é pedido.
+    Como o objeto não é carregado quando está no cache, este mixin não deve ser usado em views com permissões por
+    objeto.
+    """
+    serializer_cache = None
+    cache_url_field = 'url'
+
+    def get_cached_pk(self):
+        try:
+            return int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            return None
+
+    def to_cache(self, data):
+        data = dict(data)
+        data.pop(self.cache_url_field, None)
+        return data
+
+    def from_cache(self, pk, data):
+        fieldset = self.get_fieldset()
+        data = dict(data)
+        if self.cache_url_field in fieldset:
+            data[self.cache_url_field] = self.request.build_absolute_uri(
+                reverse('{}-detail'.format(self.basename), kwargs={self.lookup_url_kwarg or self.lookup_field: pk}))
+        return fieldset.select(data)
+
+    def serialize_and_cache(self, queryset):
+        # Lidos do banco principal: um objeto defasado lido de uma réplica ficaria no cache após a invalidação
+        queryset = queryset.using(DEFAULT_DB_ALIAS)
+        with self.full_serializers():
+            data = {pk: self.to_cache(item) for pk, item in self.serialize_queryset(queryset)}
+        self.serializer_cache.set_many(data)
+        return data
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.get_cached_pk()
+        if pk is None:
+            raise Http404
+
+        # Valida os campos pedidos antes de consultar o cache
+        self.get_fieldset()
+        data = self.serializer_cache.get(pk)
+        if data is None:
+            with self.full_serializers():
+                queryset = self.filter_queryset(self.get_queryset())
+            data = self.serialize_and_cache(queryset.filter(pk=pk)).get(pk)
+            if data is None:
+                raise Http404
+        return Response(self.from_cache(pk, data))
+
+    def list(self, request, *args, **kwargs):
+        self.get_fieldset()
+
+        # Pagina apenas os ids, os objetos são recuperados do cache e apenas os ausentes são consultados
+        with self.full_serializers():
+            queryset = self.filter_queryset(self.get_queryset())
+        pk_name = queryset.model._meta.pk.name
+        ids = load_ordering_columns(queryset.only(pk_name))
+        page = self.paginate_queryset(ids)
+        instances = page if page is not None else list(ids)
+
+        pks = [instance.pk for instance in instances]
+        found = self.serializer_cache.get_many(pks)
+        missing = [pk for pk in pks if pk not in found]
+        if missing:
+            found.update(self.serialize_and_cache(queryset.filter(pk__in=missing)))
+
+        # Um objeto listado por uma réplica pode já ter sido removido do banco principal
+        data = [self.from_cache(pk, found[pk]) for pk in pks if pk in found]
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    @extend_schema(responses=OpenApiTypes.OBJECT)
+    @action(detail=False, methods=['get'], url_path='cache-stats', permission_classes=[permissions.IsAdminUser])
+    def cache_stats(self, request):
+        """
+        Contadores de acerto e falha do cache, este operação pode ser acessado apenas por superusuários (admins)
+        """
+        return Response(self.serializer_cache.stats())
@@ -0,0 +1,62 @@
+import hashlib
+from functools import partial
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+class ConditionalGetMixin:
+    """
+    Mixin para ViewSets que responde requisições condicionais (If-None-Match / If-Modified-Since) com 304 sem executar
+    a action nem o serializer.
+
+    Os validadores são obtidos pelo método get_conditional_validators, que deve executar uma única query indexada e
+    retornar uma tupla (valores que identificam a versão do recurso, data da última alteração), ou None quando o
+    recurso não existe. O ETag é um hash desses valores, da URL e do formato de resposta.
+    """
+    conditional_actions = ('retrieve', )
+
+    def get_conditional_validators(self):
+        return None
+
+    def get_lookup_value(self, kwarg=None):
+        """Retorna o valor inteiro do parâmetro da URL, ou None caso não seja um inteiro válido."""
+        try:
+            return int(self.kwargs[kwarg or self.lookup_url_kwarg or self.lookup_field])
+        except (KeyError, ValueError):
+            return None
+
+    def get_etag(self, request, version):
+        renderer = getattr(request, 'accepted_renderer', None)
+        value = repr((version, request.get_full_path(), getattr(renderer, 'format', None)))
+        return 'W/"{}"'.format(hashlib.md5(value.encode()).hexdigest())
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        validators = self.get_conditional_validators() if self.action in self.conditional_actions else None
+        if validators is None:
+            return handler(request, *args, **kwargs)
+
+        version, last_modified = validators
+        etag = self.get_etag(request, version)
+        timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+
+        # Envolve o handler da rota, a action definida pelo próprio ViewSet: a mixin não define retrieve nem list, que
+        # o router exporia nos ViewSets que não possuem essas actions
+        if self.action in self.conditional_actions:
+            for method in ('get', 'head'):
+                handler = getattr(self, method, None)
+                if handler is not None:
+                    setattr(self, method, partial(self.conditional_response, handler))
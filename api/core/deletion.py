@@ -0,0 +1,109 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from api.core.cache import product_cache
+from api.core.membership import wishlist_membership_cache
+from api.models import Customer, DeletionJob, Product, Wishlist
+
+
+# Modelos com remoção em segundo plano: nome do modelo -> (modelo, campo de Wishlist)
+MODELS = {
+    'customer': (Customer, 'customer'),
+    'product': (Product, 'product'),
+}
+
+
+def get_config():
+    return dict({'BATCH_SIZE': 1000, 'LEASE_SECONDS': 60, 'MAX_ATTEMPTS': 3},
+                **(getattr(settings, 'DELETION_JOBS', None) or {}))
+
+
+def soft_delete(instance):
+    """
+    Remove o cliente ou produto sem apagar a linha: ele deixa de ser listado imediatamente e a remoção definitiva,
+    com os itens das listas de favoritos que dependem dele, é agendada em um DeletionJob.
+
+    A remoção é um UPDATE, sem os signals de alteração do produto, que incrementariam a versão das listas de todos os
+    clientes que o possuem na mesma requisição. As listas são atualizadas pelo job, a cada lote removido; até lá, as
+    listas serializadas (api.core.snapshot) e o cache das listas (api.core.membership) descartam o produto na leitura.
+    """
+    model, field_name = MODELS[instance._meta.model_name]
+    now = timezone.now()
+    with transaction.atomic():
+        # A data de alteração do produto muda o Last-Modified das listas de favoritos que o contêm
+        if not model.all_objects.filter(pk=instance.pk, deleted_at__isnull=True).update(deleted_at=now,
+                                                                                       updated_at=now):
+            return None
+
+        if model is Product:
+            total = model.all_objects.filter(pk=instance.pk).values_list('wishlist_count', flat=True).first() or 0
+        else:
+            total = Wishlist.objects.filter(customer_id=instance.pk).count()
+        job = DeletionJob.objects.enqueue(instance, total=total)
+
+    if model is Product:
+        product_cache.invalidate(instance.pk)
+        wishlist_membership_cache.products_deleted()
+    else:
+        wishlist_membership_cache.invalidate_many([instance.pk])
+    return job
+
+
+def run_job(job, batch_size=None, pause=0, progress=None):
+    """
+    Executa a remoção definitiva do job reservado: remove os itens das listas de favoritos em lotes de até batch_size
+    itens, cada um na sua própria transação com a atualização do progresso e da reserva do job, e por fim remove o
+    cliente ou produto. pause é o intervalo, em segundos, entre os lotes, limitando a carga no banco de dados.
+    progress(job) é chamado após cada lote.
+
+    Em caso de erro o job volta a ficar pendente, até MAX_ATTEMPTS tentativas, com o erro registrado. Retorna o job
+    atualizado.
+    """
+    config = get_config()
+    batch_size = batch_size or config['BATCH_SIZE']
+    model, field_name = MODELS[job.model]
+    jobs = DeletionJob.objects.filter(pk=job.pk)
+
+    try:
+        while True:
+            with transaction.atomic():
+                deleted = Wishlist.objects.purge(field_name, job.object_id, batch_size)
+                if deleted < batch_size:
+                    # Última etapa: o lock do objeto aguarda as inclusões concorrentes iniciadas antes da remoção
+                    # (as seguintes já o consideram inexistente) e os seus itens são removidos com ele
+                    list(model.all_objects.select_for_update().filter(pk=job.object_id).values_list('pk'))
+                    remaining = Wishlist.objects.purge(field_name, job.object_id, batch_size)
+                    deleted += remaining
+                    finished = remaining < batch_size
+                    if finished:
+                        model.all_objects.filter(pk=job.object_id).delete()
+                else:
+                    finished = False
+
+                now = timezone.now()
+                values = {'deleted': F('deleted') + deleted, 'updated_at': now}
+                if finished:
+                    values.update(status=DeletionJob.DONE, finished_at=now, locked_until=None, error='')
+                else:
+                    values['locked_until'] = now + timedelta(seconds=config['LEASE_SECONDS'])
+                jobs.update(**values)
+
+            job.refresh_from_db()
+            if progress is not None:
+                progress(job)
+            if finished:
+                return job
+            if pause:
+                time.sleep(pause)
+    except Exception as exc:
+        # O lote em andamento é desfeito e o progresso dos anteriores é mantido
+        status = DeletionJob.FAILED if job.attempts >= config['MAX_ATTEMPTS'] else DeletionJob.PENDING
+        jobs.update(status=status, error='{}: {}'.format(type(exc).__name__, exc), locked_until=None,
+                    updated_at=timezone.now())
+        job.refresh_from_db()
+        return job
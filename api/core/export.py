@@ -0,0 +1,100 @@
+import csv
+import json
+
+from django.http import StreamingHttpResponse
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.negotiation import BaseContentNegotiation
+
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+
+CONTENT_TYPES = {
+    NDJSON: 'application/x-ndjson; charset=utf-8',
+    CSV: 'text/csv; charset=utf-8',
+}
+
+
+class Echo:
+    """Pseudo arquivo que apenas retorna o que é escrito, usado para gerar as linhas do csv.writer sem buffer."""
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, fields, chunk_size=2000):
+    """
+    Percorre a queryset ordenada pela chave primária com um cursor do lado do servidor (.iterator()), retornando uma
+    tupla por linha com as colunas informadas em fields, uma sequência de (nome, coluna).
+    """
+    columns = [column for name, column in fields]
+    return queryset.prefetch_related(None).order_by('pk').values_list(*columns).iterator(chunk_size=chunk_size)
+
+
+def export_lines(rows, fields, output, flush_size=500):
+    """
+    Gera o conteúdo em NDJSON ou CSV, agrupando flush_size linhas por bloco. A memória usada é constante,
+    independente da quantidade de linhas.
+    """
+    names = [name for name, column in fields]
+    if output == CSV:
+        writer = csv.writer(Echo())
+        yield writer.writerow(names)
+        format_row = writer.writerow
+    else:
+        def format_row(row):
+            return json.dumps(dict(zip(names, row)), ensure_ascii=False) + '\n'
+
+    lines = []
+    for row in rows:
+        lines.append(format_row(row))
+        if len(lines) >= flush_size:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    """A exportação não usa renderer, qualquer header Accept é aceito."""
+    def select_parser(self, request, parsers):
+        return parsers[0] if parsers else None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class ExportMixin:
+    """
+    Mixin para ViewSets que adiciona a operação export, que retorna todos os registros em NDJSON (padrão) ou CSV
+    com StreamingHttpResponse: o primeiro bloco é enviado logo após a primeira leitura do cursor, sem COUNT(*) e sem
+    OFFSET.
+
+    As colunas exportadas são definidas em export_fields, uma sequência de (nome, coluna).
+    """
+    export_fields = ()
+    export_chunk_size = 2000
+
+    def get_export_queryset(self):
+        return self.get_queryset()
+
+    @extend_schema(responses=OpenApiTypes.STR,
+                   parameters=[OpenApiParameter('output', OpenApiTypes.STR, enum=[NDJSON, CSV],
+                                                description='Formato do arquivo exportado, padrão ndjson')])
+    @action(detail=False, methods=['get'], pagination_class=None,
+            content_negotiation_class=IgnoreClientContentNegotiation)
+    def export(self, request):
+        """
+        Exporta todos os registros em NDJSON (uma linha JSON por registro) ou CSV, ordenados pelo id
+        """
+        output = request.query_params.get('output', NDJSON)
+        if output not in CONTENT_TYPES:
+            raise ValidationError({'output': ['Formato inválido, use {} ou {}.'.format(NDJSON, CSV)]})
+
+        rows = export_rows(self.get_export_queryset(), self.export_fields, self.export_chunk_size)
+        response = StreamingHttpResponse(export_lines(rows, self.export_fields, output),
+                                         content_type=CONTENT_TYPES[output])
+        response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(self.basename, output)
+        return response
@@ -0,0 +1,208 @@
+from contextlib import contextmanager
+
+from drf_spectacular.openapi import AutoSchema
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from api.core.optimizer import _get_serializer
+
+
+def parse_fields(value, param):
+    """
+    Converte a lista de campos separados por vírgula, com os campos aninhados separados por ponto (ex.:
+    'id,wishList.id'), em uma árvore {campo: árvore dos campos aninhados}, onde None representa o campo inteiro.
+    """
+    tree = {}
+    for path in value.split(','):
+        path = path.strip()
+        if not path:
+            continue
+
+        names = [name.strip() for name in path.split('.')]
+        if not all(names):
+            raise ValidationError({param: ['Campo inválido: {}.'.format(path)]})
+
+        node = tree
+        for name in names[:-1]:
+            # O campo inteiro já foi selecionado
+            node = node.setdefault(name, {})
+            if node is None:
+                break
+        else:
+            node[names[-1]] = None
+    return tree
+
+
+def field_paths(serializer, prefix=''):
+    """Nomes dos campos renderizados pelo serializer, inclusive os aninhados (ex.: wishList.id)."""
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        yield prefix + name
+        nested = _get_serializer(field)
+        if nested is not None:
+            yield from field_paths(nested, prefix + name + '.')
+
+
+class Fieldset:
+    """
+    Campos selecionados de uma resposta: include é a árvore dos campos pedidos (None para todos) e exclude a árvore
+    dos campos omitidos, no formato de parse_fields.
+    """
+    def __init__(self, include=None, exclude=None):
+        self.include = include
+        self.exclude = exclude or {}
+
+    @property
+    def is_all(self):
+        return self.include is None and not self.exclude
+
+    def __contains__(self, name):
+        if self.include is not None and name not in self.include:
+            return False
+        return name not in self.exclude or self.exclude[name] is not None
+
+    def nested(self, name):
+        """Campos selecionados do serializer aninhado do campo."""
+        return Fieldset(self.include.get(name) if self.include is not None else None, self.exclude.get(name))
+
+    def validate(self, serializer, prefix=''):
+        """Lança ValidationError para os campos inexistentes no serializer ou sem campos aninhados."""
+        fields = {name: field for name, field in serializer.fields.items() if not field.write_only}
+        for param, tree in (('fields', self.include), ('exclude', self.exclude)):
+            unknown = [name for name in tree or () if name not in fields]
+            if unknown:
+                raise ValidationError({param: ['Campo inexistente: {}.'.format(prefix + name) for name in unknown]})
+
+        for name, field in fields.items():
+            nested = self.nested(name)
+            if name not in self or nested.is_all:
+                continue
+            child = _get_serializer(field)
+            if child is None:
+                param = 'fields' if nested.include is not None else 'exclude'
+                raise ValidationError({param: ['Campo sem campos aninhados: {}.'.format(prefix + name)]})
+            nested.validate(child, prefix + name + '.')
+
+    def prune(self, serializer):
+        """Remove do serializer (e dos serializers aninhados) os campos não selecionados."""
+        fields = serializer.fields
+        for name in list(fields):
+            if name not in self:
+                del fields[name]
+                continue
+
+            nested = self.nested(name)
+            child = _get_serializer(fields[name])
+            if child is not None and not nested.is_all:
+                nested.prune(child)
+
+    def select(self, data):
+        """Seleciona os campos de um objeto (ou lista de objetos) já serializado, ex.: lido de um cache."""
+        if self.is_all:
+            return data
+        if isinstance(data, list):
+            return [self.select(item) for item in data]
+        if not isinstance(data, dict):
+            return data
+        return {name: self.nested(name).select(value) for name, value in data.items() if name in self}
+
+
+class SparseFieldsetMixin:
+    """
+    Mixin para ViewSets que permite escolher os campos das respostas das leituras pelos parâmetros fields e exclude,
+    com os campos aninhados separados por ponto (ex.: ?fields=id,name,wishList.id ou ?exclude=wishList.url).
+
+    Os campos não selecionados são removidos do próprio serializer retornado por get_serializer, então o
+    QuerySetOptimizerMixin e o ValuesSerializer carregam apenas as colunas e relações necessárias (ex.: sem o
+    prefetch da lista de favoritos quando ela não é pedida) e a URL não é montada quando não é pedida. Campos
+    inexistentes retornam 400.
+    """
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
+
+    # Quando False, get_serializer retorna os serializers com todos os campos (ver full_serializers)
+    fieldset_enabled = True
+
+    def get_fieldset(self):
+        """Campos selecionados na requisição, validados com o serializer da action."""
+        fieldset = getattr(self, '_fieldset', None)
+        if fieldset is None:
+            fieldset = self._fieldset = self.build_fieldset()
+        return fieldset
+
+    def build_fieldset(self):
+        request = self.request
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return Fieldset()
+
+        trees = [parse_fields(','.join(request.query_params.getlist(param)), param)
+                 for param in (self.fields_query_param, self.exclude_query_param)]
+        fieldset = Fieldset(trees[0] or None, trees[1])
+        if fieldset.is_all:
+            return fieldset
+
+        # Serializers que não são de campos (ex.: ListSerializer customizado) não permitem escolher os campos
+        serializer_class = self.get_serializer_class()
+        if not issubclass(serializer_class, serializers.Serializer):
+            return Fieldset()
+        fieldset.validate(serializer_class(context=self.get_serializer_context()))
+        return fieldset
+
+    @contextmanager
+    def full_serializers(self):
+        """Dentro do bloco, os serializers renderizam todos os campos (ex.: objetos armazenados em cache)."""
+        self.fieldset_enabled = False
+        try:
+            yield
+        finally:
+            self.fieldset_enabled = True
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if self.fieldset_enabled:
+            fieldset = self.get_fieldset()
+            if not fieldset.is_all:
+                fieldset.prune(_get_serializer(serializer) or serializer)
+        return serializer
+
+
+class SparseFieldsetSchema(AutoSchema):
+    """
+    AutoSchema que documenta os parâmetros fields e exclude nas leituras dos ViewSets com SparseFieldsetMixin, com a
+    lista dos campos disponíveis.
+    """
+    def get_fieldset_serializer(self):
+        if self.method != 'GET' or not isinstance(self.view, SparseFieldsetMixin):
+            return None
+
+        # Apenas as actions que respondem com o serializer da view (ex.: não as estatísticas do cache)
+        serializer = self.get_response_serializers()
+        if not isinstance(serializer, serializers.Serializer) or \
+                not isinstance(serializer, self.view.get_serializer_class()):
+            return None
+        return serializer
+
+    def get_override_parameters(self):
+        parameters = super().get_override_parameters()
+        serializer = self.get_fieldset_serializer()
+        if serializer is None:
+            return parameters
+
+        paths = list(field_paths(serializer))
+        nested = [path for path in paths if '.' in path]
+        if nested:
+            description = 'Campos retornados, separados por vírgula, com os campos aninhados separados por ponto ' \
+                          '(ex.: {},{}).'.format(paths[0], nested[0])
+        else:
+            description = 'Campos retornados, separados por vírgula (ex.: {}).'.format(','.join(paths[:2]))
+
+        view = self.view
+        return [
+            OpenApiParameter(view.fields_query_param, OpenApiTypes.STR, description='{} Disponíveis: {}'.format(
+                description, ', '.join(paths))),
+            OpenApiParameter(view.exclude_query_param, OpenApiTypes.STR, description=(
+                'Campos omitidos da resposta, no mesmo formato do parâmetro {}'.format(view.fields_query_param))),
+        ] + list(parameters)
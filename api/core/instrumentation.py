@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from api.core.metrics import record_request
+
+
+logger = logging.getLogger('api.performance')
+
+
+class RequestTimings:
+    """Medições de uma requisição: quantidade e tempo das queries, tempo da view, da serialização e da renderização."""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view = None
+        self.view_class = None
+        self.action = None
+        self.queries = 0
+        self.db = 0.0
+        self.durations = {}
+        self.timing_queries = False
+        self.handler_started = None
+        self.handler_db = 0.0
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def time_query(self, execute, sql, params, many, context):
+        """Wrapper de connection.execute_wrapper: conta as queries e soma o tempo gasto no banco de dados."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db += time.perf_counter() - started
+
+    def server_timing(self, total):
+        metrics = ['db;dur={:.1f};desc="{} queries"'.format(self.db * 1000, self.queries)]
+        metrics += ['{};dur={:.1f}'.format(name, seconds * 1000) for name, seconds in self.durations.items()]
+        metrics.append('total;dur={:.1f}'.format(total * 1000))
+        return ', '.join(metrics)
+
+    def record(self, request, response, total):
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'view': self.view,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(self.db * 1000, 1),
+            'queries': self.queries,
+        }
+        record.update(('{}_ms'.format(name), round(seconds * 1000, 1)) for name, seconds in self.durations.items())
+        return record
+
+
+def get_timings(request):
+    """Retorna as medições da requisição, ou None quando a instrumentação está desabilitada."""
+    return getattr(request, 'timings', None)
+
+
+@contextmanager
+def query_timer(timings):
+    """
+    Mede as queries executadas na thread corrente, em todos os bancos de dados. Não faz nada quando timings é None ou
+    as queries já estão sendo medidas.
+    """
+    if timings is None or timings.timing_queries:
+        yield
+        return
+
+    timings.timing_queries = True
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timings.time_query))
+            yield
+    finally:
+        timings.timing_queries = False
+
+
+@contextmanager
+def timed(request, name):
+    """Soma a duração do bloco à medição name da requisição."""
+    timings = get_timings(request)
+    if timings is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+class InstrumentationMiddleware:
+    """
+    Mede cada requisição (RequestTimings). Com a configuração INSTRUMENTATION['ENABLED'], adiciona o header
+    Server-Timing com o tempo e a quantidade de queries (db), o tempo da view fora do banco de dados, ou seja, a
+    instanciação dos modelos e a serialização (serialize), o tempo de renderização (render) e o tempo total, e registra
+    as requisições acima de SLOW_REQUEST_MS milissegundos no logger api.performance, em uma linha JSON com o ViewSet e
+    a action. Com METRICS['ENABLED'], registra as métricas agregadas das actions dos ViewSets (api.core.metrics).
+
+    Com as duas configurações desabilitadas o middleware é removido da cadeia de middlewares (MiddlewareNotUsed) e
+    nenhuma query é medida.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = getattr(settings, 'INSTRUMENTATION', None) or {}
+        self.instrumentation = config.get('ENABLED', False)
+        self.metrics = (getattr(settings, 'METRICS', None) or {}).get('ENABLED', False)
+        if not self.instrumentation and not self.metrics:
+            raise MiddlewareNotUsed()
+
+        self.get_response = get_response
+        self.slow_request = config.get('SLOW_REQUEST_MS', 500) / 1000
+        self.server_timing = config.get('SERVER_TIMING', True)
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Marca o middleware como coroutine para o Django, como os middlewares assíncronos do próprio Django
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        timings = request.timings = RequestTimings()
+        with query_timer(timings):
+            response = self.get_response(request)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        # As queries são executadas em outra thread (sync_to_async), onde são medidas pelas views da API
+        timings = request.timings = RequestTimings()
+        response = await self.get_response(request)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        total = time.perf_counter() - timings.started
+        if self.metrics and timings.action is not None:
+            record_request(timings, request.method, response.status_code, total)
+        if not self.instrumentation:
+            return response
+
+        if timings.view is None and getattr(request, 'resolver_match', None) is not None:
+            timings.view = request.resolver_match.view_name
+        if self.server_timing:
+            response['Server-Timing'] = timings.server_timing(total)
+        if total >= self.slow_request:
+            logger.warning(json.dumps(timings.record(request, response, total), sort_keys=True))
+        return response
+
+
+class InstrumentedViewMixin:
+    """
+    Mixin para ViewSets que completa as medições do InstrumentationMiddleware: identifica o ViewSet e a action, mede as
+    queries na thread que executa a view e separa o tempo da action fora do banco de dados (serialize) do tempo de
+    renderização (render).
+    """
+    def dispatch(self, request, *args, **kwargs):
+        timings = get_timings(request)
+        if timings is None:
+            return super().dispatch(request, *args, **kwargs)
+        with query_timer(timings):
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        timings = get_timings(request)
+        if timings is not None:
+            # As APIViews não possuem action, usa o método HTTP
+            timings.view_class = type(self).__name__
+            timings.action = getattr(self, 'action', None) or request.method.lower()
+            timings.view = '{}.{}'.format(timings.view_class, timings.action)
+
+        super().initial(request, *args, **kwargs)
+        if timings is not None:
+            timings.handler_started = time.perf_counter()
+            timings.handler_db = timings.db
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        timings = get_timings(request)
+        if timings is None or timings.handler_started is None:
+            return response
+
+        finished = time.perf_counter()
+        timings.add('serialize', finished - timings.handler_started - (timings.db - timings.handler_db))
+        timings.handler_started = None
+        if not getattr(response, 'is_rendered', True):
+            # Renderizada pelo Django logo após o retorno da view
+            response.add_post_render_callback(lambda rendered: timings.add('render', time.perf_counter() - finished))
+        return response
@@ -0,0 +1,180 @@
+import math
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+from api.models import Wishlist
+
+
+class BloomFilter:
+    """
+    Filtro de Bloom de inteiros: um produto ausente do filtro certamente não está no conjunto, um produto presente
+    está no conjunto com a probabilidade de falso positivo informada na criação. As posições de cada item são
+    geradas por hashing duplo (h1 + i * h2) a partir das duas metades de um hash de 64 bits do item.
+    """
+    MASK = (1 << 64) - 1
+
+    def __init__(self, size, hashes, bits=None):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bytearray(bits) if bits is not None else bytearray((size + 7) // 8)
+
+    @classmethod
+    def create(cls, items, false_positive_rate):
+        """Filtro com os itens, dimensionado para a taxa de falsos positivos."""
+        items = list(items)
+        count = max(len(items), 1)
+        size = max(64, int(math.ceil(-count * math.log(false_positive_rate) / (math.log(2) ** 2))))
+        bloom = cls(size, max(1, int(round(size / count * math.log(2)))))
+        for item in items:
+            bloom.add(item)
+        return bloom
+
+    def _positions(self, item):
+        # Mistura do splitmix64: ids consecutivos geram posições independentes
+        z = (item + 0x9E3779B97F4A7C15) & self.MASK
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & self.MASK
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & self.MASK
+        z ^= z >> 31
+        h1, h2 = z & 0xFFFFFFFF, (z >> 32) | 1
+        return ((h1 + index * h2) % self.size for index in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class WishlistMembershipCache:
+    """
+    Cache do conjunto de produtos da lista de favoritos de cada cliente, no cache framework do Django, usado para
+    responder quais produtos de uma página estão na lista do cliente.
+
+    Listas com até EXACT_MAX_SIZE produtos são armazenadas inteiras e respondidas sem queries. As maiores são
+    armazenadas apenas como um filtro de Bloom (cerca de 10 bits por produto com 1% de falsos positivos): os produtos
+    ausentes do filtro não estão na lista e os demais são confirmados com uma única query IN pelo índice (cliente,
+    produto). Na primeira consulta de um cliente a lista é lida inteira do banco principal.
+
+    As inclusões e remoções (WishlistManager) invalidam o cache dos clientes alterados (api.signals). A remoção de um
+    produto (api.core.deletion.soft_delete) troca o marcador de remoções e invalida as listas de todos os clientes, sem
+    buscar quem possui o produto: cada lista guarda o marcador lido antes da sua leitura do banco de dados. A
+    configuração é lida de WISHLIST_MEMBERSHIP_CACHE, com as chaves ENABLED, ALIAS, TIMEOUT, EXACT_MAX_SIZE e
+    FALSE_POSITIVE_RATE.
+    """
+    defaults = {
+        'ENABLED': False,
+        'ALIAS': 'default',
+        'TIMEOUT': 300,
+        'EXACT_MAX_SIZE': 1000,
+        'FALSE_POSITIVE_RATE': 0.01,
+    }
+
+    def __init__(self, prefix, setting_name):
+        self.prefix = prefix
+        self.setting_name = setting_name
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def config(self):
+        return dict(self.defaults, **getattr(settings, self.setting_name, {}))
+
+    @property
+    def shared(self):
+        return caches[self.config['ALIAS']]
+
+    def key(self, customer_id):
+        return '{}:{}'.format(self.prefix, customer_id)
+
+    @property
+    def deleted_key(self):
+        return '{}:deleted-products'.format(self.prefix)
+
+    def get_deleted_marker(self):
+        """Marcador das remoções de produtos. Sem o marcador (ex.: removido do cache) um novo invalida as listas."""
+        marker = self.shared.get(self.deleted_key)
+        if marker is None:
+            self.shared.add(self.deleted_key, uuid.uuid4().hex, timeout=None)
+            marker = self.shared.get(self.deleted_key)
+        return marker
+
+    def products_deleted(self):
+        """Invalida as listas de todos os clientes, após a remoção de produtos."""
+        self.shared.set(self.deleted_key, uuid.uuid4().hex, timeout=None)
+
+    def _count(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                self._stats[name] += value
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {'exact_hits': 0, 'bloom_hits': 0, 'misses': 0, 'negatives': 0, 'queries': 0}
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def build(self, customer_id, marker=None):
+        """
+        Lê a lista do cliente do banco principal e a armazena no cache, com o marcador das remoções de produtos lido
+        antes da lista. Retorna os produtos da lista.
+        """
+        if marker is None:
+            marker = self.get_deleted_marker()
+
+        # Lida do banco principal: uma lista defasada lida de uma réplica ficaria no cache após a invalidação
+        products = list(Wishlist.objects.using(DEFAULT_DB_ALIAS).filter(
+            customer_id=customer_id, product__deleted_at__isnull=True).values_list('product_id', flat=True))
+        config = self.config
+        if len(products) <= config['EXACT_MAX_SIZE']:
+            entry = (frozenset(products), None, marker)
+        else:
+            bloom = BloomFilter.create(products, config['FALSE_POSITIVE_RATE'])
+            entry = (None, (bloom.size, bloom.hashes, bytes(bloom.bits)), marker)
+        self.shared.set(self.key(customer_id), entry, timeout=config['TIMEOUT'])
+        return products
+
+    def contains(self, queryset, customer_id, product_ids):
+        """
+        Retorna o conjunto dos produtos de product_ids que estão na lista do cliente. queryset é a lista de favoritos
+        do cliente, usada na query IN dos produtos não descartados pelo filtro de Bloom (ou de todos, com o cache
+        desabilitado).
+        """
+        product_ids = set(product_ids)
+        if not product_ids:
+            return set()
+        if not self.config['ENABLED']:
+            return set(queryset.filter(product_id__in=product_ids).values_list('product_id', flat=True))
+
+        key = self.key(customer_id)
+        values = self.shared.get_many([key, self.deleted_key])
+        marker = values.get(self.deleted_key) or self.get_deleted_marker()
+        entry = values.get(key)
+        if entry is None or entry[2] != marker:
+            products = self.build(customer_id, marker)
+            self._count(misses=1)
+            return product_ids.intersection(products)
+
+        members, bloom, _ = entry
+        if members is not None:
+            self._count(exact_hits=1)
+            return product_ids & members
+
+        bloom = BloomFilter(*bloom)
+        candidates = {pk for pk in product_ids if pk in bloom}
+        self._count(bloom_hits=1, negatives=len(product_ids) - len(candidates), queries=1 if candidates else 0)
+        if not candidates:
+            return set()
+        return set(queryset.filter(product_id__in=candidates).values_list('product_id', flat=True))
+
+    def invalidate_many(self, customer_ids):
+        self.shared.delete_many([self.key(customer_id) for customer_id in customer_ids])
+
+
+wishlist_membership_cache = WishlistMembershipCache('api:wishlist-membership', 'WISHLIST_MEMBERSHIP_CACHE')
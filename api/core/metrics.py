@@ -0,0 +1,286 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import uuid
+import weakref
+from collections import defaultdict
+
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer
+
+
+# Limites dos buckets dos histogramas
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+# Métricas registradas: nome -> (tipo, descrição, buckets)
+METRICS = {
+    'api_requests_total': ('counter', 'Requisições por ViewSet, action, método e status', None),
+    'api_request_errors_total': ('counter', 'Requisições com erro (status 5xx) por ViewSet e action', None),
+    'api_request_duration_seconds': ('histogram', 'Duração das requisições, em segundos', DURATION_BUCKETS),
+    'api_request_queries': ('histogram', 'Quantidade de queries por requisição', QUERY_BUCKETS),
+    'api_request_db_seconds_total': ('counter', 'Tempo total das queries, em segundos', None),
+}
+
+
+class MemoryShard:
+    """Valores de uma thread, em memória."""
+    def __init__(self):
+        self.values = {}
+
+    def add(self, key, amount):
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def items(self):
+        # list() de um dict é executado sem liberar o GIL, a thread dona do shard pode continuar escrevendo
+        return list(self.values.items())
+
+
+class FileShard:
+    """
+    Valores de uma thread em um arquivo mapeado em memória (mmap), lido pelos outros processos. O arquivo começa com a
+    quantidade de bytes usados (8 bytes), seguida pelas entradas: tamanho da chave (4 bytes), chave em UTF-8 alinhada
+    em 8 bytes e valor (double). Uma entrada nova é escrita antes de atualizar a quantidade de bytes usados, então os
+    leitores nunca encontram uma entrada incompleta.
+    """
+    initial_size = 64 * 1024
+    header = struct.Struct('Q')
+    key_size = struct.Struct('i')
+    value = struct.Struct('d')
+
+    def __init__(self, path):
+        self.path = path
+        self.positions = {}
+        self.file = open(path, 'w+b')
+        self.file.truncate(self.initial_size)
+        self.mmap = mmap.mmap(self.file.fileno(), self.initial_size)
+        self.used = self.header.size
+        self.header.pack_into(self.mmap, 0, self.used)
+
+    def _append(self, key):
+        encoded = key.encode()
+        padded = len(encoded) + (-(self.key_size.size + len(encoded)) % 8)
+        entry = struct.pack('i{}sd'.format(padded), len(encoded), encoded, 0.0)
+
+        if self.used + len(entry) > len(self.mmap):
+            size = len(self.mmap)
+            while self.used + len(entry) > size:
+                size *= 2
+            self.file.truncate(size)
+            self.mmap.close()
+            self.mmap = mmap.mmap(self.file.fileno(), size)
+
+        self.mmap[self.used:self.used + len(entry)] = entry
+        position = self.used + len(entry) - self.value.size
+        self.used += len(entry)
+        self.header.pack_into(self.mmap, 0, self.used)
+        self.positions[key] = position
+        return position
+
+    def add(self, key, amount):
+        position = self.positions.get(key)
+        if position is None:
+            position = self._append(key)
+        self.value.pack_into(self.mmap, position, self.value.unpack_from(self.mmap, position)[0] + amount)
+
+    @classmethod
+    def read(cls, path):
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return
+        if len(data) < cls.header.size:
+            return
+
+        used = min(cls.header.unpack_from(data, 0)[0], len(data))
+        position = cls.header.size
+        while position + cls.key_size.size <= used:
+            length = cls.key_size.unpack_from(data, position)[0]
+            padded = length + (-(cls.key_size.size + length) % 8)
+            key_position = position + cls.key_size.size
+            value_position = key_position + padded
+            if value_position + cls.value.size > used:
+                break
+            yield data[key_position:key_position + length].decode(), cls.value.unpack_from(data, value_position)[0]
+            position = value_position + cls.value.size
+
+
+class ShardOwner:
+    """Referência de uma thread ao seu shard, guardada no threading.local e descartada quando a thread termina."""
+    def __init__(self, shard):
+        self.shard = shard
+        self.pid = os.getpid()
+
+
+class MetricsRegistry:
+    """
+    Registro de métricas do processo. Cada thread escreve apenas no seu próprio shard, então os contadores e
+    histogramas são atualizados sem locks; a leitura soma os shards de todas as threads.
+
+    O shard de uma thread encerrada, com os seus valores, é devolvido ao processo e reutilizado pela próxima thread
+    criada: a quantidade de shards é a maior quantidade de threads simultâneas, e não cresce com as threads criadas e
+    encerradas pelo servidor.
+
+    Com directory, cada shard é um arquivo mapeado em memória nesse diretório, compartilhado pelos processos do
+    servidor (ex.: workers do gunicorn), e a leitura soma os arquivos de todos os processos. Os arquivos de processos
+    encerrados continuam somados, como os contadores do Prometheus; o diretório deve ser esvaziado ao iniciar o
+    servidor.
+    """
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._local = threading.local()
+        self._shards = []
+        self._free_shards = []
+        self._pid = os.getpid()
+        # Reentrante: a devolução do shard pode ser executada pelo coletor de lixo com o lock adquirido
+        self._shards_lock = threading.RLock()
+
+    def _release(self, shard, pid):
+        with self._shards_lock:
+            if pid == self._pid:
+                self._free_shards.append(shard)
+
+    def _shard(self):
+        owner = getattr(self._local, 'owner', None)
+        if owner is not None and owner.pid == os.getpid():
+            return owner.shard
+
+        with self._shards_lock:
+            # Após um fork o processo filho herda os shards das threads do processo pai
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._free_shards = []
+            shard = self._free_shards.pop() if self._free_shards else None
+
+        if shard is None:
+            if self.directory:
+                os.makedirs(self.directory, exist_ok=True)
+                shard = FileShard(os.path.join(self.directory, 'metrics_{}_{}_{}.db'.format(
+                    os.getpid(), threading.get_ident(), uuid.uuid4().hex[:8])))
+            else:
+                shard = MemoryShard()
+            with self._shards_lock:
+                self._shards.append(shard)
+
+        owner = ShardOwner(shard)
+        weakref.finalize(owner, self._release, shard, owner.pid)
+        self._local.owner = owner
+        return shard
+
+    @staticmethod
+    def key(name, suffix='', **labels):
+        return json.dumps([name, suffix, sorted(labels.items())])
+
+    def inc(self, name, amount=1, **labels):
+        self._shard().add(self.key(name, **labels), amount)
+
+    def observe(self, name, value, **labels):
+        """Registra o valor no histograma: o bucket do menor limite maior ou igual ao valor, a soma e a contagem."""
+        buckets = METRICS[name][2]
+        le = next((bound for bound in buckets if value <= bound), '+Inf')
+        shard = self._shard()
+        shard.add(self.key(name, '_bucket', le=str(le), **labels), 1)
+        shard.add(self.key(name, '_sum', **labels), value)
+        shard.add(self.key(name, '_count', **labels), 1)
+
+    def collect(self):
+        """Retorna a soma dos valores de todas as threads (e de todos os processos, com directory), por chave."""
+        if self.directory:
+            items = []
+            if os.path.isdir(self.directory):
+                for filename in sorted(os.listdir(self.directory)):
+                    if filename.startswith('metrics_') and filename.endswith('.db'):
+                        items += FileShard.read(os.path.join(self.directory, filename))
+        else:
+            with self._shards_lock:
+                shards = list(self._shards)
+            items = [item for shard in shards for item in shard.items()]
+
+        values = defaultdict(float)
+        for key, value in items:
+            values[key] += value
+        return values
+
+    def render(self):
+        """Métricas no formato texto do Prometheus (text/plain; version=0.0.4)."""
+        samples = defaultdict(list)
+        for key, value in self.collect().items():
+            name, suffix, labels = json.loads(key)
+            samples[name].append((suffix, labels, value))
+
+        lines = []
+        for name in sorted(samples):
+            kind, description, buckets = METRICS.get(name, ('untyped', '', None))
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            if kind == 'histogram':
+                lines += self.render_histogram(name, buckets, samples[name])
+            else:
+                lines += [format_sample(name, labels, value) for suffix, labels, value in sorted(samples[name])]
+        return '\n'.join(lines) + '\n'
+
+    def render_histogram(self, name, buckets, samples):
+        # Os buckets são armazenados por faixa e exibidos acumulados, como no Prometheus
+        series = defaultdict(dict)
+        for suffix, labels, value in samples:
+            le = dict(labels).pop('le', None) if suffix == '_bucket' else None
+            series[tuple(tuple(label) for label in labels if label[0] != 'le')][(suffix, le)] = value
+
+        lines = []
+        for labels in sorted(series):
+            values = series[labels]
+            cumulative = 0.0
+            for le in [str(bound) for bound in buckets] + ['+Inf']:
+                cumulative += values.get(('_bucket', le), 0.0)
+                lines.append(format_sample(name + '_bucket', list(labels) + [('le', le)], cumulative))
+            lines.append(format_sample(name + '_sum', labels, values.get(('_sum', None), 0.0)))
+            lines.append(format_sample(name + '_count', labels, values.get(('_count', None), 0.0)))
+        return lines
+
+
+def format_sample(name, labels, value):
+    if labels:
+        name += '{' + ','.join('{}="{}"'.format(label, str(label_value).replace('\\', r'\\').replace(
+            '"', r'\"').replace('\n', r'\n')) for label, label_value in labels) + '}'
+    return '{} {}'.format(name, repr(float(value)))
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry():
+    """Registro de métricas do processo, no diretório METRICS['DIRECTORY'] quando configurado."""
+    directory = (getattr(settings, 'METRICS', None) or {}).get('DIRECTORY')
+    registry = _registries.get(directory)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.setdefault(directory, MetricsRegistry(directory))
+    return registry
+
+
+def record_request(timings, method, status_code, duration):
+    """Registra as métricas de uma requisição medida pelo InstrumentationMiddleware em um ViewSet da API."""
+    registry = get_registry()
+    labels = {'view': timings.view_class, 'action': timings.action}
+    registry.inc('api_requests_total', method=method, status=str(status_code), **labels)
+    if status_code >= 500:
+        registry.inc('api_request_errors_total', **labels)
+    registry.observe('api_request_duration_seconds', duration, **labels)
+    registry.observe('api_request_queries', timings.queries, **labels)
+    registry.inc('api_request_db_seconds_total', timings.db, **labels)
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        # Respostas de erro (ex.: 403)
+        return json.dumps(data).encode(self.charset)
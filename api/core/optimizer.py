@@ -0,0 +1,143 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import permissions, serializers
+
+
+class QuerySetPlan:
+    """
+    Plano de otimização de uma queryset, montado a partir dos campos de um serializer: relações que devem ser
+    carregadas com select_related, relações que devem ser carregadas com prefetch_related e colunas que devem ser
+    carregadas com only().
+    """
+    def __init__(self):
+        self.select_related = []
+        self.prefetch_related = []
+        self.only = set()
+
+        # Quando algum campo do serializer não corresponde a uma coluna (ex.: property do modelo), não é seguro
+        # restringir as colunas carregadas.
+        self.restrict_columns = True
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if self.restrict_columns:
+            queryset = queryset.only(*sorted(self.only))
+        return queryset
+
+
+def _get_serializer(field):
+    """Retorna o serializer aninhado de um campo, ou None caso o campo não seja um serializer."""
+    if isinstance(field, serializers.ListSerializer):
+        return field.child
+    if isinstance(field, serializers.BaseSerializer):
+        return field
+    return None
+
+
+def _collect(serializer, model, plan, prefix=''):
+    """
+    Percorre os campos do serializer e preenche o plano com as relações e colunas necessárias para renderizá-lo.
+    """
+    plan.only.add(prefix + model._meta.pk.name)
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+
+        # HyperlinkedIdentityField e campos com source='*' usam apenas a chave primária
+        if field.source == '*':
+            continue
+
+        source = field.source_attrs[0] if field.source_attrs else field.source
+        try:
+            model_field = model._meta.get_field(source)
+        except FieldDoesNotExist:
+            plan.restrict_columns = False
+            continue
+
+        # Campos com source composto (ex.: 'customer.name') não são analisados, carrega todas as colunas
+        if len(field.source_attrs) > 1:
+            plan.restrict_columns = False
+
+        nested = _get_serializer(field)
+        many = model_field.many_to_many or model_field.one_to_many
+
+        if many:
+            # Relações "para muitos" são carregadas em uma única query extra via prefetch_related
+            related_model = model_field.related_model
+            related_plan = get_plan(nested) if nested is not None else QuerySetPlan()
+            related_plan.only.add(related_model._meta.pk.name)
+
+            # Em relações reversas de ForeignKey, a coluna da FK é usada para associar os objetos carregados
+            if model_field.one_to_many:
+                related_plan.only.add(model_field.field.name)
+
+            queryset = related_plan.apply(related_model._default_manager.all())
+            plan.prefetch_related.append(Prefetch(prefix + source, queryset=queryset))
+        elif model_field.is_relation and nested is not None:
+            # Relações "para um" são carregadas no mesmo SELECT via JOIN
+            plan.select_related.append(prefix + source)
+            plan.only.add(prefix + source)
+            _collect(nested, model_field.related_model, plan, prefix=prefix + source + '__')
+        else:
+            plan.only.add(prefix + model_field.name)
+
+
+def get_plan(serializer):
+    """Monta o plano de otimização para a instância de serializer informada."""
+    serializer = _get_serializer(serializer) or serializer
+    plan = QuerySetPlan()
+    _collect(serializer, serializer.Meta.model, plan)
+    return plan
+
+
+def optimize_queryset(queryset, serializer):
+    """
+    Aplica select_related, prefetch_related e only() na queryset de acordo com os campos (inclusive os aninhados)
+    que o serializer irá renderizar, evitando o problema de N+1 queries.
+    """
+    return get_plan(serializer).apply(queryset)
+
+
+def load_ordering_columns(queryset):
+    """
+    Inclui as colunas da ordenação no only() da queryset: a paginação por cursor lê essas colunas dos objetos da
+    página, o que executaria uma query por objeto para as colunas não carregadas.
+    """
+    loaded, deferred = queryset.query.deferred_loading
+    if deferred or not loaded:
+        return queryset
+
+    ordering = {field.lstrip('-') for field in queryset.query.order_by
+                if isinstance(field, str) and field != '?' and '__' not in field}
+    if ordering <= loaded:
+        return queryset
+    return queryset.only(*(loaded | ordering))
+
+
+class QuerySetOptimizerMixin:
+    """
+    Mixin para ViewSets que otimiza a queryset de acordo com o serializer usado na action corrente.
+
+    Apenas as leituras são otimizadas: nas escritas o objeto é salvo ou removido e os signals podem precisar de todas
+    as colunas.
+    """
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request is not None and self.request.method not in permissions.SAFE_METHODS:
+            return queryset
+
+        serializer_class = self.get_serializer_class()
+
+        # Serializers que não são de modelo (ex.: operações em lote) não definem as colunas carregadas
+        if not issubclass(serializer_class, serializers.ModelSerializer):
+            return queryset
+
+        # get_serializer retorna o serializer apenas com os campos pedidos (SparseFieldsetMixin)
+        return optimize_queryset(queryset, self.get_serializer())
+
+    def filter_queryset(self, queryset):
+        return load_ordering_columns(super().filter_queryset(queryset))
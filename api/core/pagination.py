@@ -1,4 +1,8 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core import signing
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, CursorPagination, Cursor, _reverse_ordering
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPageNumberPagination(PageNumberPagination):
@@ -9,3 +13,194 @@ class CustomPageNumberPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 1000
+
+
+class SignedCursorPagination(CursorPagination):
+    """
+    Paginação por cursor (keyset), ordenada por padrão pela chave primária. Cada página é obtida com um filtro
+    indexado (ex.: id < último id da página anterior), sem COUNT(*) e sem OFFSET, então o custo por página é constante
+    independente do tamanho da tabela ou da profundidade da página.
+
+    O cursor é opaco e assinado com a SECRET_KEY, impedindo que o cliente o altere.
+
+    A ordenação pode ser alterada pelo parâmetro ordering (via StableOrderingFilter na view) para um campo indexado
+    com o desempate pela chave primária, ex.: (price, id). A posição do cursor contém os dois valores do último item,
+    então os itens com o mesmo valor do campo são percorridos sem OFFSET. Os nulos ficam depois de todos os valores,
+    como na ordenação do PostgreSQL (NULLS LAST na ordem crescente e NULLS FIRST na decrescente).
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = '-id'
+    cursor_salt = 'api.core.pagination.cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            offset, reverse, current_position = 0, False, None
+        else:
+            offset, reverse, current_position = self.cursor
+            if not isinstance(current_position, (list, type(None))) or \
+                    (current_position is not None and len(current_position) != len(self.ordering)):
+                raise NotFound(self.invalid_cursor_message)
+
+        # A ordenação sempre é aplicada, invertida no cursor da página anterior
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+
+        # Um item a mais indica se existe uma página seguinte
+        limit = offset + self.page_size + 1
+        results = []
+        for condition in self.get_position_filters(queryset, ordering, current_position):
+            results += list(queryset.filter(condition)[:limit - len(results)])
+            if len(results) >= limit:
+                break
+        results = results[offset:]
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = current_position is not None or offset > 0
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = current_position is not None or offset > 0
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_position_filters(self, queryset, ordering, position):
+        """
+        Filtros dos itens depois da posição na ordenação (campo e desempate pela chave primária), na ordem em que são
+        percorridos. Cada filtro corresponde a um intervalo do índice (campo, id): os itens com valor e os nulos são
+        lidos em queries separadas, executadas apenas enquanto a página não estiver completa.
+        """
+        if position is None:
+            return [Q()]
+
+        names = [name.lstrip('-') for name in ordering]
+        descending = [name.startswith('-') for name in ordering]
+        field, value = names[0], position[0]
+        nullable = field != 'pk' and queryset.model._meta.get_field(field).null
+        after = Q(**{'{}__{}'.format(field, 'lt' if descending[0] else 'gt'): value})
+        if len(names) == 1:
+            return [after]
+
+        tie = Q(**{'{}__{}'.format(names[1], 'lt' if descending[1] else 'gt'): position[1]})
+        if value is None:
+            nulls = Q(**{field + '__isnull': True}) & tie
+            return [nulls, Q(**{field + '__isnull': False})] if descending[0] else [nulls]
+
+        # O intervalo a partir do valor (>= ou <=) é a condição do índice, o desempate é filtrado dentro dele
+        start = Q(**{'{}__{}'.format(field, 'lte' if descending[0] else 'gte'): value})
+        filters = [start & (after | (Q(**{field: value}) & tie))]
+        if nullable and not descending[0]:
+            filters.append(Q(**{field + '__isnull': True}))
+        return filters
+
+    def _get_position_from_instance(self, instance, ordering):
+        # Os valores são gravados como texto no cursor, os nulos são mantidos
+        values = [instance[name.lstrip('-')] if isinstance(instance, dict) else getattr(instance, name.lstrip('-'))
+                  for name in ordering]
+        return [None if value is None else str(value) for value in values]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            tokens = signing.loads(encoded, salt=self.cursor_salt)
+            offset = min(int(tokens.get('o', 0)), self.offset_cutoff)
+            reverse = bool(tokens.get('r', False))
+            position = tokens.get('p')
+        except (signing.BadSignature, TypeError, ValueError, AttributeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if offset < 0:
+            raise NotFound(self.invalid_cursor_message)
+
+        return Cursor(offset=offset, reverse=reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        tokens = {}
+        if cursor.offset != 0:
+            tokens['o'] = cursor.offset
+        if cursor.reverse:
+            tokens['r'] = 1
+        if cursor.position is not None:
+            tokens['p'] = cursor.position
+
+        encoded = signing.dumps(tokens, salt=self.cursor_salt)
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+
+        # O cursor é uma string opaca
+        parameters[0]['schema'] = {'type': 'string'}
+        return parameters
+
+
+class KeysetPagination(SignedCursorPagination):
+    """
+    Paginação por cursor, mantendo a paginação por número de página como alternativa quando o parâmetro page for
+    informado (ex.: ?page=3). A paginação por número de página executa COUNT(*) e OFFSET, prefira o cursor.
+    """
+    fallback_class = CustomPageNumberPagination
+
+    def __init__(self):
+        self.fallback = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        fallback = self.fallback_class()
+        if fallback.page_query_param in request.query_params:
+            self.fallback = fallback
+            page = fallback.paginate_queryset(queryset, request, view)
+            self.display_page_controls = fallback.display_page_controls
+            return page
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_html_context(self):
+        if self.fallback is not None:
+            return self.fallback.get_html_context()
+        return super().get_html_context()
+
+    def to_html(self):
+        if self.fallback is not None:
+            return self.fallback.to_html()
+        return super().to_html()
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        names = {parameter['name'] for parameter in parameters}
+        parameters += [parameter for parameter in self.fallback_class().get_schema_operation_parameters(view)
+                       if parameter['name'] not in names]
+        return parameters
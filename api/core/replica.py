@@ -0,0 +1,66 @@
+from django.db import InterfaceError, OperationalError
+from rest_framework.permissions import SAFE_METHODS
+
+from api.db import router
+
+
+class ReplicaReadMixin:
+    """
+    Mixin para ViewSets que executa as queries de list e retrieve em uma réplica de leitura (DATABASE_REPLICAS), após
+    a autenticação e as permissões, que usam o banco de dados principal.
+
+    Leitura das próprias escritas: após uma escrita bem sucedida, as leituras do usuário, do cliente da URL
+    (replica_customer_kwarg) e dos clientes alterados pela escrita (pin_customers, ex.: informados no corpo da
+    requisição) são feitas no banco principal por PIN_SECONDS segundos, enquanto as réplicas podem não ter recebido a
+    alteração. As marcações ficam no cache CACHE_ALIAS, que deve ser compartilhado pelos processos do servidor
+    (verificado por api.checks). Uma réplica que falhar durante a requisição é descartada e a operação é executada
+    novamente no banco principal.
+    """
+    replica_actions = ('list', 'retrieve')
+    replica_customer_kwarg = None
+
+    def pin_customers(self, customer_ids):
+        """Marca os clientes alterados pela requisição, lidos no banco principal após a escrita."""
+        self.pinned_customers = getattr(self, 'pinned_customers', set()) | set(customer_ids)
+
+    def get_primary_pins(self):
+        pins = []
+        if self.request.user.is_authenticated:
+            pins.append('user:{}'.format(self.request.user.pk))
+        customer_pk = self.kwargs.get(self.replica_customer_kwarg) if self.replica_customer_kwarg else None
+        if customer_pk is not None:
+            pins.append('customer:{}'.format(customer_pk))
+        pins += ['customer:{}'.format(pk) for pk in sorted(getattr(self, 'pinned_customers', ()))
+                 if str(pk) != str(customer_pk)]
+        return pins
+
+    def initial(self, request, *args, **kwargs):
+        router.use_primary()
+        super().initial(request, *args, **kwargs)
+        if (request.method in ('GET', 'HEAD') and self.action in self.replica_actions and router.replicas_enabled()
+                and not router.is_pinned(self.get_primary_pins())):
+            router.use_replica()
+
+    def handle_exception(self, exc):
+        replica = router.current_replica()
+        if replica is not None and isinstance(exc, (OperationalError, InterfaceError)):
+            router.mark_replica_down(replica)
+            router.use_primary()
+            try:
+                # O handler da rota, com as mixins que o envolvem (ex.: ConditionalGetMixin)
+                return getattr(self, self.request.method.lower())(self.request, *self.args, **self.kwargs)
+            except Exception as retry_exc:
+                exc = retry_exc
+        return super().handle_exception(exc)
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            router.use_primary()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        router.use_primary()
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            router.pin_primary(self.get_primary_pins())
+        return super().finalize_response(request, response, *args, **kwargs)
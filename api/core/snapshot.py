@@ -0,0 +1,120 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import BooleanField, Exists, F, Func, OuterRef, Subquery
+from django.http import Http404
+from django.utils import timezone
+from rest_framework.response import Response
+
+from api.core.values import URL_LOOKUP_SENTINEL
+from api.models import Customer, CustomerWishlistSnapshot, Product, Wishlist
+from api.serializers import ProductSerializer, ProductSnapshotSerializer
+
+
+class AnyArray(Func):
+    """valor = ANY(ARRAY(subquery)): a subquery é executada uma única vez, antes da busca dos valores."""
+    arg_joiner = ' = ANY(ARRAY'
+    template = '%(expressions)s)'
+    output_field = BooleanField()
+
+
+def serialize_wishlists(customer_ids):
+    """
+    Serializa a lista de favoritos dos clientes, retornando um dict {cliente: (versão da lista, lista)}.
+
+    A versão é lida antes dos produtos: uma alteração concorrente incrementa a versão do cliente, e a lista
+    serializada com a versão anterior é descartada na próxima consulta.
+    """
+    versions = dict(Customer.objects.filter(pk__in=customer_ids).values_list('pk', 'wishlist_version'))
+    products = defaultdict(list)
+    if versions:
+        # Mesma ordem de Customer.wish_list (ordenação padrão de Product)
+        ordering = [('-' if field.startswith('-') else '') + 'product__' + field.lstrip('-')
+                    for field in Product._meta.ordering]
+        items = Wishlist.objects.filter(customer_id__in=versions, product__deleted_at__isnull=True).select_related(
+            'product').order_by(*ordering)
+        for item in items:
+            products[item.customer_id].append(item.product)
+
+    return {pk: (version, ProductSnapshotSerializer(products[pk], many=True).data) for pk, version in versions.items()}
+
+
+def rebuild_wishlist_snapshots(customer_ids):
+    """
+    Serializa e armazena a lista de favoritos dos clientes, retornando o mesmo dict de serialize_wishlists. A data da
+    lista armazenada é o início da serialização: um produto removido depois dela invalida a lista.
+    """
+    started_at = timezone.now()
+    snapshots = serialize_wishlists(customer_ids)
+    CustomerWishlistSnapshot.objects.store(((pk, version, data) for pk, (version, data) in snapshots.items()),
+                                           updated_at=started_at)
+    return snapshots
+
+
+class WishlistSnapshotMixin:
+    """
+    Mixin para o ViewSet de clientes que, quando a configuração WISHLIST_SNAPSHOT está habilitada, atende retrieve com
+    a lista de favoritos serializada (CustomerWishlistSnapshot), lida com o cliente em uma única query pela chave
+    primária. A lista ausente ou desatualizada é serializada e armazenada na própria consulta.
+
+    A URL dos produtos depende do host da requisição, por isso não é armazenada e é montada a cada resposta.
+    """
+    snapshot_serializer_class = None
+    snapshot_field = 'wishList'
+
+    def get_snapshot_customer(self):
+        try:
+            pk = int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            raise Http404
+
+        # A versão da lista é lida com o cliente, descartando o .only() e o prefetch da lista do otimizador. Os
+        # produtos removidos depois da serialização da lista, ainda não removidos da lista pelo DeletionJob, a
+        # invalidam: poucos produtos aguardam a remoção definitiva, lidos pelo índice parcial de deleted_at antes de
+        # buscá-los na lista do cliente
+        deleted = Product.all_objects.filter(
+            deleted_at__gt=OuterRef(OuterRef('wishlist_snapshot__updated_at'))).values('pk')
+        items = Wishlist.objects.filter(AnyArray(F('product_id'), Subquery(deleted)), customer_id=OuterRef('pk'))
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None).defer(None).select_related(
+            'wishlist_snapshot').annotate(snapshot_products_deleted=Exists(items))
+        customer = queryset.filter(pk=pk).first()
+        if customer is None:
+            raise Http404
+        return customer
+
+    def get_snapshot_products(self, customer):
+        try:
+            snapshot = customer.wishlist_snapshot
+        except ObjectDoesNotExist:
+            snapshot = None
+
+        if snapshot is not None and snapshot.wishlist_version == customer.wishlist_version and \
+                not customer.snapshot_products_deleted:
+            return snapshot.data
+        return rebuild_wishlist_snapshots([customer.pk])[customer.pk][1]
+
+    def get_product_url_template(self):
+        field = ProductSerializer(context=self.get_serializer_context()).fields['url']
+        url = field.reverse(field.view_name, kwargs={field.lookup_url_kwarg: URL_LOOKUP_SENTINEL},
+                            request=self.request, format=self.format_kwarg)
+        return url.split(URL_LOOKUP_SENTINEL, 1)
+
+    def retrieve(self, request, *args, **kwargs):
+        # Sem a lista de favoritos nos campos pedidos (SparseFieldsetMixin) o cliente é lido sem o snapshot
+        fieldset = self.get_fieldset()
+        if not getattr(settings, 'WISHLIST_SNAPSHOT', False) or self.snapshot_field not in fieldset:
+            return super().retrieve(request, *args, **kwargs)
+
+        customer = self.get_snapshot_customer()
+        data = self.snapshot_serializer_class(customer, context=self.get_serializer_context()).data
+
+        # O JSONB não preserva a ordem das chaves, os campos são devolvidos na ordem do serializer
+        products = fieldset.nested(self.snapshot_field)
+        fields = [name for name in ProductSerializer.Meta.fields if name in products]
+        before, after = self.get_product_url_template() if 'url' in fields else (None, None)
+        data[self.snapshot_field] = [
+            {name: before + str(product['id']) + after if name == 'url' else product[name] for name in fields}
+            for product in self.get_snapshot_products(customer)
+        ]
+        return Response(fieldset.select(data))
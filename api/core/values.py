@@ -0,0 +1,271 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.http import Http404
+from django.urls import NoReverseMatch
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from api.core.optimizer import _get_serializer
+
+
+class UnsupportedSerializer(Exception):
+    """O serializer possui algum campo que não pode ser montado a partir de .values()."""
+
+
+# Campos cuja representação é apenas a conversão do valor da coluna para um tipo do Python
+FAST_CONVERTERS = (
+    (serializers.IntegerField, int),
+    (serializers.CharField, str),
+    (serializers.FloatField, float),
+)
+
+# Valor usado no lugar da chave ao montar o template de URL, deve ser aceito pela expressão regular da rota
+URL_LOOKUP_SENTINEL = '__values_lookup__'
+
+
+def _get_converter(field):
+    if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+        # .values() já retorna a chave estrangeira
+        return lambda value: value
+
+    for field_class, converter in FAST_CONVERTERS:
+        if type(field).to_representation is field_class.to_representation:
+            return converter
+    return field.to_representation
+
+
+def _url_getter(field, model, plan, prefix):
+    """
+    Monta a URL do HyperlinkedIdentityField a partir de um template calculado uma única vez (um reverse() por
+    requisição em vez de um por objeto).
+    """
+    request = field.context.get('request')
+    if request is None:
+        raise UnsupportedSerializer(field.field_name)
+
+    lookup_field = model._meta.pk.name if field.lookup_field == 'pk' else field.lookup_field
+    column = plan.add_column(prefix + lookup_field)
+
+    # Mesma regra do HyperlinkedRelatedField para o sufixo de formato
+    format = field.context.get('format')
+    if format and field.format and field.format != format:
+        format = field.format
+
+    try:
+        url = field.reverse(field.view_name, kwargs={field.lookup_url_kwarg: URL_LOOKUP_SENTINEL}, request=request,
+                            format=format)
+    except NoReverseMatch:
+        raise UnsupportedSerializer(field.field_name)
+    before, after = url.split(URL_LOOKUP_SENTINEL, 1)
+
+    def getter(row, related):
+        value = row[column]
+        return None if value in (None, '') else before + str(value) + after
+    return getter
+
+
+def _value_getter(field, column):
+    convert = _get_converter(field)
+
+    def getter(row, related):
+        value = row[column]
+        return None if value is None else convert(value)
+    return getter
+
+
+def _nested_getter(fields, column):
+    def getter(row, related):
+        return None if row[column] is None else _build(fields, row, related)
+    return getter
+
+
+def _many_getter(index, column):
+    def getter(row, related):
+        return related[index].get(row[column], [])
+    return getter
+
+
+class ValuesPlan:
+    """
+    Plano de serialização a partir de .values(): colunas lidas na query principal e relações "para muitos", cada uma
+    carregada com uma query extra (como o prefetch_related).
+    """
+    def __init__(self):
+        self.columns = []
+        self.related = []
+
+    def add_column(self, column):
+        if column not in self.columns:
+            self.columns.append(column)
+        return column
+
+
+def _compile(serializer, model, plan, prefix=''):
+    """
+    Percorre os campos do serializer e retorna a lista de (nome do campo, função que monta o valor a partir da linha),
+    preenchendo o plano com as colunas e relações necessárias.
+    """
+    pk_column = plan.add_column(prefix + model._meta.pk.name)
+    fields = []
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+
+        if isinstance(field, serializers.HyperlinkedIdentityField):
+            fields.append((field.field_name, _url_getter(field, model, plan, prefix)))
+            continue
+
+        # Campos com source='*' ou composto (ex.: 'customer.name') não são suportados
+        if field.source == '*' or len(field.source_attrs) > 1:
+            raise UnsupportedSerializer(field.field_name)
+
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            raise UnsupportedSerializer(field.field_name)
+
+        nested = _get_serializer(field)
+        if model_field.many_to_many or model_field.one_to_many:
+            if nested is None:
+                raise UnsupportedSerializer(field.field_name)
+
+            # Relações reversas filtram pelo nome do campo da outra ponta, relações diretas pelo nome reverso
+            lookup = model_field.field.name if model_field.auto_created else model_field.related_query_name()
+            child_plan = ValuesPlan()
+            child_fields = _compile(nested, model_field.related_model, child_plan)
+            child_plan.add_column(lookup)
+
+            fields.append((field.field_name, _many_getter(len(plan.related), pk_column)))
+            plan.related.append((pk_column, lookup, model_field.related_model, child_plan, child_fields))
+        elif model_field.is_relation and nested is not None:
+            column = plan.add_column(prefix + field.source)
+            child_fields = _compile(nested, model_field.related_model, plan, prefix + field.source + '__')
+            fields.append((field.field_name, _nested_getter(child_fields, column)))
+        elif model_field.is_relation and not isinstance(field, serializers.PrimaryKeyRelatedField):
+            raise UnsupportedSerializer(field.field_name)
+        else:
+            fields.append((field.field_name, _value_getter(field, plan.add_column(prefix + field.source))))
+
+    return fields
+
+
+def _build(fields, row, related):
+    return {name: getter(row, related) for name, getter in fields}
+
+
+def _serialize(plan, fields, rows):
+    related = []
+    for column, lookup, model, child_plan, child_fields in plan.related:
+        owners = {row[column] for row in rows if row[column] is not None}
+        groups = defaultdict(list)
+        if owners:
+            child_rows = list(model._default_manager.filter(**{lookup + '__in': owners}).values(*child_plan.columns))
+            for child_row, data in zip(child_rows, _serialize(child_plan, child_fields, child_rows)):
+                groups[child_row[lookup]].append(data)
+        related.append(groups)
+    return [_build(fields, row, related) for row in rows]
+
+
+class ValuesSerializer:
+    """
+    Monta o mesmo JSON de um ModelSerializer (inclusive os serializers aninhados) diretamente das linhas retornadas
+    por .values(), sem instanciar os modelos nem percorrer os campos do serializer para cada objeto.
+
+    Suporta campos de coluna, chaves estrangeiras, HyperlinkedIdentityField e serializers aninhados. Para outros campos
+    (ex.: SerializerMethodField ou property do modelo) lança UnsupportedSerializer.
+    """
+    def __init__(self, serializer):
+        serializer = _get_serializer(serializer) or serializer
+        self.model = serializer.Meta.model
+        self.plan = ValuesPlan()
+        self.fields = _compile(serializer, self.model, self.plan)
+
+    def values(self, queryset, *extra_columns):
+        columns = list(self.plan.columns)
+        columns += [column for column in extra_columns if column not in columns]
+
+        # As relações "para muitos" são carregadas pelo próprio ValuesSerializer
+        return queryset.prefetch_related(None).values(*columns)
+
+    def to_representation(self, rows):
+        return _serialize(self.plan, self.fields, list(rows))
+
+
+class ValuesListMixin:
+    """
+    Mixin para ViewSets que, quando a configuração FAST_SERIALIZATION está habilitada, atende list com o
+    ValuesSerializer. Caso o serializer da action não seja suportado, usa o serializer normalmente.
+
+    Define apenas a action list, para ViewSets sem retrieve: o router expõe as rotas de todas as actions definidas.
+    """
+    values_serializer_actions = ('list', )
+
+    def get_values_serializer(self):
+        if not getattr(settings, 'FAST_SERIALIZATION', False) or self.action not in self.values_serializer_actions:
+            return None
+
+        serializer = self.get_serializer()
+        if not isinstance(_get_serializer(serializer) or serializer, serializers.ModelSerializer):
+            return None
+
+        try:
+            return ValuesSerializer(serializer)
+        except UnsupportedSerializer:
+            return None
+
+    def get_values_queryset(self, values_serializer, queryset):
+        # As colunas da ordenação são usadas pela paginação por cursor
+        ordering = [field.lstrip('-') for field in queryset.query.order_by if isinstance(field, str)]
+        return values_serializer.values(queryset, *ordering)
+
+    def serialize_queryset(self, queryset):
+        """Serializa os objetos da queryset, retornando uma lista de tuplas (pk, objeto serializado)."""
+        values_serializer = self.get_values_serializer()
+        if values_serializer is None:
+            instances = list(queryset)
+            return list(zip([instance.pk for instance in instances],
+                            self.get_serializer(instances, many=True).data))
+
+        rows = list(values_serializer.values(queryset))
+        pk_name = values_serializer.model._meta.pk.name
+        return list(zip([row[pk_name] for row in rows], values_serializer.to_representation(rows)))
+
+    def list(self, request, *args, **kwargs):
+        values_serializer = self.get_values_serializer()
+        if values_serializer is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.get_values_queryset(values_serializer, self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        data = values_serializer.to_representation(page if page is not None else queryset)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+
+class ValuesSerializerMixin(ValuesListMixin):
+    """
+    Como ValuesListMixin, atendendo também retrieve com o ValuesSerializer.
+
+    Como o objeto não é carregado, este mixin não deve ser usado em views com permissões por objeto.
+    """
+    values_serializer_actions = ('list', 'retrieve')
+
+    def retrieve(self, request, *args, **kwargs):
+        values_serializer = self.get_values_serializer()
+        if values_serializer is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+            rows = list(values_serializer.values(queryset)[:2])
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        if len(rows) != 1:
+            raise Http404
+        return Response(values_serializer.to_representation(rows)[0])
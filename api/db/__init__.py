@@ -0,0 +1,4 @@
+"""
+Backend PostgreSQL da API (ENGINE = 'api.db'), com health check das conexões persistentes e pool de conexões no
+processo. Ver api.db.base.DatabaseWrapper.
+"""
@@ -0,0 +1,67 @@
+from django.db.backends.postgresql import base, creation
+
+from api.db.pool import close_pools, get_pool
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # O banco de dados de testes não pode ser removido com as conexões ociosas do pool abertas
+        close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Backend do PostgreSQL com:
+
+    - CONN_HEALTH_CHECKS: uma conexão persistente (CONN_MAX_AGE) é verificada (SELECT 1) na primeira query de cada
+      requisição, e uma conexão encerrada pelo servidor (reinício, failover, timeout do PgBouncer) é reaberta em vez
+      de causar erro na requisição;
+    - POOL: com MAX_SIZE maior que zero, as conexões são obtidas de um pool compartilhado pelas threads do processo,
+      com no máximo MAX_SIZE conexões abertas. Com todas em uso, a requisição aguarda até TIMEOUT segundos pela
+      liberação de uma conexão. As conexões fechadas pelo Django (ao final da requisição, conforme CONN_MAX_AGE) são
+      devolvidas ao pool, exceto as que tiveram erros ou ficaram em uma transação.
+    """
+    creation_class = DatabaseCreation
+
+    health_check_done = False
+    pool = None
+
+    def get_new_connection(self, conn_params):
+        options = self.settings_dict.get('POOL') or {}
+        if not options.get('MAX_SIZE'):
+            self.pool = None
+            return super().get_new_connection(conn_params)
+
+        self.pool = get_pool(self.alias, conn_params, options['MAX_SIZE'], options.get('TIMEOUT', 10),
+                             self.settings_dict.get('CONN_HEALTH_CHECKS', False))
+        connection, created = self.pool.acquire(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        if not created:
+            self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        return connection
+
+    def connect(self):
+        # Antes de conectar: connect() chama ensure_connection() com a conexão recém-aberta
+        self.health_check_done = True
+        super().connect()
+
+    def ensure_connection(self):
+        if (self.connection is not None and not self.health_check_done and not self.in_atomic_block
+                and self.settings_dict.get('CONN_HEALTH_CHECKS', False)):
+            self.health_check_done = True
+            if not self.is_usable():
+                self.errors_occurred = True
+                self.close()
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # Executado no início e no fim de cada requisição
+        self.health_check_done = False
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            # Dentro de um atomic() o Django mantém a referência à conexão, que não pode voltar ao pool
+            self.pool.release(self.connection, discard=self.errors_occurred or self.in_atomic_block)
@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import deque
+
+import psycopg2 as Database
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+
+class PoolTimeout(Database.OperationalError):
+    """Nenhuma conexão do pool foi liberada dentro do tempo de espera."""
+
+
+class ConnectionPool:
+    """
+    Pool de conexões compartilhado pelas threads do processo, com no máximo max_size conexões abertas (em uso ou
+    ociosas). Quando todas estão em uso, acquire() aguarda até timeout segundos pela liberação de uma conexão e lança
+    PoolTimeout.
+
+    Conexões fechadas, em uma transação ou que falharem no health check (SELECT 1, quando health_checks estiver
+    habilitado) são descartadas.
+    """
+    counters = ('acquired', 'created', 'reused', 'released', 'discarded', 'timeouts')
+
+    def __init__(self, max_size, timeout, health_checks=False):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_checks = health_checks
+        self._idle = deque()
+        self._size = 0
+        self._waiting = 0
+        self._condition = threading.Condition()
+        self._stats = dict.fromkeys(self.counters, 0)
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _is_usable(self, connection):
+        if connection.closed:
+            return False
+        if not self.health_checks:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except Database.Error:
+            return False
+        return True
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Database.Error:
+            pass
+
+    def _remove(self, connection):
+        self._close(connection)
+        with self._condition:
+            self._size -= 1
+            self._stats['discarded'] += 1
+            self._condition.notify()
+
+    def acquire(self, connect):
+        """
+        Retorna uma tupla (conexão, criada), reutilizando uma conexão ociosa ou criando uma nova com a função connect
+        enquanto o pool não estiver cheio.
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            with self._condition:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout('Nenhuma conexão disponível no pool ({} conexões em uso) após {}s'.format(
+                            self._size, self.timeout))
+                    self._waiting += 1
+                    try:
+                        self._condition.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+                connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    self._size += 1
+
+                waited = time.monotonic() - started
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+
+            if connection is None:
+                try:
+                    connection = connect()
+                except BaseException:
+                    with self._condition:
+                        self._size -= 1
+                        self._condition.notify()
+                    raise
+                with self._condition:
+                    self._stats['acquired'] += 1
+                    self._stats['created'] += 1
+                return connection, True
+
+            if self._is_usable(connection):
+                with self._condition:
+                    self._stats['acquired'] += 1
+                    self._stats['reused'] += 1
+                return connection, False
+            self._remove(connection)
+
+    def release(self, connection, discard=False):
+        """Devolve a conexão ao pool, ou a fecha quando discard for verdadeiro ou ela não puder ser reutilizada."""
+        if discard or connection.closed or connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            self._remove(connection)
+            return
+
+        with self._condition:
+            self._idle.append(connection)
+            self._stats['released'] += 1
+            self._condition.notify()
+
+    def close(self):
+        """Fecha as conexões ociosas. As conexões em uso são fechadas quando forem devolvidas."""
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for connection in idle:
+            self._close(connection)
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            stats.update({
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'waiting': self._waiting,
+                'wait_seconds_total': round(self._wait_total, 6),
+                'wait_seconds_max': round(self._wait_max, 6),
+            })
+        return stats
+
+
+# Pools do processo, por alias, parâmetros de conexão e configuração do pool
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, conn_params, max_size, timeout, health_checks=False):
+    key = (alias, conn_params.get('database'), repr(sorted(conn_params.items())), max_size, timeout, health_checks)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(max_size, timeout, health_checks)
+        return pool
+
+
+def close_pools(database=None):
+    """Fecha as conexões ociosas dos pools, de todos os bancos de dados ou apenas do banco de dados informado."""
+    with _pools_lock:
+        pools = [pool for key, pool in _pools.items() if database is None or key[1] == database]
+    for pool in pools:
+        pool.close()
+
+
+def pool_stats():
+    """Retorna os contadores dos pools do processo, por alias do banco de dados."""
+    with _pools_lock:
+        pools = list(_pools.items())
+
+    stats = {}
+    for key, pool in pools:
+        alias = key[0]
+        current = pool.stats()
+        if alias in stats:
+            current = {name: stats[alias][name] + value if name != 'wait_seconds_max'
+                       else max(stats[alias][name], value) for name, value in current.items()}
+        stats[alias] = current
+    return stats
@@ -0,0 +1,138 @@
+import random
+import threading
+import time
+
+from asgiref.local import Local
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+# Atraso da réplica em segundos: zero quando todo o WAL recebido já foi aplicado (ou quando não é uma réplica)
+LAG_SQL = (
+    'SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE COALESCE(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+)
+
+# Banco de dados das leituras da requisição corrente, por thread ou por coroutine (ASGI)
+_state = Local()
+
+# Situação das réplicas no processo: alias -> (momento da verificação, disponível, atraso)
+_replicas = {}
+_replicas_lock = threading.Lock()
+
+
+def get_config():
+    return getattr(settings, 'DATABASE_REPLICAS', None) or {}
+
+
+def replicas_enabled():
+    return bool(get_config().get('ALIASES'))
+
+
+def check_replica(alias):
+    """
+    Retorna se a réplica está disponível: conectada e com atraso de no máximo MAX_LAG segundos. O resultado é
+    reaproveitado por CHECK_INTERVAL segundos em todo o processo.
+    """
+    config = get_config()
+    now = time.monotonic()
+    with _replicas_lock:
+        status = _replicas.get(alias)
+    if status is not None and now - status[0] < config.get('CHECK_INTERVAL', 5):
+        return status[1]
+
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(LAG_SQL)
+            lag = float(cursor.fetchone()[0])
+    except DatabaseError:
+        mark_replica_down(alias)
+        return False
+
+    available = lag <= config.get('MAX_LAG', 10)
+    with _replicas_lock:
+        _replicas[alias] = (now, available, lag)
+    return available
+
+
+def mark_replica_down(alias):
+    """
+    Descarta a réplica até a próxima verificação. A conexão com erro é fechada pelo Django ao final da requisição
+    (close_if_unusable_or_obsolete).
+    """
+    with _replicas_lock:
+        _replicas[alias] = (time.monotonic(), False, None)
+
+
+def reset_replicas():
+    """Descarta a situação das réplicas, verificadas novamente na próxima leitura."""
+    with _replicas_lock:
+        _replicas.clear()
+
+
+def replica_stats():
+    with _replicas_lock:
+        return {alias: {'available': available, 'lag': lag} for alias, (_, available, lag) in _replicas.items()}
+
+
+def use_replica():
+    """
+    Direciona as leituras seguintes da requisição para uma das réplicas disponíveis, escolhida aleatoriamente.
+    Retorna o alias da réplica, ou None quando nenhuma está disponível e as leituras continuam no banco principal.
+    """
+    aliases = list(get_config().get('ALIASES', ()))
+    random.shuffle(aliases)
+    for alias in aliases:
+        if check_replica(alias):
+            _state.database = alias
+            return alias
+    _state.database = None
+    return None
+
+
+def use_primary():
+    _state.database = None
+
+
+def current_replica():
+    return getattr(_state, 'database', None)
+
+
+def _pin_keys(keys):
+    return ['api:replica-pin:{}'.format(key) for key in keys]
+
+
+def pin_primary(keys):
+    """Direciona as leituras das chaves (ex.: user:1, customer:2) ao banco principal por PIN_SECONDS segundos."""
+    config = get_config()
+    if keys and replicas_enabled() and config.get('PIN_SECONDS', 5) > 0:
+        caches[config.get('CACHE_ALIAS', 'default')].set_many(dict.fromkeys(_pin_keys(keys), True),
+                                                              timeout=config.get('PIN_SECONDS', 5))
+
+
+def is_pinned(keys):
+    config = get_config()
+    return bool(keys) and bool(caches[config.get('CACHE_ALIAS', 'default')].get_many(_pin_keys(keys)))
+
+
+class ReplicaRouter:
+    """
+    Direciona as leituras para a réplica escolhida para a requisição corrente (use_replica) e todas as escritas para o
+    banco de dados principal. Fora das operações de leitura da API (admin, comandos, escritas) as leituras também são
+    feitas no banco principal.
+    """
+    def db_for_read(self, model, **hints):
+        return current_replica()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # As réplicas possuem os mesmos dados do banco principal
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if settings.DATABASES.get(db, {}).get('REPLICA'):
+            return False
+        return None
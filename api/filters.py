@@ -0,0 +1,76 @@
+import re
+
+import django_filters
+from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.db.models import Q
+from rest_framework import filters
+
+from api.models import Product
+
+
+# Configuração de idioma usada no tsvector (ver a trigger da migração 0005_product_search)
+SEARCH_CONFIG = 'portuguese'
+
+
+def search_products(queryset, value):
+    """
+    Busca textual no título e na marca pelo tsvector indexado (GIN), aceitando a sintaxe de busca web (ex.:
+    "geladeira -inox"), ou pelo SKU exato.
+    """
+    query = SearchQuery(value, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(Q(search_vector=query) | Q(sku=value))
+
+
+def search_customers(queryset, value):
+    """
+    Busca de clientes pelo e-mail exato (índice único) ou pelo prefixo das palavras do nome (ex.: "mar sil" encontra
+    "Maria Silva"), pelo índice GIN do tsvector do nome.
+    """
+    if '@' in value:
+        return queryset.filter(email=value.strip())
+
+    words = re.findall(r'\w+', value)
+    if not words:
+        return queryset.none()
+    query = SearchQuery(' & '.join('{}:*'.format(word) for word in words), config='simple', search_type='raw')
+    return queryset.alias(name_search=SearchVector('name', config='simple')).filter(name_search=query)
+
+
+class CharInFilter(django_filters.BaseInFilter, django_filters.CharFilter):
+    pass
+
+
+class ProductFilter(django_filters.FilterSet):
+    """
+    Filtros da listagem de produtos. Todos os filtros são atendidos por índices: marca, faixa de preço e nota mínima
+    por índices B-tree, busca textual pelo índice GIN do tsvector e busca aproximada pelo índice GIN de trigramas do
+    título.
+    """
+    brand = CharInFilter(field_name='brand', lookup_expr='in',
+                         help_text='Marca do Produto, aceita várias separadas por vírgula')
+    price_min = django_filters.NumberFilter(field_name='price', lookup_expr='gte', help_text='Preço mínimo')
+    price_max = django_filters.NumberFilter(field_name='price', lookup_expr='lte', help_text='Preço máximo')
+    review_score_min = django_filters.NumberFilter(field_name='review_score', lookup_expr='gte',
+                                                   help_text='Média dos reviews mínima')
+    search = django_filters.CharFilter(method='filter_search', help_text='Busca textual no título e na marca')
+    fuzzy = django_filters.CharFilter(field_name='title', lookup_expr='trigram_similar',
+                                      help_text='Busca aproximada no título, tolerante a erros de digitação')
+
+    class Meta:
+        model = Product
+        fields = ['brand', 'price_min', 'price_max', 'review_score_min', 'search', 'fuzzy']
+
+    def filter_search(self, queryset, name, value):
+        return search_products(queryset, value)
+
+
+class StableOrderingFilter(filters.OrderingFilter):
+    """
+    OrderingFilter que desempata pela chave primária, no mesmo sentido do primeiro campo, para que a ordenação seja
+    determinística e corresponda aos índices compostos (campo, id).
+    """
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering or any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            return ordering
+        return list(ordering) + ['-id' if ordering[0].startswith('-') else 'id']
@@ -0,0 +1,684 @@
+import fnmatch
+import json
+import platform
+import random
+import re
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from rest_framework.test import APIClient
+
+from api.core.authentication import issue_token
+from api.core.instrumentation import RequestTimings, query_timer
+from api.management.commands.bench_asgi import create_session, percentile
+from api.models import Customer, DeletionJob, Product, Wishlist
+
+
+CLIENT = 'client'
+HTTP = 'http'
+
+SESSION = 'session'
+TOKEN = 'token'
+
+# Quantidade de itens de cada requisição das operações em lote
+BULK_SIZE = 20
+
+# Quantidade de queries do header Server-Timing (INSTRUMENTATION), nas requisições HTTP
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+Scenario = namedtuple('Scenario', 'name basename action build max_requests')
+
+# Cenários executados, na ordem de registro: nome -> Scenario
+SCENARIOS = OrderedDict()
+
+
+def scenario(name, basename, action, max_requests=None):
+    """
+    Registra um cenário da action de um ViewSet do router (pelo basename). A função recebe a amostra (Sample) e a
+    quantidade de requisições, e retorna a lista de requisições (método, caminho, corpo) e uma função que desfaz as
+    alterações feitas pelo cenário (ou None).
+    """
+    def register(build):
+        SCENARIOS[name] = Scenario(name, basename, action, build, max_requests)
+        return build
+    return register
+
+
+def sample_rows(queryset, rng, size, *fields):
+    """
+    Sorteia até size linhas distribuídas por toda a faixa de chaves primárias, com uma query pelo índice da chave
+    primária por linha, sem percorrer a tabela.
+    """
+    bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return []
+
+    rows = OrderedDict()
+    for _ in range(size):
+        row = queryset.filter(pk__gte=rng.randint(bounds['low'], bounds['high'])).order_by('pk').values_list(
+            'pk', *fields).first()
+        rows[row[0]] = row
+    return list(rows.values())
+
+
+class Sample:
+    """
+    Linhas do conjunto de dados sorteadas com uma semente fixa, usadas para montar as requisições dos cenários: a mesma
+    semente com o mesmo conjunto de dados gera as mesmas requisições.
+    """
+    def __init__(self, user, rng, size):
+        self.user = user
+        self.rng = rng
+        # Identifica os registros criados pelos cenários, removidos ao final de cada cenário
+        self.token = uuid.uuid4().hex[:12]
+
+        self.products = sample_rows(Product.objects.all(), rng, size, 'sku', 'title', 'brand', 'price', 'image',
+                                    'review_score')
+        self.customers = sample_rows(Customer.objects.all(), rng, size, 'name', 'email')
+        self.wishlists = sample_rows(Wishlist.objects.all(), rng, size, 'customer_id', 'product_id')
+        if not self.products or not self.customers or not self.wishlists:
+            raise CommandError('O conjunto de dados não possui produtos, clientes e listas de favoritos, '
+                               'execute com --seed')
+
+    def choices(self, rows, count):
+        return [self.rng.choice(rows) for _ in range(count)]
+
+    def product_data(self, index):
+        return {
+            'sku': 'bench-{}-{}'.format(self.token, index), 'title': 'Produto {}'.format(index),
+            'brand': 'Marca Bench', 'price': 10.0 + index % 1000, 'reviewScore': index % 5,
+            'image': 'https://example.com/bench/{}.jpg'.format(index),
+        }
+
+    def temporary_products(self, count):
+        """Cria count produtos, removidos definitivamente pela função retornada (inclusive os removidos pela API)."""
+        prefix = 'bench-{}-tmp-'.format(self.token)
+        Product.objects.bulk_create([Product(
+            sku=prefix + str(index), title='Produto {}'.format(index), brand='Marca Bench', price=10.0,
+            image='https://example.com/bench/{}.jpg'.format(index)) for index in range(count)])
+        pks = list(Product.objects.filter(sku__startswith=prefix).order_by('pk').values_list('pk', flat=True))
+
+        def cleanup():
+            Product.all_objects.filter(pk__in=pks).delete()
+            DeletionJob.objects.filter(model='product', object_id__in=pks).delete()
+        return pks, cleanup
+
+    def temporary_customers(self, count):
+        """
+        Cria count clientes sem produtos favoritos. A função retornada remove definitivamente os clientes (inclusive os
+        removidos pela API) e as suas listas de favoritos, atualizando os contadores dos produtos.
+        """
+        domain = '@bench-{}-tmp.example.com'.format(self.token)
+        Customer.objects.bulk_create([Customer(name='Cliente {}'.format(index), email='{}{}'.format(index, domain))
+                                      for index in range(count)])
+        pks = list(Customer.objects.filter(email__endswith=domain).order_by('pk').values_list('pk', flat=True))
+
+        def cleanup():
+            Wishlist.objects.bulk_remove(Wishlist.objects.filter(customer_id__in=pks).values_list(
+                'customer_id', 'product_id'))
+            Customer.all_objects.filter(pk__in=pks).delete()
+            DeletionJob.objects.filter(model='customer', object_id__in=pks).delete()
+        return pks, cleanup
+
+    def temporary_wishlists(self, count, size=1):
+        """Cria count clientes com size produtos sorteados em suas listas, removidos pela função retornada."""
+        customers, cleanup = self.temporary_customers(count)
+        products = [product[0] for product in self.products]
+        pairs = [(customer, product) for customer in customers
+                 for product in self.rng.sample(products, min(size, len(products)))]
+        Wishlist.objects.bulk_add(pairs)
+        return pairs, cleanup
+
+
+# Clientes
+
+@scenario('customer-list', 'customer', 'list')
+def customer_list(sample, count):
+    return [('get', reverse('customer-list'), None)] * count, None
+
+
+@scenario('customer-list-fields', 'customer', 'list')
+def customer_list_fields(sample, count):
+    # Apenas os ids da lista de favoritos, sem as colunas e URLs dos produtos
+    url = '{}?{}'.format(reverse('customer-list'), urlencode({'fields': 'id,name,wishList.id'}))
+    return [('get', url, None)] * count, None
+
+
+@scenario('customer-retrieve', 'customer', 'retrieve')
+def customer_retrieve(sample, count):
+    # Clientes com lista de favoritos
+    return [('get', reverse('customer-detail', args=[wishlist[1]]), None)
+            for wishlist in sample.choices(sample.wishlists, count)], None
+
+
+@scenario('customer-create', 'customer', 'create')
+def customer_create(sample, count):
+    domain = '@bench-{}.example.com'.format(sample.token)
+    return [('post', reverse('customer-list'), {'name': 'Cliente {}'.format(index), 'email': '{}{}'.format(
+        index, domain)}) for index in range(count)], lambda: Customer.objects.filter(email__endswith=domain).delete()
+
+
+@scenario('customer-update', 'customer', 'update')
+def customer_update(sample, count):
+    # Grava os valores atuais do cliente
+    return [('put', reverse('customer-detail', args=[pk]), {'name': name, 'email': email})
+            for pk, name, email in sample.choices(sample.customers, count)], None
+
+
+@scenario('customer-partial-update', 'customer', 'partial_update')
+def customer_partial_update(sample, count):
+    return [('patch', reverse('customer-detail', args=[pk]), {'name': name})
+            for pk, name, email in sample.choices(sample.customers, count)], None
+
+
+@scenario('customer-destroy', 'customer', 'destroy')
+def customer_destroy(sample, count):
+    pks, cleanup = sample.temporary_customers(count)
+    return [('delete', reverse('customer-detail', args=[pk]), None) for pk in pks], cleanup
+
+
+@scenario('customer-export', 'customer', 'export', max_requests=3)
+def customer_export(sample, count):
+    return [('get', reverse('customer-export'), None)] * count, None
+
+
+# Listas de favoritos
+
+@scenario('wishlist-list', 'wishlist', 'list')
+def wishlist_list(sample, count):
+    return [('get', reverse('wishlist-list'), None)] * count, None
+
+
+@scenario('wishlist-retrieve', 'wishlist', 'retrieve')
+def wishlist_retrieve(sample, count):
+    return [('get', reverse('wishlist-detail', args=[wishlist[0]]), None)
+            for wishlist in sample.choices(sample.wishlists, count)], None
+
+
+@scenario('wishlist-create', 'wishlist', 'create')
+def wishlist_create(sample, count):
+    customers, cleanup = sample.temporary_customers(count)
+    return [('post', reverse('wishlist-list'), {'customer': customer, 'product': product[0]})
+            for customer, product in zip(customers, sample.choices(sample.products, count))], cleanup
+
+
+@scenario('wishlist-update', 'wishlist', 'update')
+def wishlist_update(sample, count):
+    return [('put', reverse('wishlist-detail', args=[pk]), {'customer': customer, 'product': product})
+            for pk, customer, product in sample.choices(sample.wishlists, count)], None
+
+
+@scenario('wishlist-partial-update', 'wishlist', 'partial_update')
+def wishlist_partial_update(sample, count):
+    return [('patch', reverse('wishlist-detail', args=[pk]), {'product': product})
+            for pk, customer, product in sample.choices(sample.wishlists, count)], None
+
+
+@scenario('wishlist-destroy', 'wishlist', 'destroy')
+def wishlist_destroy(sample, count):
+    pairs, cleanup = sample.temporary_wishlists(count)
+    pks = Wishlist.objects.filter(customer_id__in=[customer for customer, _ in pairs]).order_by('pk').values_list(
+        'pk', flat=True)
+    return [('delete', reverse('wishlist-detail', args=[pk]), None) for pk in pks], cleanup
+
+
+@scenario('wishlist-bulk-add', 'wishlist', 'bulk_add')
+def wishlist_bulk_add(sample, count):
+    customers, cleanup = sample.temporary_customers(count)
+    products = [product[0] for product in sample.products]
+    return [('post', reverse('wishlist-bulk-add'), {'items': [
+        {'customer': customer, 'product': product}
+        for product in sample.rng.sample(products, min(BULK_SIZE, len(products)))]}) for customer in customers], cleanup
+
+
+@scenario('wishlist-bulk-remove', 'wishlist', 'bulk_remove')
+def wishlist_bulk_remove(sample, count):
+    pairs, cleanup = sample.temporary_wishlists(count, BULK_SIZE)
+    items = OrderedDict()
+    for customer, product in pairs:
+        items.setdefault(customer, []).append({'customer': customer, 'product': product})
+    return [('post', reverse('wishlist-bulk-remove'), {'items': customer_items})
+            for customer_items in items.values()], cleanup
+
+
+@scenario('wishlist-export', 'wishlist', 'export', max_requests=3)
+def wishlist_export(sample, count):
+    return [('get', reverse('wishlist-export'), None)] * count, None
+
+
+# Lista de favoritos de um cliente
+
+@scenario('customer-wishlist-list', 'customer-wishlist', 'list')
+def customer_wishlist_list(sample, count):
+    return [('get', reverse('customer-wishlist-list', args=[wishlist[1]]), None)
+            for wishlist in sample.choices(sample.wishlists, count)], None
+
+
+@scenario('customer-wishlist-contains', 'customer-wishlist', 'contains')
+def customer_wishlist_contains(sample, count):
+    # Uma página da vitrine: um produto da lista do cliente e produtos sorteados
+    products = [product[0] for product in sample.products]
+    return [('get', '{}?{}'.format(reverse('customer-wishlist-contains', args=[customer]), urlencode({
+        'products': ','.join(str(pk) for pk in [product] + sample.rng.sample(products, min(59, len(products))))})),
+        None) for pk, customer, product in sample.choices(sample.wishlists, count)], None
+
+
+@scenario('customer-wishlist-create', 'customer-wishlist', 'create')
+def customer_wishlist_create(sample, count):
+    customers, cleanup = sample.temporary_customers(count)
+    return [('post', reverse('customer-wishlist-list', args=[customer]), {'product': product[0]})
+            for customer, product in zip(customers, sample.choices(sample.products, count))], cleanup
+
+
+@scenario('customer-wishlist-destroy', 'customer-wishlist', 'destroy')
+def customer_wishlist_destroy(sample, count):
+    pairs, cleanup = sample.temporary_wishlists(count)
+    return [('delete', reverse('customer-wishlist-detail', args=[customer, product]), None)
+            for customer, product in pairs], cleanup
+
+
+# Produtos
+
+@scenario('product-list', 'product', 'list')
+def product_list(sample, count):
+    return [('get', reverse('product-list'), None)] * count, None
+
+
+@scenario('product-list-brand', 'product', 'list')
+def product_list_brand(sample, count):
+    return [('get', '{}?{}'.format(reverse('product-list'), urlencode({'brand': product[3], 'ordering': 'price'})),
+             None)
+            for product in sample.choices(sample.products, count)], None
+
+
+@scenario('product-search', 'product', 'list')
+def product_search(sample, count):
+    return [('get', '{}?{}'.format(reverse('product-list'), urlencode({'search': product[2].split()[-1]})), None)
+            for product in sample.choices(sample.products, count)], None
+
+
+@scenario('product-retrieve', 'product', 'retrieve')
+def product_retrieve(sample, count):
+    return [('get', reverse('product-detail', args=[product[0]]), None)
+            for product in sample.choices(sample.products, count)], None
+
+
+@scenario('product-create', 'product', 'create')
+def product_create(sample, count):
+    prefix = 'bench-{}-'.format(sample.token)
+    return [('post', reverse('product-list'), sample.product_data(index)) for index in range(count)], \
+        lambda: Product.objects.filter(sku__startswith=prefix).delete()
+
+
+@scenario('product-update', 'product', 'update')
+def product_update(sample, count):
+    # Grava os valores atuais do produto (a média dos reviews não aceita null na API)
+    requests = []
+    for pk, sku, title, brand, price, image, review_score in sample.choices(sample.products, count):
+        data = {'sku': sku, 'title': title, 'brand': brand, 'price': price, 'image': image}
+        if review_score is not None:
+            data['reviewScore'] = review_score
+        requests.append(('put', reverse('product-detail', args=[pk]), data))
+    return requests, None
+
+
+@scenario('product-partial-update', 'product', 'partial_update')
+def product_partial_update(sample, count):
+    return [('patch', reverse('product-detail', args=[product[0]]), {'price': product[4]})
+            for product in sample.choices(sample.products, count)], None
+
+
+@scenario('product-destroy', 'product', 'destroy')
+def product_destroy(sample, count):
+    pks, cleanup = sample.temporary_products(count)
+    return [('delete', reverse('product-detail', args=[pk]), None) for pk in pks], cleanup
+
+
+@scenario('product-top', 'product', 'top')
+def product_top(sample, count):
+    return [('get', reverse('product-top'), None)] * count, None
+
+
+@scenario('product-cache-stats', 'product', 'cache_stats')
+def product_cache_stats(sample, count):
+    return [('get', reverse('product-cache-stats'), None)] * count, None
+
+
+@scenario('product-export', 'product', 'export', max_requests=3)
+def product_export(sample, count):
+    return [('get', reverse('product-export'), None)] * count, None
+
+
+# Usuários
+
+@scenario('user-list', 'user', 'list')
+def user_list(sample, count):
+    return [('get', reverse('user-list'), None)] * count, None
+
+
+@scenario('user-retrieve', 'user', 'retrieve')
+def user_retrieve(sample, count):
+    return [('get', reverse('user-detail', args=[sample.user.pk]), None)] * count, None
+
+
+@scenario('user-create', 'user', 'create')
+def user_create(sample, count):
+    prefix = 'bench-{}-'.format(sample.token)
+    return [('post', reverse('user-list'), {
+        'username': '{}{}'.format(prefix, index), 'email': '{}{}@example.com'.format(prefix, index),
+        'password': get_random_string(16),
+    }) for index in range(count)], lambda: User.objects.filter(username__startswith=prefix).delete()
+
+
+@scenario('user-destroy', 'user', 'destroy')
+def user_destroy(sample, count):
+    prefix = 'bench-{}-tmp-'.format(sample.token)
+    User.objects.bulk_create([User(username='{}{}'.format(prefix, index)) for index in range(count)])
+    users = User.objects.filter(username__startswith=prefix)
+    return [('delete', reverse('user-detail', args=[pk]), None)
+            for pk in users.order_by('pk').values_list('pk', flat=True)], lambda: users.delete()
+
+
+# Tokens de acesso
+
+@scenario('token-create', 'token', 'create')
+def token_create(sample, count):
+    username, password = 'bench-{}-token'.format(sample.token), get_random_string(16)
+    User.objects.create_user(username, password=password)
+    return [('post', reverse('token-list'), {'username': username, 'password': password})] * count, \
+        lambda: User.objects.filter(username=username).delete()
+
+
+@scenario('token-revoke', 'token', 'revoke')
+def token_revoke(sample, count):
+    return [('post', reverse('token-revoke'), {'token': issue_token(sample.user)[0]}) for _ in range(count)], None
+
+
+@scenario('token-revoke-all', 'token', 'revoke_all')
+def token_revoke_all(sample, count):
+    user = User.objects.create_user('bench-{}-revoke'.format(sample.token))
+    return [('post', reverse('token-revoke-all'), {'user': user.pk})] * count, lambda: user.delete()
+
+
+def authorization(user):
+    """Header Authorization com um token de acesso do usuário."""
+    return 'Bearer {}'.format(issue_token(user)[0])
+
+
+class ClientRunner:
+    """
+    Executa as requisições no próprio processo, pelo cliente de testes do DRF, autenticado por sessão ou por token de
+    acesso. As queries de cada requisição são contadas com connection.execute_wrapper.
+    """
+    def __init__(self, user, auth=SESSION):
+        self.client = APIClient()
+        if auth == TOKEN:
+            self.client.credentials(HTTP_AUTHORIZATION=authorization(user))
+        else:
+            self.client.force_login(user)
+
+    def __call__(self, method, path, data):
+        timings = RequestTimings()
+        started = time.perf_counter()
+        with query_timer(timings):
+            if data is None:
+                response = getattr(self.client, method)(path)
+            else:
+                response = getattr(self.client, method)(path, data, format='json')
+            # O cliente de testes fecha a resposta, sem fechar as conexões com o banco de dados, ao final do conteúdo
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+        latency = time.perf_counter() - started
+        return latency, response.status_code, timings.queries
+
+
+class HttpRunner:
+    """
+    Executa as requisições por HTTP em um servidor da aplicação, autenticado por sessão (a sessão é criada no banco de
+    dados configurado, que deve ser o mesmo do servidor) ou por token de acesso (assinado com a mesma SECRET_KEY do
+    servidor). As queries são obtidas do header Server-Timing, quando o servidor está com INSTRUMENTATION habilitado.
+    """
+    def __init__(self, url, user, auth=SESSION, timeout=60):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/json'}
+        if auth == TOKEN:
+            self.headers['Authorization'] = authorization(user)
+        else:
+            csrf_token = get_random_string(32)
+            self.headers.update({
+                'Cookie': '{}={}; {}={}'.format(settings.SESSION_COOKIE_NAME, create_session(user.get_username()),
+                                                settings.CSRF_COOKIE_NAME, csrf_token),
+                'X-CSRFToken': csrf_token,
+                'Referer': self.url + '/',
+            })
+
+    def __call__(self, method, path, data):
+        body = json.dumps(data).encode() if data is not None else None
+        request = Request(self.url + path, data=body, headers=self.headers, method=method.upper())
+        started = time.perf_counter()
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                status, headers = response.status, response.headers
+        except HTTPError as error:
+            error.read()
+            status, headers = error.code, error.headers
+        latency = time.perf_counter() - started
+
+        match = SERVER_TIMING_QUERIES.search(headers.get('Server-Timing', ''))
+        return latency, status, int(match.group(1)) if match else None
+
+
+def compare(results, baseline, tolerance, min_delta_ms, query_tolerance):
+    """
+    Compara os resultados com os de referência, retornando as regressões: p50 ou p95 acima da tolerância (e de pelo
+    menos min_delta_ms), vazão abaixo da tolerância, mais queries por requisição ou mais erros.
+    """
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+
+        for metric in ('p50_ms', 'p95_ms'):
+            limit = max(previous[metric] * (1 + tolerance), previous[metric] + min_delta_ms)
+            if current[metric] > limit:
+                regressions.append('{}: {} {:.1f} > {:.1f}'.format(name, metric, current[metric], previous[metric]))
+        if current['throughput'] < previous['throughput'] / (1 + tolerance):
+            regressions.append('{}: throughput {:.1f} < {:.1f}'.format(
+                name, current['throughput'], previous['throughput']))
+        if current['queries'] is not None and previous['queries'] is not None \
+                and current['queries'] > previous['queries'] + query_tolerance:
+            regressions.append('{}: queries {:.1f} > {:.1f}'.format(name, current['queries'], previous['queries']))
+        if current['errors'] > previous['errors']:
+            regressions.append('{}: errors {} > {}'.format(name, current['errors'], previous['errors']))
+    return regressions
+
+
+class Command(BaseCommand):
+    help = 'Mede a latência (p50, p95 e p99), a vazão e a quantidade de queries das operações da API, compara com ' \
+           'um resultado de referência e falha com regressões acima da tolerância'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Superusuário usado nas requisições, padrão o primeiro superusuário')
+        parser.add_argument('--url', help='Servidor da aplicação (ex.: http://localhost:8000), padrão executa as '
+                                          'requisições no próprio processo')
+        parser.add_argument('--auth', choices=[SESSION, TOKEN], default=SESSION,
+                            help='Autenticação das requisições: session (padrão) ou token (Authorization: Bearer)')
+        parser.add_argument('--requests', type=int, default=200, help='Requisições medidas por cenário, padrão 200')
+        parser.add_argument('--warmup', type=int, default=20,
+                            help='Requisições não medidas antes de cada cenário, padrão 20')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Requisições simultâneas, apenas com --url, padrão 1')
+        parser.add_argument('--scenarios', default='*',
+                            help='Cenários executados, separados por vírgula, aceita curingas (ex.: "product-*")')
+        parser.add_argument('--random-seed', type=int, default=42, help='Semente do sorteio das requisições')
+        parser.add_argument('--sample-size', type=int, default=200,
+                            help='Linhas sorteadas de cada tabela para as requisições, padrão 200')
+        parser.add_argument('--seed', action='store_true',
+                            help='Completa o conjunto de dados gerado (manage.py seed) até --products, --customers '
+                                 'e --wishlists')
+        parser.add_argument('--products', type=int, default=1000000, help='Produtos do conjunto de dados')
+        parser.add_argument('--customers', type=int, default=100000, help='Clientes do conjunto de dados')
+        parser.add_argument('--wishlists', type=int, default=10000000,
+                            help='Produtos nas listas de favoritos do conjunto de dados')
+        parser.add_argument('--output', help='Arquivo JSON com os resultados')
+        parser.add_argument('--baseline', help='Arquivo JSON com os resultados de referência')
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Grava os resultados como referência quando não há regressões')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Piora relativa aceita nas latências e na vazão, padrão 0.2 (20%%)')
+        parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                            help='Piora mínima das latências, em milissegundos, para uma regressão, padrão 1')
+        parser.add_argument('--query-tolerance', type=float, default=0.5,
+                            help='Queries a mais por requisição aceitas, padrão 0.5')
+
+    def handle(self, *args, **options):
+        patterns = [pattern.strip() for pattern in options['scenarios'].split(',') if pattern.strip()]
+        scenarios = [scenario for name, scenario in SCENARIOS.items()
+                     if any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)]
+        if not scenarios:
+            raise CommandError('Nenhum cenário encontrado: {}'.format(options['scenarios']))
+        if options['concurrency'] > 1 and not options['url']:
+            raise CommandError('--concurrency é aceito apenas com --url')
+        if options['update_baseline'] and not options['baseline']:
+            raise CommandError('Informe o arquivo de referência em --baseline')
+
+        user = self.get_user(options['user'])
+        if options['seed']:
+            call_command('seed', products=options['products'], customers=options['customers'],
+                         wishlists=options['wishlists'], resume=True, stdout=self.stdout, stderr=self.stderr)
+
+        sample = Sample(user, random.Random(options['random_seed']), options['sample_size'])
+        if options['url']:
+            runner = HttpRunner(options['url'], user, options['auth'])
+        else:
+            runner = ClientRunner(user, options['auth'])
+        results = {
+            'created_at': timezone.now().isoformat(),
+            'mode': HTTP if options['url'] else CLIENT,
+            'auth': options['auth'],
+            'url': options['url'],
+            'requests': options['requests'],
+            'warmup': options['warmup'],
+            'concurrency': options['concurrency'],
+            'random_seed': options['random_seed'],
+            'environment': {
+                'python': platform.python_version(),
+                'database': connections['default'].vendor,
+                'settings': {name: getattr(settings, name, None) for name in (
+                    'FAST_SERIALIZATION', 'WISHLIST_SNAPSHOT', 'CONN_MAX_AGE', 'INSTRUMENTATION', 'METRICS')},
+            },
+            'dataset': {
+                'products': Product.objects.count(),
+                'customers': Customer.objects.count(),
+                'wishlists': Wishlist.objects.count(),
+            },
+            'scenarios': OrderedDict(),
+        }
+
+        self.stdout.write('{:<28} {:>6} {:>6} {:>9} {:>9} {:>9} {:>9} {:>8}'.format(
+            'cenário', 'req', 'erros', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries'))
+        for scenario in scenarios:
+            result = self.run_scenario(runner, scenario, sample, options)
+            results['scenarios'][scenario.name] = result
+            self.stdout.write('{:<28} {:>6} {:>6} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>8}'.format(
+                scenario.name, result['requests'], result['errors'], result['throughput'], result['p50_ms'],
+                result['p95_ms'], result['p99_ms'], '-' if result['queries'] is None else result['queries']))
+
+        if options['output']:
+            self.write_json(options['output'], results)
+        if options['baseline']:
+            self.check_baseline(results, options)
+
+    def get_user(self, username):
+        users = User.objects.filter(is_active=True, is_superuser=True)
+        user = (users.filter(username=username) if username else users.order_by('pk')).first()
+        if user is None:
+            raise CommandError('Superusuário {} não encontrado'.format(username or ''))
+        return user
+
+    def run_scenario(self, runner, scenario, sample, options):
+        count = options['requests']
+        warmup = options['warmup']
+        if scenario.max_requests is not None:
+            count = min(count, scenario.max_requests)
+            warmup = min(warmup, 1)
+
+        requests, cleanup = scenario.build(sample, warmup + count)
+        try:
+            for request in requests[:warmup]:
+                runner(*request)
+
+            started = time.perf_counter()
+            if options['concurrency'] > 1:
+                with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                    measured = list(executor.map(lambda request: runner(*request), requests[warmup:]))
+            else:
+                measured = [runner(*request) for request in requests[warmup:]]
+            elapsed = time.perf_counter() - started
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+        latencies = [latency for latency, status, queries in measured]
+        queries = [queries for latency, status, queries in measured if queries is not None]
+        method, path, data = requests[0]
+        return OrderedDict((
+            ('method', method.upper()),
+            ('path', path),
+            ('requests', len(measured)),
+            ('errors', sum(1 for latency, status, queries in measured if status >= 400)),
+            ('throughput', round(len(measured) / elapsed, 1) if elapsed else 0.0),
+            ('mean_ms', round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0),
+            ('p50_ms', round(percentile(latencies, .5) * 1000, 2)),
+            ('p95_ms', round(percentile(latencies, .95) * 1000, 2)),
+            ('p99_ms', round(percentile(latencies, .99) * 1000, 2)),
+            ('queries', round(sum(queries) / len(queries), 2) if queries else None),
+        ))
+
+    def write_json(self, path, results):
+        with open(path, 'w', encoding='utf-8') as stream:
+            json.dump(results, stream, indent=2)
+            stream.write('\n')
+
+    def check_baseline(self, results, options):
+        try:
+            with open(options['baseline'], encoding='utf-8') as stream:
+                baseline = json.load(stream)
+        except FileNotFoundError:
+            if not options['update_baseline']:
+                raise CommandError('Arquivo de referência {} não encontrado'.format(options['baseline']))
+            baseline = None
+
+        regressions = []
+        if baseline is not None:
+            for key in ('mode', 'dataset'):
+                if baseline.get(key) != results[key]:
+                    self.stderr.write('Aviso: {} diferente da referência: {} (referência: {})'.format(
+                        key, results[key], baseline.get(key)))
+            regressions = compare(results, baseline, options['tolerance'], options['min_delta_ms'],
+                                  options['query_tolerance'])
+
+        if regressions:
+            for regression in regressions:
+                self.stderr.write(regression)
+            raise CommandError('{} regressões em relação a {}'.format(len(regressions), options['baseline']))
+        if options['update_baseline']:
+            self.write_json(options['baseline'], results)
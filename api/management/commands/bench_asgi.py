@@ -0,0 +1,198 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+
+
+WSGI = 'wsgi'
+ASGI_SYNC = 'asgi-sync'
+ASGI = 'asgi'
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def create_session(username):
+    """Cria uma sessão autenticada, como o login, sem o custo do hash da senha em cada requisição."""
+    try:
+        user = get_user_model()._default_manager.get_by_natural_key(username)
+    except get_user_model().DoesNotExist:
+        raise CommandError('Usuário {} não encontrado'.format(username))
+
+    session = SessionStore()
+    session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0] \
+        if getattr(settings, 'AUTHENTICATION_BACKENDS', None) else 'django.contrib.auth.backends.ModelBackend'
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return session.session_key
+
+
+class ThreadCounter:
+    """Registra o maior número de threads ativas no processo durante a execução."""
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, threading.active_count()) - 1
+
+
+class Command(BaseCommand):
+    help = 'Compara a vazão com conexões simultâneas das operações de leitura pelo WSGI (main.py) e pelo ASGI ' \
+           '(operações síncronas e assíncronas), executando as aplicações no próprio processo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Usuário usado nas requisições, autenticado por sessão')
+        parser.add_argument('--connections', type=int, default=32,
+                            help='Conexões simultâneas fazendo requisições, padrão 32')
+        parser.add_argument('--idle', type=int, default=0,
+                            help='Conexões keep-alive ociosas abertas durante a execução, padrão 0')
+        parser.add_argument('--requests', type=int, default=2000, help='Total de requisições por modo, padrão 2000')
+        parser.add_argument('--path', default='/api/product/',
+                            help='Operação síncrona, padrão /api/product/ (a assíncrona é a mesma sob /api/async/)')
+        parser.add_argument('--modes', default=','.join([WSGI, ASGI_SYNC, ASGI]),
+                            help='Modos executados, separados por vírgula: {}, {} e {}'.format(WSGI, ASGI_SYNC, ASGI))
+
+    def handle(self, *args, **options):
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+        invalid = set(modes) - {WSGI, ASGI_SYNC, ASGI}
+        if invalid:
+            raise CommandError('Modos inválidos: {}'.format(', '.join(sorted(invalid))))
+
+        url = urlsplit(options['path'])
+        if not url.path.startswith('/api/'):
+            raise CommandError('O caminho deve ser uma operação da API (/api/...)')
+        self.query_string = url.query
+        self.paths = {WSGI: url.path, ASGI_SYNC: url.path, ASGI: '/api/async/' + url.path[len('/api/'):]}
+        self.cookie = '{}={}'.format(settings.SESSION_COOKIE_NAME, create_session(options['user']))
+        self.connections = options['connections']
+        self.idle = options['idle']
+        self.requests = options['requests']
+
+        self.stdout.write('{:<10} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9} {:>8} {:>8}'.format(
+            'modo', 'req', 'erros', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'threads', 'tempo s'))
+        for mode in modes:
+            runner = self.run_wsgi if mode == WSGI else self.run_asgi
+            with ThreadCounter() as threads:
+                started = time.perf_counter()
+                latencies, errors = runner(self.paths[mode])
+                elapsed = time.perf_counter() - started
+            self.stdout.write('{:<10} {:>8} {:>7} {:>9.0f} {:>9.1f} {:>9.1f} {:>9.1f} {:>8} {:>8.2f}'.format(
+                mode, len(latencies), errors, len(latencies) / elapsed, percentile(latencies, .5) * 1000,
+                percentile(latencies, .95) * 1000, percentile(latencies, .99) * 1000, threads.peak, elapsed))
+
+    def counts(self):
+        """Divide o total de requisições entre as conexões."""
+        quotient, remainder = divmod(self.requests, self.connections)
+        return [quotient + (1 if index < remainder else 0) for index in range(self.connections)]
+
+    def run_wsgi(self, path):
+        """
+        Servidor WSGI com uma thread por conexão (ex.: gunicorn --threads): as conexões ociosas também ocupam uma
+        thread enquanto estão abertas.
+        """
+        from main import app
+
+        def request():
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': self.query_string, 'SCRIPT_NAME': '',
+                'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': 'localhost', 'HTTP_COOKIE': self.cookie, 'wsgi.url_scheme': 'http',
+                'wsgi.input': BytesIO(), 'wsgi.errors': BytesIO(), 'wsgi.multithread': True,
+                'wsgi.multiprocess': False, 'wsgi.run_once': False, 'wsgi.version': (1, 0),
+            }
+            statuses = []
+            started = time.perf_counter()
+            response = app(environ, lambda status, headers, exc_info=None: statuses.append(status))
+            try:
+                for _ in response:
+                    pass
+            finally:
+                response.close()
+            return time.perf_counter() - started, statuses[0].startswith('200')
+
+        def connection(count):
+            return [request() for _ in range(count)]
+
+        idle = threading.Event()
+        latencies, errors = [], 0
+        with ThreadPoolExecutor(max_workers=self.connections + self.idle) as executor:
+            for _ in range(self.idle):
+                executor.submit(idle.wait)
+            try:
+                for results in executor.map(connection, self.counts()):
+                    latencies += [latency for latency, ok in results]
+                    errors += sum(1 for latency, ok in results if not ok)
+            finally:
+                idle.set()
+        return latencies, errors
+
+    def run_asgi(self, path):
+        """
+        Servidor ASGI (ex.: uvicorn): cada conexão é uma coroutine no event loop, as conexões ociosas apenas aguardam
+        sem ocupar threads.
+        """
+        from desafio_luizalabs.asgi import application
+
+        headers = [(b'host', b'localhost'), (b'cookie', self.cookie.encode())]
+
+        async def request():
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+                'query_string': self.query_string.encode(), 'headers': headers,
+                'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+            }
+            messages = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                messages.append(message)
+
+            started = time.perf_counter()
+            await application(scope, receive, send)
+            return time.perf_counter() - started, messages[0]['status'] == 200
+
+        async def connection(count):
+            return [await request() for _ in range(count)]
+
+        async def main():
+            idle = asyncio.Event()
+            waiting = [asyncio.ensure_future(idle.wait()) for _ in range(self.idle)]
+            try:
+                return await asyncio.gather(*[connection(count) for count in self.counts()])
+            finally:
+                idle.set()
+                await asyncio.gather(*waiting)
+
+        latencies, errors = [], 0
+        for results in asyncio.run(main()):
+            latencies += [latency for latency, ok in results]
+            errors += sum(1 for latency, ok in results if not ok)
+        return latencies, errors
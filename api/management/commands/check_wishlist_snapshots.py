@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.core.snapshot import rebuild_wishlist_snapshots, serialize_wishlists
+from api.models import CustomerWishlistSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Compara as listas de favoritos serializadas (CustomerWishlistSnapshot) com as listas atuais dos clientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Reconstrói as listas divergentes')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Clientes por lote, padrão 1000')
+
+    def handle(self, *args, **options):
+        checked = stale = 0
+        divergent = []
+        last_pk = 0
+        while True:
+            snapshots = list(CustomerWishlistSnapshot.objects.filter(customer_id__gt=last_pk).order_by('customer_id')
+                             .values_list('customer_id', 'wishlist_version', 'data')[:options['batch_size']])
+            if not snapshots:
+                break
+            last_pk = snapshots[-1][0]
+
+            current = serialize_wishlists([customer_id for customer_id, _, _ in snapshots])
+            for customer_id, version, data in snapshots:
+                checked += 1
+                current_version, current_data = current[customer_id]
+                if version != current_version:
+                    # Desatualizada: será reconstruída na próxima consulta
+                    stale += 1
+                elif json.loads(json.dumps(current_data)) != data:
+                    divergent.append(customer_id)
+
+        if divergent and options['fix']:
+            for start in range(0, len(divergent), options['batch_size']):
+                rebuild_wishlist_snapshots(divergent[start:start + options['batch_size']])
+
+        self.stdout.write('{} listas verificadas: {} desatualizadas, {} divergentes{}'.format(
+            checked, stale, len(divergent), ' (reconstruídas)' if divergent and options['fix'] else ''))
+        if divergent and not options['fix']:
+            raise CommandError('Listas divergentes dos clientes {}, execute com --fix para reconstruí-las'.format(
+                ', '.join(str(customer_id) for customer_id in divergent[:20])))
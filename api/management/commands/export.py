@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.core.export import CSV, NDJSON, export_lines, export_rows
+from api.views import CustomerViewSet, ProductViewSet, WishListViewSet
+
+
+RESOURCES = {
+    'products': ProductViewSet,
+    'customers': CustomerViewSet,
+    'wishlists': WishListViewSet,
+}
+
+
+class Command(BaseCommand):
+    help = 'Exporta produtos, clientes ou listas de favoritos em NDJSON ou CSV, com memória constante'
+
+    def add_arguments(self, parser):
+        parser.add_argument('resource', choices=sorted(RESOURCES))
+        parser.add_argument('--output', choices=[NDJSON, CSV], default=NDJSON, help='Formato do arquivo, padrão ndjson')
+        parser.add_argument('--file', help='Arquivo de destino, padrão saída padrão')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Linhas lidas do cursor por vez, padrão 2000')
+
+    def handle(self, *args, **options):
+        viewset = RESOURCES[options['resource']]
+        fields = viewset.export_fields
+        count = 0
+
+        def counted(rows):
+            nonlocal count
+            for row in rows:
+                count += 1
+                yield row
+
+        started = time.monotonic()
+        blocks = export_lines(counted(export_rows(viewset.queryset, fields, options['chunk_size'])), fields,
+                              options['output'])
+        if options['file']:
+            with open(options['file'], 'w', encoding='utf-8', newline='') as stream:
+                for block in blocks:
+                    stream.write(block)
+        else:
+            for block in blocks:
+                self.stdout.write(block, ending='')
+
+        self.stderr.write('{} linhas exportadas em {:.2f}s'.format(count, time.monotonic() - started))
@@ -0,0 +1,160 @@
+import csv
+import json
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from rest_framework.settings import api_settings
+
+from api.core.cache import product_cache
+from api.core.export import CSV, NDJSON
+from api.models import Product, Wishlist
+
+
+# Colunas do arquivo (mesmos nomes da API e da exportação) e campo correspondente do modelo
+IMPORT_COLUMNS = (
+    ('sku', 'sku'),
+    ('title', 'title'),
+    ('brand', 'brand'),
+    ('price', 'price'),
+    ('image', 'image'),
+    ('reviewScore', 'review_score'),
+)
+IMPORT_FIELDS = [(name, field_name, Product._meta.get_field(field_name)) for name, field_name in IMPORT_COLUMNS]
+IMPORT_KEY = 'sku'
+
+
+def read_rows(stream, file_format):
+    """Lê o arquivo linha a linha, retornando tuplas (número da linha, dict com a linha ou None, linha original)."""
+    if file_format == CSV:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, row
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None, line.rstrip('\n')
+
+
+def clean_row(row):
+    """
+    Valida a linha com os próprios campos do modelo, retornando uma tupla com os valores de
+    ProductManager.import_fields, ou lança ValidationError com os erros por coluna. O SKU, opcional nos produtos
+    incluídos pela API, é obrigatório na importação: é a chave que identifica o produto a ser atualizado.
+    """
+    values = []
+    errors = {}
+    for name, field_name, field in IMPORT_FIELDS:
+        value = row.get(name, row.get(field_name))
+        if isinstance(value, str):
+            value = value.strip()
+        if value == '':
+            value = None
+        if value is None and field_name == IMPORT_KEY:
+            errors[name] = [field.error_messages['null']]
+            continue
+
+        try:
+            values.append(field.clean(value, None))
+        except ValidationError as exc:
+            errors[name] = exc.messages
+
+    if errors:
+        raise ValidationError(errors)
+    return tuple(values)
+
+
+class Command(BaseCommand):
+    help = 'Importa produtos de um arquivo CSV ou NDJSON, incluindo ou atualizando os produtos pelo SKU'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Arquivo CSV ou NDJSON com as colunas sku, title, brand, price, image e '
+                                         'reviewScore')
+        parser.add_argument('--format', choices=[CSV, NDJSON],
+                            help='Formato do arquivo, padrão csv para arquivos .csv e ndjson para os demais')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Linhas por lote, padrão 10000')
+        parser.add_argument('--reject-file',
+                            help='Arquivo NDJSON com as linhas rejeitadas, padrão <arquivo>.rejects.ndjson')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        path = options['file']
+        file_format = options['format'] or (CSV if path.lower().endswith('.csv') else NDJSON)
+        reject_path = options['reject_file'] or '{}.rejects.ndjson'.format(path)
+        batch_size = options['batch_size']
+
+        self.counters = dict.fromkeys(['read', 'valid', 'inserted', 'updated', 'rejected', 'deleted'], 0)
+        self.started = time.monotonic()
+        self.reject_path = reject_path
+        self.reject_file = None
+        batch = []
+        raws = {}
+
+        try:
+            with open(path, encoding='utf-8', newline='') as stream:
+                for line_number, row, raw in read_rows(stream, file_format):
+                    self.counters['read'] += 1
+                    try:
+                        if row is None:
+                            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ['Linha inválida.']})
+                        batch.append((line_number, ) + clean_row(row))
+                        raws[line_number] = raw
+                    except ValidationError as exc:
+                        self.reject(line_number, exc.message_dict, raw)
+                        continue
+
+                    if len(batch) >= batch_size:
+                        self.import_batch(batch, raws)
+                        batch = []
+                        raws = {}
+
+            if batch:
+                self.import_batch(batch, raws)
+        finally:
+            if self.reject_file is not None:
+                self.reject_file.close()
+
+        self.stdout.write(self.summary())
+        if self.reject_file is not None:
+            self.stdout.write('{} linhas rejeitadas gravadas em {}'.format(self.counters['rejected'], reject_path))
+
+    def reject(self, line_number, errors, raw):
+        if self.reject_file is None:
+            self.reject_file = open(self.reject_path, 'w', encoding='utf-8')
+        self.reject_file.write(json.dumps({'line': line_number, 'errors': errors, 'row': raw},
+                                          ensure_ascii=False) + '\n')
+        self.counters['rejected'] += 1
+
+    def import_batch(self, batch, raws):
+        inserted, updated, deleted = Product.objects.import_rows(batch)
+
+        # A importação não dispara os signals do modelo
+        product_cache.invalidate_many(updated)
+        Wishlist.objects.touch_product_customers(updated)
+
+        # O SKU de um produto removido continua em uso até a sua remoção definitiva
+        for line_number in deleted:
+            self.reject(line_number, {'sku': ['Produto removido, aguardando a remoção definitiva.']},
+                        raws[line_number])
+
+        self.counters['valid'] += len(batch) - len(deleted)
+        self.counters['deleted'] += len(deleted)
+        self.counters['inserted'] += len(inserted)
+        self.counters['updated'] += len(updated)
+        if self.verbosity >= 2:
+            self.stdout.write(self.summary())
+
+    def summary(self):
+        counters = self.counters
+        elapsed = time.monotonic() - self.started
+        return '{} linhas lidas em {:.1f}s ({:.0f} linhas/s): {} incluídas, {} atualizadas, {} sem alteração, ' \
+               '{} rejeitadas ({} de produtos removidos)'.format(
+                   counters['read'], elapsed, counters['read'] / max(elapsed, 1e-6), counters['inserted'],
+                   counters['updated'], counters['valid'] - counters['inserted'] - counters['updated'],
+                   counters['rejected'], counters['deleted'])
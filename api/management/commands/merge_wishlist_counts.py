@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Soma as parcelas pendentes dos contadores de listas de favoritos dos produtos (executar periodicamente)'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        updated = Product.objects.merge_wishlist_counts()
+        self.stdout.write('{} produtos atualizados em {:.2f}s'.format(updated, time.monotonic() - started))
@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.core.deletion import get_config, run_job
+from api.models import DeletionJob
+
+
+class Command(BaseCommand):
+    help = 'Executa as remoções definitivas pendentes dos clientes e produtos removidos, com os itens das listas de ' \
+           'favoritos que dependem deles, em lotes de tamanho limitado'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            help='Itens das listas de favoritos removidos por transação, padrão DELETION_JOBS')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Intervalo, em segundos, entre os lotes, limitando a carga no banco de dados')
+        parser.add_argument('--watch', action='store_true',
+                            help='Continua aguardando novos jobs, verificados a cada --interval segundos')
+        parser.add_argument('--interval', type=float, default=5, help='Intervalo entre as verificações, padrão 5')
+        parser.add_argument('--progress-interval', type=float, default=1,
+                            help='Intervalo mínimo, em segundos, entre as mensagens de progresso, padrão 1')
+        parser.add_argument('--status', action='store_true',
+                            help='Apenas exibe o progresso dos jobs não concluídos')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            return self.show_status()
+
+        lease_seconds = get_config()['LEASE_SECONDS']
+        while True:
+            job = DeletionJob.objects.claim(lease_seconds)
+            if job is None:
+                if not options['watch']:
+                    return
+                time.sleep(options['interval'])
+                continue
+            self.run(job, options)
+
+    def run(self, job, options):
+        self.stdout.write('{}: iniciando, {} itens estimados (tentativa {})'.format(job, job.total, job.attempts))
+        started = time.monotonic()
+        reported = [started]
+
+        def progress(job):
+            now = time.monotonic()
+            if now - reported[0] >= options['progress_interval'] and job.status != DeletionJob.DONE:
+                reported[0] = now
+                self.stdout.write('{}: {} itens removidos ({:.1f}%), {:.0f} itens/s'.format(
+                    job, job.deleted, job.progress, job.deleted / (now - started)))
+
+        job = run_job(job, options['batch_size'], options['pause'], progress)
+        if job.status == DeletionJob.DONE:
+            self.stdout.write('{}: concluído, {} itens removidos em {:.2f}s'.format(
+                job, job.deleted, time.monotonic() - started))
+        else:
+            self.stderr.write('{}: {} ({})'.format(job, job.get_status_display().lower(), job.error))
+
+    def show_status(self):
+        jobs = DeletionJob.objects.exclude(status=DeletionJob.DONE).order_by('id')
+        for job in jobs:
+            self.stdout.write('{}: {}, {} de {} itens ({:.1f}%), {} tentativas{}'.format(
+                job, job.get_status_display().lower(), job.deleted, job.total, job.progress, job.attempts,
+                ', erro: {}'.format(job.error) if job.error else ''))
+        if not jobs:
+            self.stdout.write('Nenhuma remoção pendente')
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from api.core.snapshot import rebuild_wishlist_snapshots
+from api.models import Customer
+
+
+class Command(BaseCommand):
+    help = 'Serializa e armazena a lista de favoritos dos clientes (CustomerWishlistSnapshot)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Reconstrói todas as listas, padrão apenas as ausentes ou desatualizadas')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Clientes por lote, padrão 1000')
+
+    def handle(self, *args, **options):
+        queryset = Customer.objects.all()
+        if not options['all']:
+            queryset = queryset.filter(Q(wishlist_snapshot__isnull=True) |
+                                       ~Q(wishlist_snapshot__wishlist_version=F('wishlist_version')))
+
+        started = time.monotonic()
+        count = 0
+        last_pk = 0
+        while True:
+            # Percorre os clientes pela chave primária, sem OFFSET
+            pks = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[
+                :options['batch_size']])
+            if not pks:
+                break
+            rebuild_wishlist_snapshots(pks)
+            count += len(pks)
+            last_pk = pks[-1]
+            if options['verbosity'] >= 2:
+                self.stdout.write('{} listas reconstruídas'.format(count))
+
+        self.stdout.write('{} listas reconstruídas em {:.2f}s'.format(count, time.monotonic() - started))
@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os contadores de listas de favoritos dos produtos a partir das listas de favoritos'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        fixed = Product.objects.reconcile_wishlist_counts()
+        self.stdout.write('{} produtos corrigidos em {:.2f}s'.format(fixed, time.monotonic() - started))
@@ -0,0 +1,301 @@
+import io
+import random
+import time
+from array import array
+from bisect import bisect
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from api.models import Customer, CustomerWishlistSnapshot, Product, ProductWishlistCount, Wishlist
+
+
+# Quantidades do conjunto de dados com --scale 1
+DEFAULT_PRODUCTS = 1000000
+DEFAULT_CUSTOMERS = 100000
+DEFAULT_WISHLISTS = 10000000
+
+# Identificam os registros gerados, que são numerados pela ordem de inclusão
+SKU_PREFIX = 'seed-'
+EMAIL_DOMAIN = '@seed.example.com'
+
+# Primo maior que qualquer quantidade de registros: i * STRIDE % n percorre as posições 0 a n - 1 em outra ordem,
+# espalhando os produtos mais populares e os clientes com mais favoritos por todo o catálogo
+STRIDE = 2654435761
+
+TITLE_NOUNS = ('Geladeira', 'Fogão', 'Cafeteira', 'Televisão', 'Ventilador', 'Liquidificador', 'Micro-ondas',
+               'Notebook', 'Smartphone', 'Aspirador', 'Batedeira', 'Ar-condicionado', 'Lavadora', 'Fritadeira')
+TITLE_ADJECTIVES = ('Inox', 'Frost Free', 'Digital', 'Portátil', 'Turbo', 'Slim', 'Smart', 'Premium', 'Compacto',
+                    'Bivolt')
+BRANDS = 500
+
+
+class IteratorFile(io.TextIOBase):
+    """
+    Arquivo somente leitura sobre um iterador de linhas, lido pelo COPY (cursor.copy_expert) à medida que os dados
+    são enviados ao banco de dados: as linhas são geradas sob demanda, sem acumular o lote em memória.
+    """
+    def __init__(self, lines):
+        self._lines = lines
+        self._buffer = ''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        for line in self._lines:
+            chunks.append(line)
+            length += len(line)
+            if 0 <= size <= length:
+                break
+        data = ''.join(chunks)
+        if size < 0:
+            self._buffer = ''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def product_line(index, updated_at):
+    """Produto da posição index, no formato texto do COPY. Os valores dependem apenas da posição."""
+    title = '{} {} {}'.format(TITLE_NOUNS[index % len(TITLE_NOUNS)],
+                              TITLE_ADJECTIVES[index * 7 % len(TITLE_ADJECTIVES)], index)
+    review_score = '\\N' if index % 10 == 0 else '{:.1f}'.format(index * 31 % 51 / 10)
+    return '{}{}\t{}\tMarca {}\t{:.2f}\thttps://example.com/seed/{}.jpg\t{}\t{}\t0\n'.format(
+        SKU_PREFIX, index, title, index * STRIDE % BRANDS, 1 + index * 7919 % 500000 / 100, index, review_score,
+        updated_at)
+
+
+def customer_line(index, updated_at):
+    """Cliente da posição index, no formato texto do COPY, com um e-mail único por posição."""
+    return 'Cliente {0}\tcliente{0}{1}\t{2}\t0\n'.format(index, EMAIL_DOMAIN, updated_at)
+
+
+class ZipfSampler:
+    """
+    Sorteia posições de 0 a size - 1 com a distribuição de Zipf: a posição de popularidade k (a partir de 1) tem
+    probabilidade proporcional a 1 / k ** exponent. A popularidade é mapeada para a posição com STRIDE.
+    """
+    def __init__(self, size, exponent):
+        self.size = size
+        # Probabilidades acumuladas, em um array de doubles (8 bytes por posição)
+        self.cumulative = array('d', accumulate(1.0 / rank ** exponent for rank in range(1, size + 1)))
+        self.total = self.cumulative[-1]
+
+    def position(self, rank):
+        return rank * STRIDE % self.size
+
+    def sample(self, rng, count):
+        """Sorteia count posições distintas."""
+        if count * 2 > self.size:
+            return [self.position(rank) for rank in rng.sample(range(self.size), count)]
+
+        chosen = set()
+        result = []
+        while len(result) < count:
+            rank = min(bisect(self.cumulative, rng.random() * self.total), self.size - 1)
+            if rank not in chosen:
+                chosen.add(rank)
+                result.append(self.position(rank))
+        return result
+
+
+class ListSizes:
+    """
+    Quantidade de produtos na lista de cada cliente, proporcional a 1 / k ** exponent pela popularidade k do cliente,
+    somando exatamente total (limitada à quantidade de produtos por cliente). Calculada em memória constante.
+    """
+    def __init__(self, customers, products, total, exponent):
+        self.customers = customers
+        self.products = products
+        self.total = total
+        self.exponent = exponent
+        self.weights = sum(self.weight(rank) for rank in range(customers))
+
+        # O arredondamento para baixo deixa um resto, distribuído entre os clientes mais populares
+        self.remainder = total - sum(self.base(rank) for rank in range(customers))
+
+    def weight(self, rank):
+        return 1.0 / (rank + 1) ** self.exponent
+
+    def base(self, rank):
+        return int(self.total * self.weight(rank) / self.weights)
+
+    def __call__(self, index):
+        rank = index * STRIDE % self.customers
+        return min(self.base(rank) + (1 if rank < self.remainder else 0), self.products)
+
+    def sum(self):
+        return sum(self(index) for index in range(self.customers))
+
+
+class Command(BaseCommand):
+    help = 'Gera produtos, clientes e listas de favoritos sintéticos e determinísticos, carregados com COPY'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Multiplica as quantidades padrão ({} produtos, {} clientes e {} produtos nas '
+                                 'listas de favoritos), padrão 1'.format(DEFAULT_PRODUCTS, DEFAULT_CUSTOMERS,
+                                                                         DEFAULT_WISHLISTS))
+        parser.add_argument('--products', type=int, help='Produtos gerados, padrão de acordo com --scale')
+        parser.add_argument('--customers', type=int, help='Clientes gerados, padrão de acordo com --scale')
+        parser.add_argument('--wishlists', type=int,
+                            help='Produtos nas listas de favoritos geradas, padrão de acordo com --scale')
+        parser.add_argument('--zipf', type=float, default=1.0,
+                            help='Expoente da distribuição de Zipf da popularidade dos produtos, padrão 1.0')
+        parser.add_argument('--list-zipf', type=float, default=0.6,
+                            help='Expoente da distribuição de Zipf do tamanho das listas dos clientes, padrão 0.6')
+        parser.add_argument('--random-seed', type=int, default=42, help='Semente dos sorteios, padrão 42')
+        parser.add_argument('--batch-size', type=int, default=100000,
+                            help='Linhas por COPY, cada um em uma transação, padrão 100000')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continua uma geração anterior, executada com as mesmas opções')
+        parser.add_argument('--truncate', action='store_true',
+                            help='Remove antes TODOS os produtos, clientes e listas de favoritos (TRUNCATE)')
+
+    def handle(self, *args, **options):
+        if options['resume'] and options['truncate']:
+            raise CommandError('Informe apenas --resume ou --truncate')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size deve ser maior que zero')
+
+        scale = options['scale']
+        products = options['products'] if options['products'] is not None else int(DEFAULT_PRODUCTS * scale)
+        customers = options['customers'] if options['customers'] is not None else int(DEFAULT_CUSTOMERS * scale)
+        wishlists = options['wishlists'] if options['wishlists'] is not None else int(DEFAULT_WISHLISTS * scale)
+        if wishlists and not (products and customers):
+            raise CommandError('As listas de favoritos precisam de produtos e clientes')
+        if wishlists > products * customers:
+            raise CommandError('Não há pares de cliente e produto suficientes para {} listas de favoritos'.format(
+                wishlists))
+
+        self.batch_size = options['batch_size']
+        self.resume = options['resume']
+        self.updated_at = timezone.now().isoformat()
+        if options['truncate']:
+            self.truncate()
+
+        started = time.monotonic()
+        self.seed_products(products)
+        self.seed_customers(customers)
+        if wishlists:
+            self.seed_wishlists(products, customers, wishlists, options)
+        self.stderr.write('Concluído em {:.1f}s'.format(time.monotonic() - started))
+
+    def truncate(self):
+        tables = [model._meta.db_table for model in (
+            Wishlist, ProductWishlistCount, CustomerWishlistSnapshot, Customer, Product)]
+        with connections[router.db_for_write(Product)].cursor() as cursor:
+            cursor.execute('TRUNCATE {} RESTART IDENTITY CASCADE'.format(', '.join(tables)))
+        self.stderr.write('Tabelas removidas: {}'.format(', '.join(tables)))
+
+    def start(self, label, existing, target):
+        """Posição a partir da qual os registros são gerados, verificando uma geração anterior."""
+        if existing and not self.resume:
+            raise CommandError('Já existem {} {} gerados: use --resume para continuar ou --truncate'.format(
+                existing, label))
+        if existing >= target:
+            self.stderr.write('{}: {} de {}, nada a gerar'.format(label, existing, target))
+        return existing
+
+    def copy(self, model, columns, groups, label, total, done=0):
+        """
+        Carrega as linhas com um COPY por lote, cada um em uma transação: um lote com erro não deixa registros
+        parciais e uma execução interrompida pode ser continuada com --resume. Cada grupo (lista de linhas) é
+        carregado inteiro no mesmo lote.
+        """
+        connection = connections[router.db_for_write(model)]
+        sql = 'COPY {} ({}) FROM STDIN'.format(model._meta.db_table, ', '.join(
+            model._meta.get_field(name).column for name in columns))
+        groups = iter(groups)
+        started = time.monotonic()
+
+        while True:
+            count = 0
+
+            def lines():
+                nonlocal count
+                for group in groups:
+                    yield from group
+                    count += len(group)
+                    if count >= self.batch_size:
+                        return
+
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.copy_expert(sql, IteratorFile(lines()))
+            done += count
+            if count:
+                self.stderr.write('{}: {} de {} ({:.0f} linhas/s)'.format(
+                    label, done, total, done / max(time.monotonic() - started, 1e-6)))
+            if count < self.batch_size:
+                return done
+
+    def seed_products(self, target):
+        existing = Product.objects.filter(sku__startswith=SKU_PREFIX).count()
+        start = self.start('produtos', existing, target)
+        self.copy(Product, ('sku', 'title', 'brand', 'price', 'image', 'review_score', 'updated_at',
+                            'wishlist_count'),
+                  ([product_line(index, self.updated_at)] for index in range(start, target)),
+                  'produtos', target, start)
+
+    def seed_customers(self, target):
+        existing = Customer.objects.filter(email__endswith=EMAIL_DOMAIN).count()
+        start = self.start('clientes', existing, target)
+        self.copy(Customer, ('name', 'email', 'updated_at', 'wishlist_version'),
+                  ([customer_line(index, self.updated_at)] for index in range(start, target)),
+                  'clientes', target, start)
+
+    def generated_pks(self, queryset, count):
+        """Ids dos primeiros count registros gerados, na ordem de geração, em um array de inteiros."""
+        return array('q', queryset.order_by('pk').values_list('pk', flat=True)[:count].iterator(chunk_size=10000))
+
+    def wishlist_start(self, customer_pks, sizes):
+        """
+        As listas são geradas na ordem dos clientes e cada lote contém listas inteiras, então os clientes com lista
+        formam um prefixo dos clientes com lista não vazia. Retorna a posição do primeiro cliente sem lista, com uma
+        busca binária (uma query pelo índice do cliente por passo).
+        """
+        candidates = array('q', (index for index in range(len(customer_pks)) if sizes(index)))
+        low, high = 0, len(candidates)
+        while low < high:
+            middle = (low + high) // 2
+            if Wishlist.objects.filter(customer_id=customer_pks[candidates[middle]]).exists():
+                low = middle + 1
+            else:
+                high = middle
+        return candidates[low] if low < len(candidates) else len(customer_pks)
+
+    def seed_wishlists(self, products, customers, target, options):
+        product_pks = self.generated_pks(Product.objects.filter(sku__startswith=SKU_PREFIX), products)
+        customer_pks = self.generated_pks(Customer.objects.filter(email__endswith=EMAIL_DOMAIN), customers)
+        if len(product_pks) < products or len(customer_pks) < customers:
+            raise CommandError('Produtos ou clientes gerados insuficientes para as listas de favoritos')
+
+        sizes = ListSizes(customers, products, target, options['list_zipf'])
+        start = self.start('clientes com listas de favoritos', self.wishlist_start(customer_pks, sizes), customers)
+        total = sizes.sum()
+        if total < target:
+            self.stderr.write('Listas limitadas a {} produtos por cliente: {} produtos nas listas'.format(
+                products, total))
+        sampler = ZipfSampler(products, options['zipf'])
+        seed = options['random_seed']
+
+        def customer_rows(index):
+            # Cada cliente tem o seu próprio gerador, então a lista não depende dos clientes anteriores
+            rng = random.Random('{}-{}'.format(seed, index))
+            customer_pk = customer_pks[index]
+            return ['{}\t{}\t{}\n'.format(customer_pk, product_pks[position], self.updated_at)
+                    for position in sampler.sample(rng, sizes(index))]
+
+        done = sum(sizes(index) for index in range(start))
+        self.copy(Wishlist, ('customer', 'product', 'updated_at'),
+                  (customer_rows(index) for index in range(start, customers)),
+                  'listas de favoritos', total, done)
+
+        # Os contadores dos produtos são recalculados a partir das listas, com uma única instrução SQL
+        Product.objects.reconcile_wishlist_counts()
+        self.stderr.write('Contadores dos produtos recalculados')
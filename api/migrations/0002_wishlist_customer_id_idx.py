@@ -0,0 +1,21 @@
+# Generated by Django 3.2.3 on 2026-10-18 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='product',
+            options={'ordering': ['-id'], 'verbose_name': ('Produto',)},
+        ),
+        migrations.AddIndex(
+            model_name='wishlist',
+            index=models.Index(fields=['customer', 'id'], include=('product',), name='api_wishlist_customer_id_idx'),
+        ),
+    ]
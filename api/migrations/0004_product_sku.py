@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 13:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(blank=True, help_text='Código externo do Produto', max_length=100, null=True, unique=True, verbose_name='SKU'),
+        ),
+    ]
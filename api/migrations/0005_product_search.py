@@ -0,0 +1,78 @@
+# Generated by Django 3.2.3 on 2026-10-18 13:40
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations, models
+
+
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('portuguese', coalesce({row}.title, '')), 'A') || "
+    "setweight(to_tsvector('portuguese', coalesce({row}.brand, '')), 'B')"
+)
+
+CREATE_TRIGGER = """
+CREATE FUNCTION api_product_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {vector};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER api_product_search_vector_trigger BEFORE INSERT OR UPDATE OF title, brand ON api_product
+FOR EACH ROW EXECUTE PROCEDURE api_product_search_vector_update();
+
+UPDATE api_product SET search_vector = {backfill};
+""".format(vector=SEARCH_VECTOR.format(row='NEW'), backfill=SEARCH_VECTOR.format(row='api_product'))
+
+DROP_TRIGGER = """
+DROP TRIGGER api_product_search_vector_trigger ON api_product;
+DROP FUNCTION api_product_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+    # Os índices são criados com CREATE INDEX CONCURRENTLY, sem bloquear a escrita na tabela de produtos
+    atomic = False
+
+    dependencies = [
+        ('api', '0004_product_sku'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+        AddIndexConcurrently(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='api_product_search_gin'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='api_product_title_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(fields=['brand', 'id'], name='api_product_brand_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(fields=['brand', 'price', 'id'], name='api_product_brand_price_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(fields=['brand', 'review_score', 'id'], name='api_product_brand_review_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='api_product_price_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(fields=['review_score', 'id'], name='api_product_review_idx'),
+        ),
+    ]
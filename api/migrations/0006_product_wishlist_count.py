@@ -0,0 +1,54 @@
+# Generated by Django 3.2.3 on 2026-10-18 13:46
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BACKFILL_WISHLIST_COUNT = """
+UPDATE api_product p SET wishlist_count = c.n
+FROM (SELECT product_id, count(*) AS n FROM api_wishlist GROUP BY product_id) c
+WHERE p.id = c.product_id;
+"""
+
+
+class Migration(migrations.Migration):
+    # O índice é criado com CREATE INDEX CONCURRENTLY, sem bloquear a escrita na tabela de produtos
+    atomic = False
+
+    dependencies = [
+        ('api', '0005_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductWishlistCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.SmallIntegerField()),
+                ('delta', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Parcela do contador de listas de favoritos',
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='wishlist_count',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Quantidade de listas de favoritos'),
+        ),
+        migrations.RunSQL(BACKFILL_WISHLIST_COUNT, migrations.RunSQL.noop),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(fields=['wishlist_count', 'id'], name='api_product_wishlist_count_idx'),
+        ),
+        migrations.AddField(
+            model_name='productwishlistcount',
+            name='product',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.product'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productwishlistcount',
+            unique_together={('product', 'shard')},
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.3 on 2026-10-18 13:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_product_wishlist_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerWishlistSnapshot',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='wishlist_snapshot', serialize=False, to='api.customer')),
+                ('wishlist_version', models.BigIntegerField(verbose_name='Versão da lista de favoritos')),
+                ('data', models.JSONField(default=list, verbose_name='Lista serializada')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Lista de favoritos serializada',
+            },
+        ),
+    ]
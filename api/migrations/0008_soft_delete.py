@@ -0,0 +1,52 @@
+# Generated by Django 3.2.3 on 2026-10-18 15:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_customer_wishlist_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('customer', 'Cliente'), ('product', 'Produto')], max_length=20, verbose_name='Modelo')),
+                ('object_id', models.BigIntegerField(verbose_name='Id')),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('running', 'Em execução'), ('done', 'Concluído'), ('failed', 'Falhou')], default='pending', max_length=10, verbose_name='Status')),
+                ('total', models.BigIntegerField(default=0, verbose_name='Itens estimados')),
+                ('deleted', models.BigIntegerField(default=0, verbose_name='Itens removidos')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Tentativas')),
+                ('error', models.TextField(blank=True, verbose_name='Erro')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Reservado até')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Iniciado em')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Concluído em')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Remoção em segundo plano',
+            },
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Removido em'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Removido em'),
+        ),
+        migrations.AddIndex(
+            model_name='deletionjob',
+            index=models.Index(fields=['status', 'id'], name='api_deletionjob_status_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='deletionjob',
+            unique_together={('model', 'object_id')},
+        ),
+    ]
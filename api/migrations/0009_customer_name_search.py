@@ -0,0 +1,22 @@
+# Generated by Django 3.2.3 on 2026-10-18 15:17
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # O índice é criado com CREATE INDEX CONCURRENTLY, sem bloquear a escrita na tabela de clientes
+    atomic = False
+
+    dependencies = [
+        ('api', '0008_soft_delete'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='customer',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('name', config='simple'), name='api_customer_name_search_gin'),
+        ),
+    ]
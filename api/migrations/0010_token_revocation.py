@@ -0,0 +1,35 @@
+# Generated by Django 3.2.3 on 2026-10-18 15:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('api', '0009_customer_name_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('jti', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Token revogado',
+            },
+        ),
+        migrations.CreateModel(
+            name='TokenCutoff',
+            fields=[
+                ('user', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='+', serialize=False, to='auth.user')),
+                ('not_before', models.BigIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Revogação dos tokens do usuário',
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.3 on 2026-10-18 15:44
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # O índice é criado com CREATE INDEX CONCURRENTLY, sem bloquear a escrita na tabela de produtos
+    atomic = False
+
+    dependencies = [
+        ('api', '0010_token_revocation'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='api_product_deleted_at_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.3 on 2026-10-18 16:20
+
+from django.db import migrations
+
+
+# A versão da lista de favoritos nunca diminui: uma gravação com uma versão anterior (ex.: de um cliente carregado
+# antes de uma inclusão) mantém a versão atual, e a lista serializada da versão anterior continua inválida
+CREATE_TRIGGER = """
+CREATE FUNCTION api_customer_wishlist_version_update() RETURNS trigger AS $$
+BEGIN
+    NEW.wishlist_version := GREATEST(NEW.wishlist_version, OLD.wishlist_version);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER api_customer_wishlist_version_trigger BEFORE UPDATE OF wishlist_version ON api_customer
+FOR EACH ROW EXECUTE PROCEDURE api_customer_wishlist_version_update();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER api_customer_wishlist_version_trigger ON api_customer;
+DROP FUNCTION api_customer_wishlist_version_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_product_deleted_at_idx'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+    ]
@@ -1,7 +1,193 @@
-from django.db import models
+import csv
+import json
+from datetime import timedelta
+from io import StringIO
 
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import connections, models, router, transaction
+from django.dispatch import Signal
+from django.utils import timezone
 
-class Product(models.Model):
+
+class ActiveManager(models.Manager):
+    """
+    Manager que oculta os registros removidos (deleted_at preenchido), que aguardam a remoção definitiva em segundo
+    plano (DeletionJob). Os registros removidos são acessados por all_objects.
+    """
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class ServerFieldsMixin:
+    """
+    Modelo com colunas mantidas pelo servidor (server_fields), alteradas apenas por instruções SQL próprias. O save()
+    de um objeto existente grava apenas as demais colunas: um objeto carregado antes de uma destas alterações (ex.: o
+    PUT da API ou o admin) não grava de volta os valores anteriores.
+    """
+    server_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.server_fields]
+        super().save(*args, **kwargs)
+
+
+class SoftDeleteMixin(ServerFieldsMixin):
+    """
+    Modelo com remoção em segundo plano (deleted_at, api.core.deletion.soft_delete), que deve declarar deleted_at em
+    server_fields. O save() de um objeto carregado antes da remoção falha com DoesNotExist, em vez de restaurá-lo
+    enquanto o DeletionJob remove os itens das listas de favoritos que dependem dele.
+    """
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        updated = super()._do_update(base_qs.filter(deleted_at__isnull=True), using, pk_val, values, update_fields,
+                                     forced_update)
+        if not updated and not self._state.adding:
+            raise self.DoesNotExist('{} {} foi removido.'.format(self._meta.object_name, pk_val))
+        return updated
+
+
+class ProductManager(ActiveManager):
+    """
+    Manager de produtos, com a importação em lote: as linhas são carregadas com COPY em uma tabela temporária e
+    incluídas ou atualizadas com um único INSERT ... ON CONFLICT pelo SKU.
+    """
+    # Colunas importadas, na ordem das tuplas recebidas por import_rows
+    import_fields = ('sku', 'title', 'brand', 'price', 'image', 'review_score')
+    staging_table = 'api_product_import'
+
+    def _db_for_write(self):
+        return self._db or router.db_for_write(self.model)
+
+    def import_rows(self, rows):
+        """
+        Inclui ou atualiza os produtos pelo SKU. Cada linha é uma tupla com o número da linha no arquivo de origem
+        seguido dos valores de import_fields, já validados. Quando o mesmo SKU aparece mais de uma vez, prevalece a
+        última linha. Produtos sem alteração não são atualizados. Os produtos removidos, que aguardam a remoção
+        definitiva (DeletionJob), não são atualizados: as suas linhas são retornadas para serem rejeitadas.
+        Retorna uma tupla com a lista de ids incluídos, a lista de ids atualizados e a lista dos números das linhas
+        de produtos removidos. O SKU é obrigatório: as linhas sem SKU seriam agrupadas em um único produto pelo
+        DISTINCT ON.
+        """
+        missing = [row[0] for row in rows if row[1] is None]
+        if missing:
+            raise ValueError('Linhas sem SKU: {}'.format(', '.join(str(line) for line in missing)))
+
+        db = self._db_for_write()
+        connection = connections[db]
+        meta = self.model._meta
+        fields = [meta.get_field(name) for name in self.import_fields]
+        columns = [field.column for field in fields]
+        updated_at = meta.get_field('updated_at').column
+        wishlist_count = meta.get_field('wishlist_count').column
+        deleted_at = meta.get_field('deleted_at').column
+
+        buffer = StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+
+        staging = self.staging_table
+        upsert = (
+            'INSERT INTO {table} ({columns}, {updated_at}, {wishlist_count}) '
+            'SELECT DISTINCT ON (s.{sku}) {staging_columns}, now(), 0 FROM {staging} s ORDER BY s.{sku}, s.line DESC '
+            'ON CONFLICT ({sku}) DO UPDATE SET {set_columns}, {updated_at} = EXCLUDED.{updated_at} '
+            'WHERE {table}.{deleted_at} IS NULL AND ({current}) IS DISTINCT FROM ({excluded}) '
+            'RETURNING {pk}, xmax = 0'
+        ).format(
+            table=meta.db_table, pk=meta.pk.column, sku=columns[0], updated_at=updated_at,
+            wishlist_count=wishlist_count, deleted_at=deleted_at, staging=staging, columns=', '.join(columns),
+            staging_columns=', '.join('s.' + column for column in columns),
+            set_columns=', '.join('{0} = EXCLUDED.{0}'.format(column) for column in columns[1:]),
+            current=', '.join('{}.{}'.format(meta.db_table, column) for column in columns[1:]),
+            excluded=', '.join('EXCLUDED.' + column for column in columns[1:]),
+        )
+
+        with transaction.atomic(using=db), connection.cursor() as cursor:
+            # A tabela temporária existe apenas na transação corrente e não gera WAL. Removida no commit, não fica na
+            # conexão do servidor, que pode ser compartilhada com outros clientes pelo PgBouncer
+            cursor.execute('CREATE TEMP TABLE IF NOT EXISTS {} (line integer, {}) ON COMMIT DROP'.format(
+                staging, ', '.join('{} {}'.format(field.column, field.db_type(connection)) for field in fields)))
+            cursor.execute('TRUNCATE {}'.format(staging))
+            cursor.copy_expert('COPY {} (line, {}) FROM STDIN WITH (FORMAT csv)'.format(
+                staging, ', '.join(columns)), buffer)
+            cursor.execute(upsert)
+            result = cursor.fetchall()
+            cursor.execute(
+                'SELECT s.line FROM {staging} s JOIN {table} p ON p.{sku} = s.{sku} '
+                'WHERE p.{deleted_at} IS NOT NULL ORDER BY s.line'.format(
+                    staging=staging, table=meta.db_table, sku=columns[0], deleted_at=deleted_at))
+            deleted = [line for line, in cursor.fetchall()]
+
+        return [pk for pk, inserted in result if inserted], [pk for pk, inserted in result if not inserted], deleted
+
+    def brands(self, limit=None):
+        """
+        Marcas dos produtos, distintas e em ordem alfabética, até limit marcas. Cada marca é lida com uma busca no
+        índice (brand, id) a partir da anterior (loose index scan), em vez de um DISTINCT sobre todos os produtos: o
+        custo depende da quantidade de marcas e não da quantidade de produtos.
+        """
+        meta = self.model._meta
+        sql = (
+            'WITH RECURSIVE b AS ('
+            '(SELECT {brand} FROM {table} WHERE {deleted_at} IS NULL ORDER BY {brand} LIMIT 1) '
+            'UNION ALL '
+            'SELECT (SELECT p.{brand} FROM {table} p WHERE p.{brand} > b.{brand} AND p.{deleted_at} IS NULL '
+            'ORDER BY p.{brand} LIMIT 1) FROM b WHERE b.{brand} IS NOT NULL'
+            ') SELECT {brand} FROM b WHERE {brand} IS NOT NULL LIMIT %s'
+        ).format(table=meta.db_table, brand=meta.get_field('brand').column,
+                 deleted_at=meta.get_field('deleted_at').column)
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, [limit])
+            return [brand for brand, in cursor.fetchall()]
+
+    def _counter_sql(self, template):
+        meta = self.model._meta
+        shard_meta = ProductWishlistCount._meta
+        return template.format(
+            table=meta.db_table, pk=meta.pk.column, count=meta.get_field('wishlist_count').column,
+            shard_table=shard_meta.db_table, shard_product=shard_meta.get_field('product').column,
+            delta=shard_meta.get_field('delta').column, wishlist_table=Wishlist._meta.db_table,
+            wishlist_product=Wishlist._meta.get_field('product').column,
+        )
+
+    def merge_wishlist_counts(self):
+        """
+        Soma as parcelas pendentes (ProductWishlistCount) em Product.wishlist_count e as remove, com uma única
+        instrução SQL. Parcelas alteradas por inclusões concorrentes são somadas com o valor atualizado.
+        Retorna a quantidade de produtos atualizados.
+        """
+        sql = self._counter_sql(
+            'WITH d AS (DELETE FROM {shard_table} RETURNING {shard_product} AS product_id, {delta} AS delta), '
+            's AS (SELECT product_id, sum(delta) AS delta FROM d GROUP BY product_id) '
+            'UPDATE {table} p SET {count} = p.{count} + s.delta FROM s WHERE p.{pk} = s.product_id AND s.delta <> 0'
+        )
+        with connections[self._db_for_write()].cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.rowcount
+
+    def reconcile_wishlist_counts(self):
+        """
+        Recalcula Product.wishlist_count a partir da lista de favoritos, com uma única instrução SQL, e descarta as
+        parcelas pendentes. As inclusões e remoções concorrentes aguardam o fim do recálculo.
+        Retorna a quantidade de produtos corrigidos.
+        """
+        sql = self._counter_sql(
+            'WITH d AS (DELETE FROM {shard_table}), '
+            'c AS (SELECT {wishlist_product} AS product_id, count(*) AS n FROM {wishlist_table} '
+            'GROUP BY {wishlist_product}) '
+            'UPDATE {table} p SET {count} = coalesce(c.n, 0) FROM {table} t LEFT JOIN c ON c.product_id = t.{pk} '
+            'WHERE p.{pk} = t.{pk} AND p.{count} <> coalesce(c.n, 0)'
+        )
+        db = self._db_for_write()
+        with transaction.atomic(using=db), connections[db].cursor() as cursor:
+            cursor.execute(self._counter_sql('LOCK TABLE {shard_table} IN EXCLUSIVE MODE'))
+            cursor.execute(sql)
+            return cursor.rowcount
+
+
+class Product(SoftDeleteMixin, models.Model):
     """
     Modelo Produto
     """
@@ -13,18 +199,54 @@ class Product(models.Model):
                              help_text='Nome do Produto')
     review_score = models.FloatField(null=True, blank=True, verbose_name='Média dos reviews', 
                                      help_text='Média dos reviews para este Produto')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Atualizado em')
+
+    # Código do produto no catálogo externo, chave usada pela importação (manage.py import_products)
+    sku = models.CharField(max_length=100, unique=True, null=True, blank=True, verbose_name='SKU',
+                           help_text='Código externo do Produto')
+
+    # Título e marca para a busca textual, mantido por uma trigger no banco de dados (inclusive na importação)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Quantidade de listas de favoritos que contém o produto. As inclusões e remoções gravam parcelas em
+    # ProductWishlistCount, somadas periodicamente por manage.py merge_wishlist_counts
+    wishlist_count = models.BigIntegerField(default=0, editable=False, verbose_name='Quantidade de listas de favoritos')
+
+    # Data da remoção: o produto deixa de ser listado e é removido definitivamente, com as listas de favoritos que o
+    # contêm, por um DeletionJob
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name='Removido em')
 
     class Meta:
         verbose_name = 'Produto',
         ordering = ['-id']
 
+        # Cada combinação de filtro e ordenação da listagem (api.filters.ProductFilter) usa um destes índices
+        indexes = [
+            GinIndex(fields=['search_vector'], name='api_product_search_gin'),
+            GinIndex(fields=['title'], opclasses=['gin_trgm_ops'], name='api_product_title_trgm'),
+            models.Index(fields=['brand', 'id'], name='api_product_brand_id_idx'),
+            models.Index(fields=['brand', 'price', 'id'], name='api_product_brand_price_idx'),
+            models.Index(fields=['brand', 'review_score', 'id'], name='api_product_brand_review_idx'),
+            models.Index(fields=['price', 'id'], name='api_product_price_idx'),
+            models.Index(fields=['review_score', 'id'], name='api_product_review_idx'),
+            models.Index(fields=['wishlist_count', 'id'], name='api_product_wishlist_count_idx'),
+            # Produtos removidos que aguardam a remoção definitiva (api.core.snapshot)
+            models.Index(fields=['deleted_at'], name='api_product_deleted_at_idx',
+                         condition=models.Q(deleted_at__isnull=False)),
+        ]
+
+    # O vetor de busca é mantido pela trigger, o contador pelas parcelas e pela reconciliação e a data da remoção por
+    # soft_delete
+    server_fields = ('search_vector', 'wishlist_count', 'deleted_at')
+
     def __str__(self):
         return 'Produto {} da Marca {} com preço de R$ {}'.format(self.title, self.brand, self.price)
 
-    objects = models.Manager()
+    objects = ProductManager()
+    all_objects = models.Manager()
 
 
-class Customer(models.Model):
+class Customer(SoftDeleteMixin, models.Model):
     """
     Modelo Cliente
     """
@@ -39,13 +261,289 @@ class Customer(models.Model):
     # e que a lista de produtos tenha uma quantidade ilimitada de produtos.
     wish_list = models.ManyToManyField(Product, through='Wishlist')
 
+    # Data da última alteração do cliente ou da sua lista de favoritos, e versão da lista de favoritos, incrementada a
+    # cada inclusão ou remoção. Usadas para responder requisições condicionais (ETag / Last-Modified). Uma trigger no
+    # banco de dados impede que a versão diminua (migração 0012)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Atualizado em')
+    wishlist_version = models.PositiveIntegerField(default=0, editable=False, verbose_name='Versão da lista de favoritos')
+
+    # Data da remoção: o cliente deixa de ser listado e é removido definitivamente, com a sua lista de favoritos, por
+    # um DeletionJob
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name='Removido em')
+
     class Meta:
         verbose_name = 'Cliente'
 
+        # Busca por prefixo das palavras do nome no admin (api.filters.search_customers)
+        indexes = [
+            GinIndex(SearchVector('name', config='simple'), name='api_customer_name_search_gin'),
+        ]
+
+    # A versão da lista é incrementada apenas pelo WishlistManager e a data da remoção é gravada por soft_delete
+    server_fields = ('wishlist_version', 'deleted_at')
+
     def __str__(self):
         return self.name
 
-    objects = models.Manager()
+    objects = ActiveManager()
+    all_objects = models.Manager()
+
+
+# Enviado após a inclusão ou remoção de produtos das listas de favoritos, com os clientes alterados (customer_ids) e o
+# banco de dados (using)
+wishlist_changed = Signal()
+
+
+class WishlistManager(models.Manager):
+    """
+    Manager da lista de produtos favoritos, com operações em lote baseadas em conjuntos (uma instrução SQL por lote).
+
+    Toda inclusão ou remoção também incrementa a versão da lista do cliente (Customer.wishlist_version) na mesma
+    instrução SQL.
+    """
+    INSERTED = 'inserted'
+    DUPLICATE = 'duplicate'
+    MISSING_CUSTOMER = 'missing_customer'
+    MISSING_PRODUCT = 'missing_product'
+    REMOVED = 'removed'
+    NOT_FOUND = 'not_found'
+
+    batch_size = 5000
+
+    # CTE que incrementa a versão da lista dos clientes afetados pelas linhas retornadas pela CTE {source}. Os clientes
+    # são bloqueados em ordem crescente do id (SELECT ... ORDER BY ... FOR NO KEY UPDATE, o mesmo lock do UPDATE) antes
+    # da alteração: instruções concorrentes com clientes em comum aguardam umas às outras, sem deadlock
+    touch_customers_sql = (
+        'UPDATE {customer_table} c SET {wishlist_version} = c.{wishlist_version} + 1, {customer_updated_at} = now() '
+        'FROM (SELECT {customer_pk} AS id FROM {customer_table} '
+        'WHERE {customer_pk} IN (SELECT {customer} FROM {source}) ORDER BY {customer_pk} FOR NO KEY UPDATE) d '
+        'WHERE c.{customer_pk} = d.id'
+    )
+
+    # CTE que soma (ou subtrai, com sign='-') as linhas da CTE {source} em uma parcela aleatória do contador de cada
+    # produto, evitando que inclusões concorrentes do mesmo produto disputem o lock de uma única linha
+    count_products_sql = (
+        'INSERT INTO {shard_table} ({shard_product}, {shard}, {delta}) '
+        'SELECT {product}, floor(random() * {shards})::integer, {sign}count(*) FROM {source} GROUP BY {product} '
+        'ON CONFLICT ({shard_product}, {shard}) DO UPDATE SET {delta} = {shard_table}.{delta} + EXCLUDED.{delta}'
+    )
+
+    def _db_for_write(self):
+        return self._db or router.db_for_write(self.model)
+
+    def _sql(self, template, **kwargs):
+        """Formata o SQL com os nomes das tabelas e colunas dos modelos."""
+        meta = self.model._meta
+        names = {
+            'table': meta.db_table,
+            'pk': meta.pk.column,
+            'customer': meta.get_field('customer').column,
+            'product': meta.get_field('product').column,
+            'updated_at': meta.get_field('updated_at').column,
+            'customer_table': Customer._meta.db_table,
+            'customer_pk': Customer._meta.pk.column,
+            'customer_updated_at': Customer._meta.get_field('updated_at').column,
+            'customer_deleted_at': Customer._meta.get_field('deleted_at').column,
+            'wishlist_version': Customer._meta.get_field('wishlist_version').column,
+            'product_table': Product._meta.db_table,
+            'product_pk': Product._meta.pk.column,
+            'product_deleted_at': Product._meta.get_field('deleted_at').column,
+            'shard_table': ProductWishlistCount._meta.db_table,
+            'shard_product': ProductWishlistCount._meta.get_field('product').column,
+            'shard': ProductWishlistCount._meta.get_field('shard').column,
+            'delta': ProductWishlistCount._meta.get_field('delta').column,
+            'shards': ProductWishlistCount.shards,
+            'sign': '',
+        }
+        names.update(kwargs)
+        if 'source' in names:
+            names['touch_customers'] = self.touch_customers_sql.format(**names)
+            names['count_products'] = self.count_products_sql.format(**names)
+        return template.format(**names)
+
+    def _changed(self, customer_ids):
+        customer_ids = set(customer_ids)
+        if customer_ids:
+            wishlist_changed.send(sender=self.model, customer_ids=customer_ids, using=self._db_for_write())
+
+    def _execute_batches(self, sql, pairs):
+        """Executa o SQL para cada lote de pares, retornando os pares devolvidos pelo RETURNING."""
+        pairs = list(pairs)
+        result = set()
+        with connections[self._db_for_write()].cursor() as cursor:
+            for start in range(0, len(pairs), self.batch_size):
+                batch = pairs[start:start + self.batch_size]
+                cursor.execute(sql, [[customer for customer, _ in batch], [product for _, product in batch]])
+                result.update(cursor.fetchall())
+        return result
+
+    def add(self, customer_id, product_id):
+        """
+        Inclui um produto na lista de favoritos do cliente com uma única instrução SQL (um round trip): valida o
+        cliente e o produto e executa INSERT ... ON CONFLICT DO NOTHING RETURNING. Inclusões concorrentes do mesmo
+        produto não geram erro de integridade, apenas uma delas é incluída.
+        Retorna uma tupla com o status e o objeto incluído (ou None, caso não tenha sido incluído).
+        """
+        sql = self._sql(
+            'WITH c AS (SELECT {customer_pk} AS id FROM {customer_table} WHERE {customer_pk} = %s '
+            'AND {customer_deleted_at} IS NULL), '
+            'p AS (SELECT {product_pk} AS id FROM {product_table} WHERE {product_pk} = %s '
+            'AND {product_deleted_at} IS NULL), '
+            'i AS (INSERT INTO {table} ({customer}, {product}, {updated_at}) SELECT c.id, p.id, now() FROM c, p '
+            'ON CONFLICT ({customer}, {product}) DO NOTHING RETURNING {pk}, {customer}, {product}, {updated_at}), '
+            'v AS ({touch_customers}), '
+            'n AS ({count_products}) '
+            'SELECT (SELECT id FROM c), (SELECT id FROM p), (SELECT {pk} FROM i), (SELECT {updated_at} FROM i)',
+            source='i',
+        )
+        db = self._db_for_write()
+        with connections[db].cursor() as cursor:
+            cursor.execute(sql, [customer_id, product_id])
+            found_customer, found_product, pk, updated_at = cursor.fetchone()
+
+        if found_customer is None:
+            return self.MISSING_CUSTOMER, None
+        if found_product is None:
+            return self.MISSING_PRODUCT, None
+        if pk is None:
+            return self.DUPLICATE, None
+        self._changed([customer_id])
+        return self.INSERTED, self.model.from_db(db, ['id', 'customer_id', 'product_id', 'updated_at'],
+                                                 [pk, customer_id, product_id, updated_at])
+
+    def bulk_add(self, pairs):
+        """
+        Inclui os pares (cliente, produto) na lista de favoritos. Os clientes e produtos são validados com uma query
+        IN por tabela, e os pares válidos são incluídos com INSERT ... ON CONFLICT DO NOTHING RETURNING, que informa
+        exatamente quais pares foram incluídos, mesmo com inclusões concorrentes.
+        Retorna o status de cada par, na mesma ordem recebida.
+        """
+        pairs = [(int(customer), int(product)) for customer, product in pairs]
+        customers = set(Customer.objects.filter(pk__in={c for c, _ in pairs}).values_list('pk', flat=True))
+        products = set(Product.objects.filter(pk__in={p for _, p in pairs}).values_list('pk', flat=True))
+        valid = {(c, p) for c, p in pairs if c in customers and p in products}
+
+        sql = self._sql(
+            'WITH i AS (INSERT INTO {table} ({customer}, {product}, {updated_at}) '
+            'SELECT t.customer_id, t.product_id, now() FROM unnest(%s::bigint[], %s::bigint[]) '
+            'AS t(customer_id, product_id) '
+            'ON CONFLICT ({customer}, {product}) DO NOTHING RETURNING {customer}, {product}), '
+            'v AS ({touch_customers}), '
+            'n AS ({count_products}) '
+            'SELECT {customer}, {product} FROM i',
+            source='i',
+        )
+        with transaction.atomic(using=self._db_for_write()):
+            inserted = self._execute_batches(sql, valid)
+        self._changed(customer for customer, _ in inserted)
+
+        statuses = []
+        for pair in pairs:
+            if pair[0] not in customers:
+                statuses.append(self.MISSING_CUSTOMER)
+            elif pair[1] not in products:
+                statuses.append(self.MISSING_PRODUCT)
+            elif pair in inserted:
+                statuses.append(self.INSERTED)
+
+                # Pares repetidos na mesma requisição são incluídos apenas uma vez
+                inserted.discard(pair)
+            else:
+                statuses.append(self.DUPLICATE)
+        return statuses
+
+    def bulk_remove(self, pairs):
+        """
+        Remove os pares (cliente, produto) da lista de favoritos com um único DELETE por lote.
+        Retorna o status de cada par, na mesma ordem recebida.
+        """
+        pairs = [(int(customer), int(product)) for customer, product in pairs]
+
+        sql = self._sql(
+            'WITH d AS (DELETE FROM {table} w USING unnest(%s::bigint[], %s::bigint[]) AS t(customer_id, product_id) '
+            'WHERE w.{customer} = t.customer_id AND w.{product} = t.product_id '
+            'RETURNING w.{customer}, w.{product}), '
+            'v AS ({touch_customers}), '
+            'n AS ({count_products}) '
+            'SELECT {customer}, {product} FROM d',
+            source='d', sign='-',
+        )
+        with transaction.atomic(using=self._db_for_write()):
+            removed = self._execute_batches(sql, set(pairs))
+        self._changed(customer for customer, _ in removed)
+
+        statuses = []
+        for pair in pairs:
+            if pair in removed:
+                statuses.append(self.REMOVED)
+                removed.discard(pair)
+            else:
+                statuses.append(self.NOT_FOUND)
+        return statuses
+
+    def purge(self, field_name, object_id, limit):
+        """
+        Remove até limit itens das listas de favoritos do cliente ou produto (field_name 'customer' ou 'product') com
+        uma única instrução SQL, pelo índice da chave estrangeira, incrementando a versão das listas dos clientes e
+        atualizando os contadores dos produtos. Usado na remoção definitiva em lotes (DeletionJob).
+        Retorna a quantidade de itens removidos.
+        """
+        sql = self._sql(
+            'WITH d AS (DELETE FROM {table} w WHERE w.{pk} IN '
+            '(SELECT {pk} FROM {table} WHERE {column} = %s LIMIT %s) RETURNING w.{customer}, w.{product}), '
+            'v AS ({touch_customers}), '
+            'n AS ({count_products}) '
+            'SELECT {customer} FROM d',
+            source='d', sign='-', column=self.model._meta.get_field(field_name).column,
+        )
+        with connections[self._db_for_write()].cursor() as cursor:
+            cursor.execute(sql, [object_id, limit])
+            customer_ids = [customer for customer, in cursor.fetchall()]
+        self._changed(customer_ids)
+        return len(customer_ids)
+
+    def count_products(self, deltas):
+        """
+        Soma as variações {produto: variação} nos contadores dos produtos, usado nas alterações feitas pelo ORM.
+        """
+        deltas = {product: delta for product, delta in deltas.items() if delta}
+        if not deltas:
+            return
+
+        sql = self._sql(
+            'INSERT INTO {shard_table} ({shard_product}, {shard}, {delta}) '
+            'SELECT t.product_id, floor(random() * {shards})::integer, t.delta '
+            'FROM unnest(%s::bigint[], %s::bigint[]) AS t(product_id, delta) '
+            'ON CONFLICT ({shard_product}, {shard}) DO UPDATE SET {delta} = {shard_table}.{delta} + EXCLUDED.{delta}'
+        )
+        with connections[self._db_for_write()].cursor() as cursor:
+            cursor.execute(sql, [list(deltas), list(deltas.values())])
+
+    def touch_customers(self, customer_ids):
+        """Incrementa a versão da lista de favoritos dos clientes, usado nas alterações feitas pelo ORM."""
+        customer_ids = set(customer_ids)
+        Customer.objects.filter(pk__in=customer_ids).update(
+            wishlist_version=models.F('wishlist_version') + 1, updated_at=timezone.now())
+        self._changed(customer_ids)
+
+    def touch_product_customers(self, product_ids):
+        """
+        Incrementa a versão da lista de favoritos dos clientes que possuem algum dos produtos, usado quando os
+        produtos são alterados: a lista serializada dos clientes (CustomerWishlistSnapshot) deixa de ser válida.
+        Sem WISHLIST_SNAPSHOT não há listas serializadas, e os clientes não são alterados.
+
+        Os clientes são atualizados em lotes de batch_size, em ordem crescente do id: fora de uma transação, cada lote
+        mantém os locks apenas durante a sua própria instrução.
+        """
+        product_ids = set(product_ids)
+        if not product_ids or not getattr(settings, 'WISHLIST_SNAPSHOT', False):
+            return
+
+        customer_ids = list(self.filter(product_id__in=product_ids).order_by('customer_id').values_list(
+            'customer_id', flat=True).distinct())
+        for start in range(0, len(customer_ids), self.batch_size):
+            Customer.objects.filter(pk__in=customer_ids[start:start + self.batch_size]).update(
+                wishlist_version=models.F('wishlist_version') + 1, updated_at=timezone.now())
 
 
 class Wishlist(models.Model):
@@ -57,6 +555,8 @@ class Wishlist(models.Model):
     # Usar uma ForeignKey garante que apenas produtos existentes sejam adicionado na lista.
     product = models.ForeignKey(Product, on_delete=models.DO_NOTHING)
 
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Atualizado em')
+
     class Meta:
         verbose_name = 'Lista de Produtos Favorito'
 
@@ -64,7 +564,231 @@ class Wishlist(models.Model):
         # na lista de produtos favoritos de um cliente.
         unique_together = ['customer', 'product']
 
+        # Índice de cobertura para a listagem paginada da lista de um cliente (/api/customer/{id}/wishlist/): filtra
+        # pelo cliente, ordena pelo id e já contém o produto, sem precisar ler a tabela.
+        indexes = [
+            models.Index(fields=['customer', 'id'], include=['product'], name='api_wishlist_customer_id_idx'),
+        ]
+
     def __str__(self):
         return 'Cliente {} possui em sua lista de favoritos o produto {}'.format(self.customer.name, self.product.title)
 
-    objects = models.Manager()
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Guarda os valores carregados, permitindo identificar o cliente e produto anteriores em uma alteração
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Os valores gravados passam a ser os anteriores de uma próxima alteração da mesma instância
+        self._loaded_values = {'customer_id': self.customer_id, 'product_id': self.product_id}
+
+    objects = WishlistManager()
+
+
+class ProductWishlistCount(models.Model):
+    """
+    Parcela do contador de listas de favoritos de um produto. Cada inclusão ou remoção soma em uma das `shards`
+    parcelas do produto, escolhida aleatoriamente, e as parcelas são somadas em Product.wishlist_count e removidas
+    periodicamente (ProductManager.merge_wishlist_counts).
+    """
+    shards = 16
+
+    # Sem constraint no banco de dados: o produto pode ser removido com parcelas pendentes, que são descartadas
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    shard = models.SmallIntegerField()
+    delta = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Parcela do contador de listas de favoritos'
+        unique_together = ['product', 'shard']
+
+
+class CustomerWishlistSnapshotManager(models.Manager):
+    def _db_for_write(self):
+        return self._db or router.db_for_write(self.model)
+
+    def store(self, snapshots, updated_at=None):
+        """
+        Inclui ou atualiza as listas serializadas, uma sequência de tuplas (cliente, versão da lista, lista), com uma
+        única instrução SQL. Uma lista de versão mais antiga que a já armazenada é ignorada. updated_at é o início da
+        serialização das listas (por padrão, o momento da gravação).
+        """
+        snapshots = list(snapshots)
+        if not snapshots:
+            return
+
+        meta = self.model._meta
+        sql = (
+            'INSERT INTO {table} ({customer}, {version}, {data}, {updated_at}) '
+            'SELECT t.customer_id, t.version, t.data::jsonb, %s '
+            'FROM unnest(%s::bigint[], %s::bigint[], %s::text[]) AS t(customer_id, version, data) '
+            'ON CONFLICT ({customer}) DO UPDATE SET {version} = EXCLUDED.{version}, {data} = EXCLUDED.{data}, '
+            '{updated_at} = EXCLUDED.{updated_at} WHERE {table}.{version} <= EXCLUDED.{version}'
+        ).format(
+            table=meta.db_table, customer=meta.get_field('customer').column,
+            version=meta.get_field('wishlist_version').column, data=meta.get_field('data').column,
+            updated_at=meta.get_field('updated_at').column,
+        )
+        with connections[self._db_for_write()].cursor() as cursor:
+            cursor.execute(sql, [updated_at or timezone.now(), [customer for customer, _, _ in snapshots],
+                                 [version for _, version, _ in snapshots], [json.dumps(data) for _, _, data in snapshots]])
+
+
+class CustomerWishlistSnapshot(models.Model):
+    """
+    Lista de produtos favoritos serializada de um cliente, permitindo consultar o cliente com a sua lista com uma única
+    query pela chave primária. A lista é válida enquanto wishlist_version for igual à versão da lista do cliente, que é
+    incrementada a cada inclusão ou remoção e quando um dos produtos é alterado.
+    """
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, primary_key=True,
+                                    related_name='wishlist_snapshot')
+    wishlist_version = models.BigIntegerField(verbose_name='Versão da lista de favoritos')
+    data = models.JSONField(default=list, verbose_name='Lista serializada')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Atualizado em')
+
+    class Meta:
+        verbose_name = 'Lista de favoritos serializada'
+
+    objects = CustomerWishlistSnapshotManager()
+
+
+class RevokedTokenManager(models.Manager):
+    def _db_for_write(self):
+        return self._db or router.db_for_write(self.model)
+
+    def is_revoked(self, jti, user_pk, issued_at):
+        """
+        Verifica, com uma única query no banco principal, se o token foi revogado ou se os tokens do usuário emitidos
+        antes de issued_at (milissegundos desde a época) foram revogados.
+        """
+        meta, cutoff_meta = self.model._meta, TokenCutoff._meta
+        sql = (
+            'SELECT EXISTS (SELECT 1 FROM {table} WHERE {jti} = %s) '
+            'OR EXISTS (SELECT 1 FROM {cutoff_table} WHERE {user} = %s AND {not_before} > %s)'
+        ).format(table=meta.db_table, jti=meta.pk.column, cutoff_table=cutoff_meta.db_table,
+                 user=cutoff_meta.pk.column, not_before=cutoff_meta.get_field('not_before').column)
+        with connections[self._db_for_write()].cursor() as cursor:
+            cursor.execute(sql, [jti, user_pk, issued_at])
+            return cursor.fetchone()[0]
+
+    def revoke(self, jti, expires_at):
+        """Revoga o token até a sua expiração, removendo as revogações de tokens já expirados."""
+        db = self._db_for_write()
+        self.using(db).bulk_create([self.model(jti=jti, expires_at=expires_at)], ignore_conflicts=True)
+        self.using(db).filter(expires_at__lt=timezone.now()).delete()
+
+    def revoke_user(self, user_pk, not_before):
+        """Revoga os tokens do usuário emitidos antes de not_before (milissegundos desde a época)."""
+        meta = TokenCutoff._meta
+        sql = (
+            'INSERT INTO {table} ({user}, {not_before}) VALUES (%s, %s) '
+            'ON CONFLICT ({user}) DO UPDATE SET {not_before} = GREATEST({table}.{not_before}, EXCLUDED.{not_before})'
+        ).format(table=meta.db_table, user=meta.pk.column, not_before=meta.get_field('not_before').column)
+        with connections[self._db_for_write()].cursor() as cursor:
+            cursor.execute(sql, [user_pk, not_before])
+
+
+class RevokedToken(models.Model):
+    """Token de acesso revogado (api.core.authentication), mantido até a sua expiração."""
+    jti = models.CharField(max_length=32, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = 'Token revogado'
+
+    objects = RevokedTokenManager()
+
+
+class TokenCutoff(models.Model):
+    """Revogação de todos os tokens de acesso do usuário emitidos antes de not_before (milissegundos desde a época)."""
+    # Sem constraint no banco de dados: a revogação dos tokens de um usuário removido é mantida
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False,
+                                primary_key=True, related_name='+')
+    not_before = models.BigIntegerField()
+
+    class Meta:
+        verbose_name = 'Revogação dos tokens do usuário'
+
+
+class DeletionJobManager(models.Manager):
+    def _db_for_write(self):
+        return self._db or router.db_for_write(self.model)
+
+    def enqueue(self, instance, total=0):
+        """Agenda a remoção definitiva do cliente ou produto removido. Um objeto possui no máximo um job."""
+        job, _ = self.get_or_create(model=instance._meta.model_name, object_id=instance.pk,
+                                    defaults={'total': total})
+        return job
+
+    def claim(self, lease_seconds):
+        """
+        Reserva o próximo job pendente, ou em execução com a reserva expirada (ex.: o processo foi encerrado), por
+        lease_seconds segundos. Os jobs reservados por outros processos são ignorados (SELECT ... FOR UPDATE SKIP
+        LOCKED), permitindo vários processos executando jobs.
+        """
+        now = timezone.now()
+        with transaction.atomic(using=self._db_for_write()):
+            job = self.select_for_update(skip_locked=True).filter(
+                models.Q(status=DeletionJob.PENDING) | models.Q(status=DeletionJob.RUNNING, locked_until__lt=now)
+            ).order_by('id').first()
+            if job is None:
+                return None
+
+            job.status = DeletionJob.RUNNING
+            job.attempts += 1
+            job.started_at = job.started_at or now
+            job.locked_until = now + timedelta(seconds=lease_seconds)
+            job.save(update_fields=['status', 'attempts', 'started_at', 'locked_until', 'updated_at'])
+        return job
+
+
+class DeletionJob(models.Model):
+    """
+    Remoção definitiva, em segundo plano, de um cliente ou produto removido (deleted_at) e dos itens das listas de
+    favoritos que dependem dele, em lotes de tamanho limitado, cada um em uma transação curta
+    (manage.py purge_deleted). O job é a fila, no próprio banco de dados, e registra o progresso da remoção.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    model = models.CharField(max_length=20, choices=[('customer', 'Cliente'), ('product', 'Produto')],
+                             verbose_name='Modelo')
+    object_id = models.BigIntegerField(verbose_name='Id')
+    status = models.CharField(max_length=10, default=PENDING, verbose_name='Status', choices=[
+        (PENDING, 'Pendente'), (RUNNING, 'Em execução'), (DONE, 'Concluído'), (FAILED, 'Falhou')])
+
+    # Itens das listas de favoritos: estimativa no agendamento e removidos até agora
+    total = models.BigIntegerField(default=0, verbose_name='Itens estimados')
+    deleted = models.BigIntegerField(default=0, verbose_name='Itens removidos')
+
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Tentativas')
+    error = models.TextField(blank=True, verbose_name='Erro')
+    locked_until = models.DateTimeField(null=True, blank=True, verbose_name='Reservado até')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Criado em')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='Iniciado em')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Concluído em')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Atualizado em')
+
+    class Meta:
+        verbose_name = 'Remoção em segundo plano'
+        unique_together = ['model', 'object_id']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='api_deletionjob_status_idx'),
+        ]
+
+    def __str__(self):
+        return 'Remoção do {} {}'.format(self.get_model_display().lower(), self.object_id)
+
+    @property
+    def progress(self):
+        """Percentual removido dos itens estimados."""
+        if self.status == self.DONE:
+            return 100.0
+        return min(99.9, 100.0 * self.deleted / self.total) if self.total else 0.0
+
+    objects = DeletionJobManager()
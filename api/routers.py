@@ -1,10 +1,28 @@
+from django.urls import re_path
 from rest_framework import routers
 
 from api import views
+from api.core.asynchronous import AsyncReadView
 
 
 router = routers.DefaultRouter()
 router.register(r'customer', views.CustomerViewSet)
 router.register(r'wishlist', views.WishListViewSet)
+router.register(r'customer/(?P<customer_pk>[^/.]+)/wishlist', views.CustomerWishlistViewSet,
+                basename='customer-wishlist')
 router.register(r'product', views.ProductViewSet)
 router.register(r'user', views.UserViewSet)
+router.register(r'token', views.TokenViewSet, basename='token')
+
+
+# Operações de leitura assíncronas (ASGI), com a mesma autenticação, permissões e respostas das operações acima
+async_urlpatterns = []
+for prefix, viewset in (('customer', views.CustomerViewSet), ('wishlist', views.WishListViewSet),
+                        ('product', views.ProductViewSet)):
+    basename = router.get_default_basename(viewset)
+    async_urlpatterns += [
+        re_path(r'^{}/$'.format(prefix), AsyncReadView.as_view(viewset, 'list'),
+                name='async-{}-list'.format(basename)),
+        re_path(r'^{}/(?P<pk>[^/.]+)/$'.format(prefix), AsyncReadView.as_view(viewset, 'retrieve'),
+                name='async-{}-detail'.format(basename)),
+    ]
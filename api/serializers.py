@@ -1,10 +1,41 @@
+from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
-from rest_framework.validators import UniqueTogetherValidator
+from rest_framework.settings import api_settings
+from rest_framework.validators import UniqueValidator
 
 from api.models import Customer, Wishlist, Product
 
 
+DUPLICATED_PRODUCT_MESSAGE = 'O cliente já possui esse produto incluído em sua lista de favoritos.'
+
+
+def does_not_exist_error(field_name, pk_value):
+    """Erro de validação para um cliente ou produto inexistente, com a mesma mensagem do PrimaryKeyRelatedField."""
+    message = serializers.PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+    return serializers.ValidationError({field_name: [message.format(pk_value=pk_value)]})
+
+
+def duplicated_product_error():
+    return serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [DUPLICATED_PRODUCT_MESSAGE]})
+
+
+def add_to_wishlist(customer_id, product_id):
+    """
+    Inclui o produto na lista de favoritos do cliente com uma única instrução SQL, convertendo cliente ou produto
+    inexistente e produto duplicado em erros de validação.
+    """
+    status, instance = Wishlist.objects.add(customer_id, product_id)
+    if status == Wishlist.objects.MISSING_CUSTOMER:
+        raise does_not_exist_error('customer', customer_id)
+    if status == Wishlist.objects.MISSING_PRODUCT:
+        raise does_not_exist_error('product', product_id)
+    if status == Wishlist.objects.DUPLICATE:
+        raise duplicated_product_error()
+    return instance
+
+
 class ProductSerializer(serializers.ModelSerializer):
     """
     Produto: representa um produto.
@@ -15,7 +46,29 @@ class ProductSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Product
-        fields = ['id', 'title', 'brand', 'price', 'image', 'reviewScore', 'url']
+        fields = ['id', 'sku', 'title', 'brand', 'price', 'image', 'reviewScore', 'url']
+
+        # O SKU de um produto removido continua em uso até a remoção definitiva em segundo plano
+        extra_kwargs = {'sku': {'validators': [UniqueValidator(queryset=Product.all_objects.all())]}}
+
+
+class ProductSnapshotSerializer(ProductSerializer):
+    """
+    Produto sem a URL, que depende do host da requisição, usado na lista de favoritos serializada.
+    """
+    class Meta(ProductSerializer.Meta):
+        fields = [field for field in ProductSerializer.Meta.fields if field != 'url']
+
+
+class ProductTopSerializer(ProductSerializer):
+    """
+    Produto com a quantidade de listas de favoritos que o contém.
+    """
+    wishlistCount = serializers.IntegerField(source='wishlist_count', read_only=True,
+                                             help_text=Product._meta.get_field('wishlist_count').verbose_name)
+
+    class Meta(ProductSerializer.Meta):
+        fields = ProductSerializer.Meta.fields + ['wishlistCount']
 
 
 class CustomerSerializer(serializers.ModelSerializer):
@@ -26,6 +79,10 @@ class CustomerSerializer(serializers.ModelSerializer):
         model = Customer
         fields = ['id', 'name', 'email']
 
+        # O e-mail de um cliente removido continua em uso até a remoção definitiva em segundo plano
+        extra_kwargs = {'email': {'validators': [UniqueValidator(
+            queryset=Customer.all_objects.all(), message=Customer._meta.get_field('email').error_messages['unique'])]}}
+
 
 class CustomerSerializerWithRelatedObject(CustomerSerializer):
     """
@@ -33,8 +90,7 @@ class CustomerSerializerWithRelatedObject(CustomerSerializer):
     """
     wishList = ProductSerializer(source='wish_list', many=True, required=False)
 
-    class Meta:
-        model = Customer
+    class Meta(CustomerSerializer.Meta):
         fields = ['id', 'name', 'email', 'wishList']
 
 
@@ -42,18 +98,33 @@ class WishlistSerializer(serializers.ModelSerializer):
     """
     Produto favorito: representa a atribuição de um produto favorito a um cliente.
     """
+    # O cliente e o produto são validados pela própria instrução de INSERT, evitando uma query por chave estrangeira
+    customer = serializers.IntegerField(source='customer_id', min_value=1, help_text='Id do cliente')
+    product = serializers.IntegerField(source='product_id', min_value=1, help_text='Id do produto')
+
     class Meta:
         model = Wishlist
         fields = ['id', 'customer', 'product']
 
-        # Customiza mensagem de erro para o UniqueTogether
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Wishlist.objects.all(), 
-                fields=('customer', 'product'),
-                message='O cliente já possui esse produto incluído em sua lista de favoritos.'
-            )
-        ]
+        # A unicidade do cliente e produto é garantida pelo INSERT ... ON CONFLICT, sem um SELECT prévio
+        validators = []
+
+    def create(self, validated_data):
+        return add_to_wishlist(validated_data['customer_id'], validated_data['product_id'])
+
+    def update(self, instance, validated_data):
+        customer_id = validated_data.get('customer_id', instance.customer_id)
+        product_id = validated_data.get('product_id', instance.product_id)
+        if not Customer.objects.filter(pk=customer_id).exists():
+            raise does_not_exist_error('customer', customer_id)
+        if not Product.objects.filter(pk=product_id).exists():
+            raise does_not_exist_error('product', product_id)
+
+        try:
+            with transaction.atomic():
+                return super().update(instance, validated_data)
+        except IntegrityError:
+            raise duplicated_product_error()
 
 
 class WishlistSerializerWithRelatedObject(WishlistSerializer):
@@ -65,6 +136,69 @@ class WishlistSerializerWithRelatedObject(WishlistSerializer):
     product = ProductSerializer()
 
 
+class WishlistItemSerializer(serializers.Serializer):
+    """
+    Par cliente e produto de uma operação em lote na lista de produtos favoritos.
+    """
+    customer = serializers.IntegerField(min_value=1, help_text='Id do cliente')
+    product = serializers.IntegerField(min_value=1, help_text='Id do produto')
+
+
+class WishlistBulkSerializer(serializers.Serializer):
+    """
+    Operação em lote: inclusão ou remoção de vários produtos favoritos em uma única requisição.
+    """
+    items = serializers.ListField(child=WishlistItemSerializer(), min_length=1, max_length=10000)
+
+
+class WishlistBulkItemResultSerializer(WishlistItemSerializer):
+    """
+    Resultado da operação em lote para um par cliente e produto.
+    """
+    status = serializers.ChoiceField(choices=[
+        Wishlist.objects.INSERTED, Wishlist.objects.DUPLICATE, Wishlist.objects.MISSING_CUSTOMER,
+        Wishlist.objects.MISSING_PRODUCT, Wishlist.objects.REMOVED, Wishlist.objects.NOT_FOUND,
+    ])
+
+
+class WishlistBulkResultSerializer(serializers.Serializer):
+    """
+    Resultado da operação em lote: o status de cada item, na mesma ordem recebida, e o total por status.
+    """
+    items = WishlistBulkItemResultSerializer(many=True)
+    totals = serializers.DictField(child=serializers.IntegerField())
+
+
+class CustomerWishlistSerializer(serializers.ModelSerializer):
+    """
+    Produto favorito de um cliente: representa a atribuição de um produto favorito ao cliente informado na URL.
+    """
+    product = serializers.IntegerField(source='product_id', min_value=1, help_text='Id do produto')
+
+    class Meta:
+        model = Wishlist
+        fields = ['id', 'product']
+
+    def create(self, validated_data):
+        return add_to_wishlist(validated_data['customer_id'], validated_data['product_id'])
+
+
+class CustomerWishlistSerializerWithRelatedObject(CustomerWishlistSerializer):
+    """
+    Produto favorito de um cliente: representa a atribuição de um produto favorito ao cliente informado na URL,
+    com o objeto do produto.
+    """
+    product = ProductSerializer()
+
+
+class WishlistMembershipSerializer(serializers.Serializer):
+    """
+    Produtos informados que estão ou não na lista de favoritos do cliente: {id do produto: true ou false}.
+    """
+    customer = serializers.IntegerField(help_text='Id do cliente')
+    products = serializers.DictField(child=serializers.BooleanField())
+
+
 class UserSerializer(serializers.ModelSerializer):
     """
     Cliente: representa um usuário.
@@ -78,3 +212,48 @@ class UserSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         user = User.objects.create_user(**validated_data)
         return user
+
+
+class TokenObtainSerializer(serializers.Serializer):
+    """
+    Emissão de token de acesso: o usuário e a senha, ou nenhum dos dois para emitir o token do usuário autenticado
+    na requisição por sessão ou autenticação básica.
+    """
+    username = serializers.CharField(required=False, help_text='Usuário')
+    password = serializers.CharField(required=False, write_only=True, style={'input_type': 'password'},
+                                     help_text='Senha')
+
+    def validate(self, attrs):
+        if 'username' not in attrs and 'password' not in attrs:
+            return attrs
+        if 'username' not in attrs or 'password' not in attrs:
+            raise serializers.ValidationError('Informe o usuário e a senha.')
+
+        user = authenticate(self.context.get('request'), username=attrs['username'], password=attrs['password'])
+        if user is None:
+            raise serializers.ValidationError('Usuário ou senha inválidos.', code='authorization')
+        attrs['user'] = user
+        return attrs
+
+
+class TokenSerializer(serializers.Serializer):
+    """
+    Token de acesso, enviado no header Authorization: Bearer <token>.
+    """
+    token = serializers.CharField()
+    tokenType = serializers.CharField(default='Bearer')
+    expiresAt = serializers.DateTimeField(help_text='Expiração do token')
+
+
+class TokenRevokeSerializer(serializers.Serializer):
+    """
+    Revogação de um token de acesso: o token informado ou, sem o token, o token usado na requisição.
+    """
+    token = serializers.CharField(required=False)
+
+
+class TokenRevokeAllSerializer(serializers.Serializer):
+    """
+    Revogação de todos os tokens de acesso do usuário autenticado ou, para administradores, do usuário informado.
+    """
+    user = serializers.IntegerField(required=False, min_value=1, help_text='Id do usuário')
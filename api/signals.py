@@ -0,0 +1,104 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api.core.authentication import revoke_user_tokens
+from api.core.cache import product_cache
+from api.core.membership import wishlist_membership_cache
+from api.models import Product, Wishlist, wishlist_changed
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    """Remove o produto alterado ou removido do cache de produtos serializados."""
+    product_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def touch_product_customers(sender, instance, created, using, **kwargs):
+    """
+    Incrementa a versão da lista de favoritos dos clientes que possuem o produto alterado, após o commit e apenas com
+    WISHLIST_SNAPSHOT: a atualização dos clientes não prolonga a transação que alterou o produto.
+    """
+    if not created and getattr(settings, 'WISHLIST_SNAPSHOT', False):
+        transaction.on_commit(lambda: Wishlist.objects.db_manager(using).touch_product_customers([instance.pk]),
+                              using=using)
+
+
+@receiver([post_save, post_delete], sender=Wishlist)
+def touch_wishlist_customer(sender, instance, **kwargs):
+    """
+    Incrementa a versão da lista de favoritos do cliente quando um item é alterado pelo ORM (ex.: admin). As operações
+    do WishlistManager já incrementam a versão na própria instrução SQL.
+    """
+    customer_ids = {instance.customer_id, getattr(instance, '_loaded_values', {}).get('customer_id')}
+    Wishlist.objects.touch_customers(customer_id for customer_id in customer_ids if customer_id is not None)
+
+
+@receiver(m2m_changed, sender=Wishlist)
+def touch_wishlist_customer_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    """Incrementa a versão da lista de favoritos dos clientes alterados por Customer.wish_list (add/remove/clear)."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        Wishlist.objects.touch_customers([instance.pk])
+    elif pk_set:
+        Wishlist.objects.touch_customers(pk_set)
+
+
+@receiver(post_save, sender=Wishlist)
+def count_saved_wishlist_product(sender, instance, created, **kwargs):
+    """Atualiza o contador de listas de favoritos do produto incluído ou trocado pelo ORM (ex.: admin)."""
+    deltas = {instance.product_id: 1}
+    if not created:
+        previous = getattr(instance, '_loaded_values', {}).get('product_id')
+        if previous is None or previous == instance.product_id:
+            return
+        deltas[previous] = -1
+    Wishlist.objects.count_products(deltas)
+
+
+@receiver(post_delete, sender=Wishlist)
+def count_deleted_wishlist_product(sender, instance, **kwargs):
+    """
+    Atualiza o contador de listas de favoritos do produto removido pelo ORM. Customer.wish_list.remove() e .clear()
+    também disparam este signal para cada item removido.
+    """
+    product_id = getattr(instance, '_loaded_values', {}).get('product_id', instance.product_id)
+    Wishlist.objects.count_products({product_id: -1})
+
+
+@receiver(m2m_changed, sender=Wishlist)
+def count_wishlist_products_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    """Atualiza o contador de listas de favoritos dos produtos incluídos por Customer.wish_list.add()."""
+    if action != 'post_add' or not pk_set:
+        return
+
+    if not reverse:
+        Wishlist.objects.count_products(dict.fromkeys(pk_set, 1))
+    else:
+        Wishlist.objects.count_products({instance.pk: len(pk_set)})
+
+
+@receiver(wishlist_changed)
+def invalidate_wishlist_membership(sender, customer_ids, using, **kwargs):
+    """
+    Remove do cache o conjunto de produtos favoritos dos clientes alterados, novamente após o commit: uma consulta
+    concorrente pode ter armazenado a lista anterior antes do fim da transação.
+    """
+    wishlist_membership_cache.invalidate_many(customer_ids)
+    transaction.on_commit(lambda: wishlist_membership_cache.invalidate_many(customer_ids), using=using)
+
+
+@receiver([post_save, post_delete], sender=User)
+def revoke_changed_user_tokens(sender, instance, created=False, update_fields=None, **kwargs):
+    """
+    Revoga os tokens de acesso do usuário alterado ou removido, que contêm o nome e as permissões de administrador da
+    emissão. O login (last_login) não revoga os tokens.
+    """
+    if created or (update_fields is not None and set(update_fields) == {'last_login'}):
+        return
+    revoke_user_tokens(instance.pk)
@@ -1,14 +1,53 @@
-from collections import deque
+import base64
+import csv
+import json
+import multiprocessing
+import os
+import tempfile
+from collections import Counter, deque
+from datetime import timedelta
+from io import StringIO
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Sum
 from django.db.utils import IntegrityError
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from drf_spectacular.generators import SchemaGenerator
 from random import seed, randint, random, choice, sample
-from rest_framework import status
-from rest_framework.test import APITestCase
-
-from api.models import Customer, Product
+from rest_framework import permissions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, APITestCase
+from threading import Event, Thread
+from time import sleep
+from unittest import mock
+
+from api.checks import check_replica_pin_cache
+from api.core.admin import EstimatedCountPaginator
+from api.core.authentication import decode_token, issue_token
+from api.core.cache import LocalLRUCache, product_cache
+from api.core.deletion import run_job, soft_delete
+from api.core.export import export_lines, export_rows
+from api.core.membership import BloomFilter, wishlist_membership_cache
+from api.core.metrics import MetricsRegistry, get_registry
+from api.core.pagination import KeysetPagination
+from api.management.commands.bench import SCENARIOS, compare
+from api.filters import ProductFilter, search_customers, search_products
+from api.core.values import ValuesSerializer
+from api.db.base import DatabaseWrapper
+from api.db import router
+from api.db.pool import ConnectionPool, PoolTimeout, pool_stats
+from api.models import Customer, CustomerWishlistSnapshot, DeletionJob, Product, ProductWishlistCount, Wishlist, \
+    WishlistManager
+from api.serializers import CustomerSerializerWithRelatedObject, ProductSerializer, WishlistSerializerWithRelatedObject
+from api.routers import router as api_router
+from api.views import CustomerViewSet, CustomerWishlistViewSet, ProductViewSet
 
 
 def create_customers():
@@ -70,7 +109,25 @@ class CustomerTestCase(TestCase):
         # checa se clientes foi atualizado corretamente
         self.assertEqual(customer_1.name, 'Cliente 1 Da silva')
         self.assertEqual(customer_1.email, 'cliente1.da.silva@luizalabs.com')
-    
+
+    def test_stale_customer_keeps_wishlist_version(self):
+        """Testa que salvar um cliente carregado antes de uma inclusão na lista não retorna a versão da lista"""
+        customer = Customer.objects.get(email='cliente1@luizalabs.com')
+        product = Product.objects.create(title='Produto 1', price=1, brand='Marca',
+                                         image='http://blob.luizalabs.com/images/img_1.png')
+        status_, _ = Wishlist.objects.add(customer.pk, product.pk)
+        self.assertEqual(status_, Wishlist.objects.INSERTED)
+
+        customer.name = 'Cliente 1 Da silva'
+        customer.save()
+        serializer = CustomerSerializerWithRelatedObject(customer, data={'name': 'Cliente 1'}, partial=True)
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+
+        customer = Customer.objects.get(pk=customer.pk)
+        self.assertEqual(customer.name, 'Cliente 1')
+        self.assertEqual(customer.wishlist_version, 1)
+
     def test_customer_delete(self):
         """Testa se um cliente pode ser apagado"""
         # Recupera cliente para deletar
@@ -262,9 +319,9 @@ class CustomerAPITestCase(LuizaLabsAPITestCase):
         # Checa que foram criados N clientes
         self.assertEqual(Customer.objects.count(), N_CUSTOMER)
 
-        # Checa cliente com id = 1
-        self.assertEqual(Customer.objects.get(id=1).name, 'API Customer 0')
-        self.assertEqual(Customer.objects.get(id=1).email, 'api0.customer@luizalabs.com')
+        # Checa o primeiro cliente criado (a sequence de ids não é reiniciada entre os testes)
+        self.assertEqual(Customer.objects.order_by('id').first().name, 'API Customer 0')
+        self.assertEqual(Customer.objects.order_by('id').first().email, 'api0.customer@luizalabs.com')
 
     def test_create_duplicated_email(self):
         """Testa criar um cliente com o mesmo email"""
@@ -297,10 +354,10 @@ class CustomerAPITestCase(LuizaLabsAPITestCase):
         response = self.get_all_customers()
 
         # checa se há os n clientes
-        self.assertEqual(len(response.data), N_CUSTOMER)
+        self.assertEqual(len(response.data.get('results')), N_CUSTOMER)
 
         # checa todos os valores
-        [self.check_customer_att(customer) for customer in response.data]
+        [self.check_customer_att(customer) for customer in response.data.get('results')]
 
     def check_customer_att(self, customer_api_obj):
         """checa todos os atributos do cliente com o que está na base de dados"""
@@ -311,7 +368,7 @@ class CustomerAPITestCase(LuizaLabsAPITestCase):
         """Testa o retrieve de um único cliente"""
         # recupera um id para trazer os details
         response = self.get_all_customers()
-        id = response.data[5].get('id')
+        id = response.data.get('results')[5].get('id')
 
         # Executa get
         url = reverse('customer-detail', kwargs={'pk': id})
@@ -325,7 +382,7 @@ class CustomerAPITestCase(LuizaLabsAPITestCase):
         """Testa a atualização de um cliente (put)"""
         # recupera um id para atualizar
         response = self.get_all_customers()
-        id = response.data[5].get('id')
+        id = response.data.get('results')[5].get('id')
 
         # executa put   
         url = reverse('customer-detail', kwargs={'pk': id})
@@ -339,7 +396,7 @@ class CustomerAPITestCase(LuizaLabsAPITestCase):
         """Testa a atualização de um cliente (patch)"""
         # recupera um id para atualizar
         response = self.get_all_customers()
-        id = response.data[5].get('id')
+        id = response.data.get('results')[5].get('id')
 
         # executa patch   
         url = reverse('customer-detail', kwargs={'pk': id})
@@ -361,7 +418,7 @@ class CustomerAPITestCase(LuizaLabsAPITestCase):
         response = self.get_all_customers()
 
         # remove os clientes 1 por 1
-        status_list = list(map(lambda customer: self.remove_customer(customer.get('id')), response.data))
+        status_list = list(map(lambda customer: self.remove_customer(customer.get('id')), response.data.get('results')))
 
         # checa que foi deletado atraves do status code
         deque(map(lambda x: self.assertEqual(x, status.HTTP_204_NO_CONTENT), status_list))
@@ -386,9 +443,9 @@ class ProductAPITestCase(LuizaLabsAPITestCase):
         # Checa que foram criados N produtos
         self.assertEqual(Product.objects.count(), N_PRODUCT)
 
-        # Checa produto com id = 1
-        self.assertEqual(Product.objects.get(id=1).title, 'API Product 0')
-        self.assertEqual(Product.objects.get(id=1).brand, 'Marca 0')
+        # Checa o primeiro produto criado (a sequence de ids não é reiniciada entre os testes)
+        self.assertEqual(Product.objects.order_by('id').first().title, 'API Product 0')
+        self.assertEqual(Product.objects.order_by('id').first().brand, 'Marca 0')
 
 
     def test_list_all_product(self):
@@ -498,7 +555,7 @@ class WishlistAPITestCase(LuizaLabsAPITestCase):
 
         # seleciona um cliente
         response = self.get_all_customers()
-        customer = choice(response.data)
+        customer = choice(response.data.get('results'))
         customer_id = customer.get('id')
 
         # seleciona n=5 produtos para inserir na lista
@@ -554,7 +611,7 @@ class WishlistAPITestCase(LuizaLabsAPITestCase):
         """Testa a inclusão de um produto duplicado na lista de um cliente"""
         # seleciona um cliente
         response = self.get_all_customers()
-        customer = choice(response.data)
+        customer = choice(response.data.get('results'))
         customer_id = customer.get('id')
 
         # seleciona 1 produto para inserir na lista
@@ -586,3 +643,2751 @@ class WishlistAPITestCase(LuizaLabsAPITestCase):
 
         # checa que há algum problema com os campos
         self.assertIn('non_field_errors', response.data)
+
+
+class QueryBudgetAPITestCase(LuizaLabsAPITestCase):
+    """
+    Garante que as listagens executam um número fixo de queries, independente da quantidade de registros.
+    As 2 primeiras queries de cada chamada são da autenticação (sessão e usuário).
+    """
+    def setUp(self):
+        super().setUp()
+
+        # cria massa de teste diretamente na base
+        self.customers = [Customer.objects.create(name='Cliente {}'.format(i), email='cliente{}@luizalabs.com'.format(i))
+                          for i in range(N_CUSTOMER)]
+        self.products = [Product.objects.create(title='Produto {}'.format(i), price=i, brand='Marca {}'.format(i),
+                                                image='http://blob.luizalabs.com/images/img_{}.png'.format(i))
+                         for i in range(N_PRODUCT)]
+
+        # cada cliente possui todos os produtos em sua lista
+        for customer in self.customers:
+            customer.wish_list.add(*self.products)
+
+    def test_list_customers_query_budget(self):
+        """Testa que a listagem de clientes com a lista de favoritos não executa N+1 queries"""
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('customer-list'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data.get('results')[0].get('wishList')), N_PRODUCT)
+
+    def test_retrieve_customer_query_budget(self):
+        """Testa o número de queries para recuperar um cliente com a lista de favoritos"""
+        # autenticação (2), validadores da requisição condicional (1), cliente (1) e lista de favoritos (1)
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('customer-detail', kwargs={'pk': self.customers[0].id}), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data.get('wishList')), N_PRODUCT)
+
+    def test_list_wishlist_query_budget(self):
+        """Testa que a listagem da lista de favoritos carrega cliente e produto no mesmo SELECT"""
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('wishlist-list'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data.get('results')), 10)
+        self.assertIn('name', response.data.get('results')[0].get('customer'))
+        self.assertIn('title', response.data.get('results')[0].get('product'))
+
+    def test_list_products_query_budget(self):
+        """Testa o número de queries da listagem paginada de produtos, sem e com os produtos no cache"""
+        product_cache.clear()
+        cache.clear()
+
+        # COUNT(*), ids da página e os produtos ausentes no cache
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('product-list'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # COUNT(*) e ids da página
+        with self.assertNumQueries(4):
+            cached_response = self.client.get(reverse('product-list'), format='json')
+        self.assertEqual(cached_response.data, response.data)
+
+
+class KeysetPaginationAPITestCase(LuizaLabsAPITestCase):
+    def setUp(self):
+        super().setUp()
+
+        # cria massa de teste diretamente na base
+        self.customers = [Customer.objects.create(name='Cliente {}'.format(i), email='cliente{:02d}@luizalabs.com'.format(i))
+                          for i in range(25)]
+
+    def walk(self, url):
+        """Percorre todas as páginas seguindo o link next, retornando os itens e as respostas"""
+        items, responses = [], []
+        while url:
+            response = self.client.get(url, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            responses.append(response)
+            items += response.data.get('results')
+            url = response.data.get('next')
+        return items, responses
+
+    def test_walk_all_pages(self):
+        """Testa que o cursor percorre todos os clientes, ordenados pelo id decrescente, sem repetições"""
+        items, responses = self.walk(reverse('customer-list'))
+
+        self.assertEqual(len(responses), 3)
+        self.assertEqual([item.get('id') for item in items], sorted([c.id for c in self.customers], reverse=True))
+
+        # a paginação por cursor não executa COUNT(*)
+        self.assertNotIn('count', responses[0].data)
+
+    def test_previous_link(self):
+        """Testa a navegação para a página anterior"""
+        first = self.client.get(reverse('customer-list'), format='json')
+        second = self.client.get(first.data.get('next'), format='json')
+        previous = self.client.get(second.data.get('previous'), format='json')
+
+        self.assertEqual(previous.data.get('results'), first.data.get('results'))
+
+    def test_ordering_by_email(self):
+        """Testa a paginação por cursor ordenada por um campo único diferente da chave primária"""
+        items, _ = self.walk(reverse('customer-list') + '?ordering=email&page_size=7')
+
+        self.assertEqual([item.get('email') for item in items], sorted(c.email for c in self.customers))
+
+    def test_tampered_cursor(self):
+        """Testa que um cursor alterado pelo cliente é rejeitado"""
+        response = self.client.get(reverse('customer-list'), format='json')
+        next_url = response.data.get('next')
+
+        response = self.client.get(next_url[:-1] + ('A' if next_url[-1] != 'A' else 'B'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_number_fallback(self):
+        """Testa a paginação por número de página quando o parâmetro page é informado"""
+        response = self.client.get(reverse('customer-list') + '?page=3', format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data.get('count'), 25)
+        self.assertEqual(len(response.data.get('results')), 5)
+
+    def test_deep_page_query_budget(self):
+        """Testa que uma página profunda executa o mesmo número de queries que a primeira"""
+        _, responses = self.walk(reverse('customer-list') + '?page_size=5')
+        last_url = responses[-2].data.get('next')
+
+        with self.assertNumQueries(4):
+            self.client.get(last_url, format='json')
+
+    def test_wishlist_pagination(self):
+        """Testa a paginação por cursor da lista de favoritos"""
+        products = [Product.objects.create(title='Produto {}'.format(i), price=i, brand='Marca',
+                                           image='http://blob.luizalabs.com/images/img_{}.png'.format(i))
+                    for i in range(15)]
+        self.customers[0].wish_list.add(*products)
+
+        items, responses = self.walk(reverse('wishlist-list'))
+
+        self.assertEqual(len(responses), 2)
+        self.assertEqual(len(items), 15)
+
+
+class CustomerWishlistAPITestCase(LuizaLabsAPITestCase):
+    def setUp(self):
+        super().setUp()
+
+        # cria massa de teste diretamente na base
+        self.customer = Customer.objects.create(name='Cliente 1', email='cliente1@luizalabs.com')
+        self.other_customer = Customer.objects.create(name='Cliente 2', email='cliente2@luizalabs.com')
+        self.products = [Product.objects.create(title='Produto {}'.format(i), price=i, brand='Marca',
+                                                image='http://blob.luizalabs.com/images/img_{}.png'.format(i))
+                         for i in range(15)]
+        self.customer.wish_list.add(*self.products[:12])
+        self.other_customer.wish_list.add(*self.products[10:])
+
+    def wishlist_url(self, customer_id):
+        return reverse('customer-wishlist-list', kwargs={'customer_pk': customer_id})
+
+    def test_list_wishlist(self):
+        """Testa a listagem paginada da lista de favoritos de um cliente, com os produtos"""
+        response = self.client.get(self.wishlist_url(self.customer.id), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data.get('results')), 10)
+
+        response = self.client.get(response.data.get('next'), format='json')
+        self.assertEqual(len(response.data.get('results')), 2)
+        self.assertIsNone(response.data.get('next'))
+
+        # checa que o produto é retornado junto
+        expected = Wishlist.objects.filter(customer=self.customer).order_by('-id')[10]
+        self.assertEqual(response.data.get('results')[0].get('product').get('title'), expected.product.title)
+
+    def test_list_wishlist_query_budget(self):
+        """Testa que a listagem carrega os produtos no mesmo SELECT"""
+        # autenticação (2), validadores da requisição condicional (1) e a página com os produtos (1)
+        with self.assertNumQueries(4):
+            response = self.client.get(self.wishlist_url(self.customer.id), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_add_to_wishlist(self):
+        """Testa a inclusão de um produto na lista de um cliente"""
+        response = self.client.post(self.wishlist_url(self.other_customer.id), {'product': self.products[0].id},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(self.other_customer.wish_list.filter(id=self.products[0].id).exists())
+
+    def test_add_duplicated_product(self):
+        """Testa a inclusão de um produto que já está na lista do cliente"""
+        response = self.client.post(self.wishlist_url(self.customer.id), {'product': self.products[0].id},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('non_field_errors', response.data)
+
+    def test_add_to_non_existent_customer(self):
+        """Testa a inclusão de um produto na lista de um cliente que não existe"""
+        response = self.client.post(self.wishlist_url(9999999), {'product': self.products[0].id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_remove_from_wishlist(self):
+        """Testa a remoção de um produto da lista de um cliente, pelo id do produto"""
+        url = reverse('customer-wishlist-detail', kwargs={'customer_pk': self.customer.id,
+                                                          'product_pk': self.products[11].id})
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        # checa que apenas a lista do cliente foi alterada
+        self.assertFalse(self.customer.wish_list.filter(id=self.products[11].id).exists())
+        self.assertTrue(self.other_customer.wish_list.filter(id=self.products[11].id).exists())
+
+        # remover novamente não encontra o produto
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class WishlistMembershipAPITestCase(LuizaLabsAPITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        wishlist_membership_cache.reset_stats()
+        self.customer = Customer.objects.create(name='Cliente 1', email='cliente1@luizalabs.com')
+        self.products = [Product.objects.create(title='Produto {}'.format(i), price=i, brand='Marca',
+                                                image='http://blob.luizalabs.com/images/img_{}.png'.format(i))
+                         for i in range(15)]
+        self.customer.wish_list.add(*self.products[:12])
+
+    def contains(self, products, customer_id=None):
+        url = reverse('customer-wishlist-contains', kwargs={'customer_pk': customer_id or self.customer.id})
+        return self.client.get(url, {'products': ','.join(str(pk) for pk in products)}, format='json')
+
+    def expected(self, products, members):
+        return {str(pk): pk in members for pk in products}
+
+    def test_contains(self):
+        """Testa a consulta de quais produtos estão na lista do cliente com uma única query"""
+        products = [product.id for product in self.products[8:]] + [999999]
+        members = {product.id for product in self.products[:12]}
+        # autenticação (2) e a query IN (1)
+        with self.assertNumQueries(3):
+            response = self.contains(products)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'customer': self.customer.id, 'products': self.expected(products, members)})
+
+        response = self.contains(products, customer_id=999999)
+        self.assertEqual(response.data['products'], self.expected(products, set()))
+
+        for invalid in ('', 'a,b', ','.join(str(pk) for pk in range(1, 202))):
+            response = self.client.get(reverse('customer-wishlist-contains', kwargs={'customer_pk': self.customer.id}),
+                                       {'products': invalid})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(WISHLIST_MEMBERSHIP_CACHE={'ENABLED': True})
+    def test_contains_cache(self):
+        """Testa a lista do cliente armazenada no cache e a invalidação nas inclusões e remoções"""
+        products = [product.id for product in self.products]
+        with self.assertNumQueries(3):
+            self.contains(products)
+        with self.assertNumQueries(2):
+            response = self.contains(products)
+        self.assertEqual(response.data['products'], self.expected(products, set(products[:12])))
+        self.assertEqual(wishlist_membership_cache.stats()['exact_hits'], 1)
+
+        response = self.client.post(reverse('customer-wishlist-list', kwargs={'customer_pk': self.customer.id}),
+                                    {'product': products[12]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.contains(products).data['products'], self.expected(products, set(products[:13])))
+
+        response = self.client.post(reverse('wishlist-bulk-remove'), {'items': [
+            {'customer': self.customer.id, 'product': products[0]}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.contains(products).data['products'], self.expected(products, set(products[1:13])))
+
+        self.customer.wish_list.add(self.products[14])
+        self.assertEqual(self.contains(products).data['products'],
+                         self.expected(products, set(products[1:13]) | {products[14]}))
+
+    @override_settings(WISHLIST_MEMBERSHIP_CACHE={'ENABLED': True, 'EXACT_MAX_SIZE': 5, 'FALSE_POSITIVE_RATE': 0.01})
+    def test_contains_bloom_filter(self):
+        """Testa o filtro de Bloom das listas grandes: os produtos fora do filtro são respondidos sem queries"""
+        members = [product.id for product in self.products[:12]]
+        self.contains(members)
+
+        # Os ids dos produtos variam entre as execuções: os falsos positivos são os do mesmo filtro montado aqui
+        bloom = BloomFilter.create(members, 0.01)
+        others = [product.id for product in self.products[12:]] + [999998, 999999]
+        false_positives = [pk for pk in others if pk in bloom]
+
+        # autenticação (2) e a query IN apenas dos falsos positivos
+        with self.assertNumQueries(3 if false_positives else 2):
+            response = self.contains(others)
+        self.assertEqual(response.data['products'], self.expected(others, set()))
+
+        # sem falsos negativos: os produtos da lista sempre são confirmados pela query IN
+        with self.assertNumQueries(3):
+            response = self.contains(members[:3] + others)
+        self.assertEqual(response.data['products'], self.expected(members[:3] + others, set(members)))
+        self.assertEqual(wishlist_membership_cache.stats()['negatives'], (len(others) - len(false_positives)) * 2)
+
+    def test_bloom_filter(self):
+        """Testa que o filtro de Bloom não possui falsos negativos e respeita a taxa de falsos positivos"""
+        bloom = BloomFilter.create(range(0, 20000, 2), 0.01)
+        self.assertTrue(all(pk in bloom for pk in range(0, 20000, 2)))
+        false_positives = sum(pk in bloom for pk in range(1, 20000, 2))
+        self.assertLess(false_positives, 200)
+
+        copy = BloomFilter(bloom.size, bloom.hashes, bytes(bloom.bits))
+        self.assertTrue(all(pk in copy for pk in range(0, 20000, 2)))
+
+
+class WishlistBulkAPITestCase(LuizaLabsAPITestCase):
+    def setUp(self):
+        super().setUp()
+
+        # cria massa de teste diretamente na base
+        self.customers = [Customer.objects.create(name='Cliente {}'.format(i), email='cliente{}@luizalabs.com'.format(i))
+                          for i in range(3)]
+        self.products = [Product.objects.create(title='Produto {}'.format(i), price=i, brand='Marca',
+                                                image='http://blob.luizalabs.com/images/img_{}.png'.format(i))
+                         for i in range(5)]
+        self.customers[0].wish_list.add(self.products[0])
+
+    def test_bulk_add(self):
+        """Testa a inclusão em lote, com o status de cada item"""
+        items = [
+            {'customer': self.customers[0].id, 'product': self.products[0].id},
+            {'customer': self.customers[0].id, 'product': self.products[1].id},
+            {'customer': self.customers[1].id, 'product': self.products[1].id},
+            {'customer': self.customers[1].id, 'product': self.products[1].id},
+            {'customer': 9999999, 'product': self.products[1].id},
+            {'customer': self.customers[2].id, 'product': 9999999},
+        ]
+
+        # autenticação (2), uma query IN por tabela (2) e um único INSERT entre SAVEPOINT e RELEASE (3)
+        with self.assertNumQueries(7):
+            response = self.client.post(reverse('wishlist-bulk-add'), {'items': items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        statuses = [item.get('status') for item in response.data.get('items')]
+        self.assertEqual(statuses, ['duplicate', 'inserted', 'inserted', 'duplicate', 'missing_customer',
+                                    'missing_product'])
+        self.assertEqual(response.data.get('totals'), {'duplicate': 2, 'inserted': 2, 'missing_customer': 1,
+                                                       'missing_product': 1})
+
+        self.assertEqual(self.customers[0].wish_list.count(), 2)
+        self.assertEqual(self.customers[1].wish_list.count(), 1)
+
+    def test_bulk_remove(self):
+        """Testa a remoção em lote, com o status de cada item"""
+        self.customers[1].wish_list.add(*self.products)
+        items = [
+            {'customer': self.customers[1].id, 'product': self.products[0].id},
+            {'customer': self.customers[1].id, 'product': self.products[1].id},
+            {'customer': self.customers[2].id, 'product': self.products[1].id},
+        ]
+        response = self.client.post(reverse('wishlist-bulk-remove'), {'items': items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        statuses = [item.get('status') for item in response.data.get('items')]
+        self.assertEqual(statuses, ['removed', 'removed', 'not_found'])
+        self.assertEqual(self.customers[1].wish_list.count(), 3)
+
+        # a lista dos demais clientes não é alterada
+        self.assertEqual(self.customers[0].wish_list.count(), 1)
+
+    def test_bulk_invalid_payload(self):
+        """Testa a validação do corpo da requisição"""
+        response = self.client.post(reverse('wishlist-bulk-add'), {'items': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(reverse('wishlist-bulk-add'), {'items': [{'customer': 'a'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class WishlistAddAPITestCase(LuizaLabsAPITestCase):
+    def setUp(self):
+        super().setUp()
+
+        # cria massa de teste diretamente na base
+        self.customer = Customer.objects.create(name='Cliente 1', email='cliente1@luizalabs.com')
+        self.product = Product.objects.create(title='Produto 1', price=1, brand='Marca',
+                                              image='http://blob.luizalabs.com/images/img_1.png')
+
+    def post(self, customer_id, product_id):
+        return self.client.post(reverse('wishlist-list'), {'customer': customer_id, 'product': product_id},
+                                format='json')
+
+    def test_add_query_budget(self):
+        """Testa que a inclusão executa uma única instrução SQL além da autenticação"""
+        with self.assertNumQueries(3):
+            response = self.post(self.customer.id, self.product.id)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data.get('customer'), self.customer.id)
+        self.assertEqual(response.data.get('product'), self.product.id)
+        self.assertTrue(Wishlist.objects.filter(id=response.data.get('id')).exists())
+
+    def test_add_error_messages(self):
+        """Testa as mensagens de erro para cliente inexistente, produto inexistente e produto duplicado"""
+        response = self.post(9999999, self.product.id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data.get('customer'), ['Pk inválido "9999999" - objeto não existe.'])
+
+        response = self.post(self.customer.id, 9999999)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data.get('product'), ['Pk inválido "9999999" - objeto não existe.'])
+
+        self.post(self.customer.id, self.product.id)
+        response = self.post(self.customer.id, self.product.id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data.get('non_field_errors'),
+                         ['O cliente já possui esse produto incluído em sua lista de favoritos.'])
+
+    def test_update_to_duplicated_product(self):
+        """Testa a alteração de um item para um produto que já está na lista do cliente"""
+        other_product = Product.objects.create(title='Produto 2', price=2, brand='Marca',
+                                               image='http://blob.luizalabs.com/images/img_2.png')
+        self.customer.wish_list.add(self.product, other_product)
+        wish = Wishlist.objects.get(customer=self.customer, product=other_product)
+
+        url = reverse('wishlist-detail', kwargs={'pk': wish.id})
+        response = self.client.patch(url, {'product': self.product.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('non_field_errors', response.data)
+
+        response = self.client.patch(url, {'product': 9999999}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('product', response.data)
+
+
+class WishlistAddTransactionTestCase(TransactionTestCase):
+    def test_concurrent_add(self):
+        """Testa que inclusões concorrentes do mesmo produto não geram erro de integridade"""
+        customer = Customer.objects.create(name='Cliente 1', email='cliente1@luizalabs.com')
+        product = Product.objects.create(title='Produto 1', price=1, brand='Marca',
+                                         image='http://blob.luizalabs.com/images/img_1.png')
+        inserted = Event()
+        results = {}
+
+        def first():
+            # inclui e mantém a transação aberta enquanto a segunda inclusão é executada
+            try:
+                with transaction.atomic():
+                    results['first'] = Wishlist.objects.add(customer.id, product.id)[0]
+                    inserted.set()
+                    sleep(.2)
+            finally:
+                connection.close()
+
+        def second():
+            try:
+                inserted.wait()
+                results['second'] = Wishlist.objects.add(customer.id, product.id)[0]
+            finally:
+                connection.close()
+
+        threads = [Thread(target=first), Thread(target=second)]
+        deque(map(lambda thread: thread.start(), threads))
+        deque(map(lambda thread: thread.join(), threads))
+
+        self.assertEqual(results, {'first': Wishlist.objects.INSERTED, 'second': Wishlist.objects.DUPLICATE})
+        self.assertEqual(Wishlist.objects.count(), 1)
+
+    def test_customers_locked_in_order(self):
+        """Testa que as operações em lote bloqueiam os clientes em ordem crescente do id, evitando deadlocks"""
+        customers = [Customer.objects.create(name='Cliente {}'.format(i), email='cliente{}@luizalabs.com'.format(i))
+                     for i in range(20)]
+        product = Product.objects.create(title='Produto 1', price=1, brand='Marca',
+                                         image='http://blob.luizalabs.com/images/img_1.png')
+
+        # a nova versão da linha do primeiro cliente fica depois das demais na tabela, fora da ordem do id
+        Customer.objects.filter(pk=customers[0].pk).update(name='Cliente alterado')
+        locked, release = Event(), Event()
+        results = {}
+
+        def holder():
+            # bloqueia o cliente de menor id, como um UPDATE concorrente
+            try:
+                with transaction.atomic():
+                    list(Customer.objects.select_for_update(no_key=True).filter(pk=customers[0].pk))
+                    locked.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        def writer():
+            try:
+                locked.wait()
+                results['statuses'] = Wishlist.objects.bulk_add(
+                    [(customer.pk, product.pk) for customer in reversed(customers)])
+            finally:
+                connection.close()
+
+        threads = [Thread(target=holder), Thread(target=writer)]
+        deque(map(lambda thread: thread.start(), threads))
+        try:
+            locked.wait()
+            sleep(.3)
+
+            # a operação aguarda o primeiro cliente sem ter bloqueado os demais
+            with transaction.atomic():
+                others = Customer.objects.select_for_update(no_key=True, nowait=True).exclude(pk=customers[0].pk)
+                self.assertEqual(len(others), len(customers) - 1)
+            self.assertNotIn('statuses', results)
+        finally:
+            release.set()
+            deque(map(lambda thread: thread.join(), threads))
+
+        self.assertEqual(results['statuses'], [Wishlist.objects.INSERTED] * len(customers))
+        self.assertEqual(set(Customer.objects.values_list('wishlist_version', flat=True)), {1})
+
+    def test_add_single_statement(self):
+        """Testa que a inclusão fora de uma transação é executada com uma única instrução SQL"""
+        customer = Customer.objects.create(name='Cliente 1', email='cliente1@luizalabs.com')
+        product = Product.objects.create(title='Produto 1', price=1, brand='Marca',
+                                         image='http://blob.luizalabs.com/images/img_1.png')
+
+        with self.assertNumQueries(1):
+            status_, wish = Wishlist.objects.add(customer.id, product.id)
+        self.assertEqual(status_, Wishlist.objects.INSERTED)
+        self.assertEqual(wish.product_id, product.id)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ProductCacheAPITestCase(LuizaLabsAPITestCase):
+    def setUp(self):
+        super().setUp()
+        product_cache.clear()
+        cache.clear()
+
+        self.product = Product.objects.create(title='Produto 1', price=1, brand='Marca',
+                                              image='http://blob.luizalabs.com/images/img_1.png')
+        self.url = reverse('product-detail', kwargs={'pk': self.product.id})
+
+    def test_retrieve_from_cache(self):
+        """Testa que o segundo retrieve de um produto não consulta a base de dados"""
+        response = self.client.get(self.url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # apenas as queries da autenticação e dos validadores da requisição condicional
+        with self.assertNumQueries(3):
+            cached_response = self.client.get(self.url, format='json')
+        self.assertEqual(cached_response.data, response.data)
+        self.assertEqual(list(cached_response.data.keys()), list(response.data.keys()))
+        self.assertEqual(cached_response.data.get('url'), 'http://testserver' + self.url)
+
+        stats = product_cache.stats()
+        self.assertEqual((stats['local_hits'], stats['misses']), (1, 1))
+
+    def test_shared_tier(self):
+        """Testa que um processo sem o item em memória o recupera do cache compartilhado"""
+        self.client.get(self.url, format='json')
+
+        # simula outro processo, com o cache em memória vazio
+        product_cache.clear()
+        with self.assertNumQueries(3):
+            self.client.get(self.url, format='json')
+        self.assertEqual(product_cache.stats()['shared_hits'], 1)
+
+    def test_invalidate_on_save_and_delete(self):
+        """Testa que alterar ou remover o produto invalida o cache"""
+        self.client.get(self.url, format='json')
+
+        self.product.title = 'Produto alterado'
+        self.product.save()
+        response = self.client.get(self.url, format='json')
+        self.assertEqual(response.data.get('title'), 'Produto alterado')
+
+        self.client.patch(self.url, {'price': 10}, format='json')
+        response = self.client.get(self.url, format='json')
+        self.assertEqual(response.data.get('price'), 10)
+
+        self.product.delete()
+        response = self.client.get(self.url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cache_stats_admin_only(self):
+        """Testa que os contadores do cache podem ser acessados apenas por admins"""
+        response = self.client.get(reverse('product-cache-stats'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        User.objects.create_superuser('admin', 'admin@luizalabs.com', API_PASS)
+        self.client.login(username='admin', password=API_PASS)
+        response = self.client.get(reverse('product-cache-stats'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('misses', response.data)
+
+    def test_local_lru_bounded(self):
+        """Testa que o cache em memória remove o item usado há mais tempo ao atingir o limite"""
+        lru = LocalLRUCache(max_size=2, timeout=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        self.assertEqual(len(lru), 2)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a'), 1)
+
+        lru = LocalLRUCache(max_size=2, timeout=-1)
+        lru.set('a', 1)
+        self.assertIsNone(lru.get('a'))
+
+
+class ConditionalGetAPITestCase(LuizaLabsAPITestCase):
+    def setUp(self):
+        super().setUp()
+        product_cache.clear()
+        cache.clear()
+
+        self.customer = Customer.objects.create(name='Cliente 1', email='cliente1@luizalabs.com')
+        self.products = [Product.objects.create(title='Produto {}'.format(i), price=i, brand='Marca',
+                                                image='http://blob.luizalabs.com/images/img_{}.png'.format(i))
+                         for i in range(3)]
+        self.customer.wish_list.add(self.products[0])
+
+        self.product_url = reverse('product-detail', kwargs={'pk': self.products[0].id})
+        self.customer_url = reverse('customer-detail', kwargs={'pk': self.customer.id})
+        self.wishlist_url = reverse('customer-wishlist-list', kwargs={'customer_pk': self.customer.id})
+
+    def get_etag(self, url):
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Last-Modified', response)
+        return response['ETag']
+
+    def test_product_not_modified(self):
+        """Testa que o retrieve de um produto responde 304 sem carregar o produto"""
+        etag = self.get_etag(self.product_url)
+
+        # apenas as queries da autenticação e dos validadores
+        with self.assertNumQueries(3):
+            response = self.client.get(self.product_url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.get(self.product_url, format='json',
+                                   HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_product_etag_changes_on_update(self):
+        """Testa que alterar o produto altera o ETag"""
+        etag = self.get_etag(self.product_url)
+
+        self.client.patch(self.product_url, {'price': 10}, format='json')
+        response = self.client.get(self.product_url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data.get('price'), 10)
+
+    def test_customer_etag_changes_with_wishlist(self):
+        """Testa que o ETag do cliente muda ao incluir ou remover produtos da lista e ao alterar um produto da lista"""
+        etags = [self.get_etag(self.customer_url)]
+
+        self.client.post(self.wishlist_url, {'product': self.products[1].id}, format='json')
+        etags.append(self.get_etag(self.customer_url))
+
+        self.client.delete(reverse('customer-wishlist-detail', kwargs={'customer_pk': self.customer.id,
+                                                                       'product_pk': self.products[1].id}))
+        etags.append(self.get_etag(self.customer_url))
+
+        self.client.patch(self.product_url, {'title': 'Produto alterado'}, format='json')
+        etags.append(self.get_etag(self.customer_url))
+
+        self.customer.wish_list.remove(self.products[0])
+        etags.append(self.get_etag(self.customer_url))
+
+        self.assertEqual(len(set(etags)), len(etags))
+
+    @override_settings(WISHLIST_SNAPSHOT=True)
+    def test_customer_etag_with_snapshot(self):
+        """Testa que, com a lista serializada, o ETag do cliente muda ao alterar ou remover um produto da lista"""
+        etags = [self.get_etag(self.customer_url)]
+        response = self.client.get(self.customer_url, format='json', HTTP_IF_NONE_MATCH=etags[0])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # a versão da lista é incrementada após o commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self.product_url, {'title': 'Produto alterado'}, format='json')
+        etags.append(self.get_etag(self.customer_url))
+
+        # a alteração de um produto fora da lista não altera o cliente
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('product-detail', kwargs={'pk': self.products[2].id}), {'price': 10},
+                              format='json')
+        self.assertEqual(self.get_etag(self.customer_url), etags[-1])
+
+        # o produto removido continua na lista até a remoção definitiva
+        self.client.delete(self.product_url)
+        etags.append(self.get_etag(self.customer_url))
+        self.assertEqual(self.client.get(self.customer_url, format='json').data.get('wishList'), [])
+
+        self.assertEqual(len(set(etags)), len(etags))
+
+    def test_wishlist_not_modified(self):
+        """Testa que a lista de favoritos do cliente responde 304 enquanto não for alterada"""
+        etag = self.get_etag(self.wishlist_url)
+        response = self.client.get(self.wishlist_url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # a ETag depende da URL, outra página possui outro ETag
+        self.assertNotEqual(self.get_etag(self.wishlist_url + '?page_size=1'), etag)
+
+        self.client.post(self.wishlist_url, {'product': self.products[2].id}, format='json')
+        response = self.client.get(self.wishlist_url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_only_view_actions(self):
+        """Testa que a mixin não expõe actions que o ViewSet não possui, e responde também ao HEAD"""
+        url = reverse('customer-wishlist-detail', kwargs={'customer_pk': self.customer.id,
+                                                          'product_pk': self.products[0].id})
+        self.assertEqual(self.client.get(url, format='json').status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertFalse(hasattr(CustomerWishlistViewSet, 'retrieve'))
+        self.assertTrue(hasattr(CustomerWishlistViewSet, 'list'))
+
+        etag = self.get_etag(self.product_url)
+        response = self.client.head(self.product_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_not_found(self):
+        """Testa que recursos inexistentes continuam respondendo 404"""
+        response = self.client.get(reverse('product-detail', kwargs={'pk': 9999999}), format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('ETag', response)
+
+
+class ValuesSerializerAPITestCase(LuizaLabsAPITestCase):
+    def setUp(self):
+        super().setUp()
+        product_cache.clear()
+        cache.clear()
+
+        self.customers = [Customer.objects.create(name='Cliente {}'.format(i), email='cliente{}@luizalabs.com'.format(i))
+                          for i in range(5)]
+        self.products = [Product.objects.create(title='Produto {}'.format(i), price=i + .5, brand='Marca {}'.format(i),
+                                                image='http://blob.luizalabs.com/images/img_{}.png'.format(i),
+                                                review_score=i / 3 if i % 2 else None)
+                         for i in range(12)]
+        for index, customer in enumerate(self.customers[:4]):
+            customer.wish_list.add(*self.products[index:index + 6])
+
+    def get_content(self, url, fast):
+        # os produtos são serializados apenas na primeira consulta, as demais usam o cache
+        product_cache.clear()
+        cache.clear()
+        with override_settings(FAST_SERIALIZATION=fast):
+            response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.content
+
+    def assertSameContent(self, url):
+        self.assertEqual(self.get_content(url, fast=True), self.get_content(url, fast=False))
+
+    def test_same_content(self):
+        """Testa que as respostas montadas a partir de .values() são idênticas, byte a byte, às do serializer"""
+        customer_id = self.customers[0].id
+        wishlist_id = Wishlist.objects.order_by('id').first().id
+        urls = [
+            reverse('product-list') + '?page_size=1000',
+            reverse('product-detail', kwargs={'pk': self.products[1].id}),
+            reverse('product-detail', kwargs={'pk': self.products[2].id}),
+            reverse('customer-list'),
+            reverse('customer-list') + '?ordering=email&page_size=2',
+            reverse('customer-list') + '?page=2&page_size=2',
+            reverse('customer-detail', kwargs={'pk': customer_id}),
+            reverse('customer-detail', kwargs={'pk': self.customers[4].id}),
+            reverse('wishlist-list') + '?page_size=1000',
+            reverse('wishlist-detail', kwargs={'pk': wishlist_id}),
+            reverse('customer-wishlist-list', kwargs={'customer_pk': customer_id}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertSameContent(url)
+
+    def test_cursor_pages(self):
+        """Testa que a paginação por cursor retorna os mesmos links com as linhas de .values()"""
+        url = reverse('customer-list') + '?ordering=email&page_size=2'
+        with override_settings(FAST_SERIALIZATION=True):
+            next_url = self.client.get(url, format='json').data.get('next')
+        self.assertSameContent(next_url)
+
+    def test_not_found(self):
+        """Testa que as consultas de objetos inexistentes ou com id inválido retornam 404"""
+        with override_settings(FAST_SERIALIZATION=True):
+            for url in [reverse('customer-detail', kwargs={'pk': 9999999}), reverse('customer-detail', kwargs={'pk': 'a'}),
+                        reverse('product-detail', kwargs={'pk': 9999999}), reverse('wishlist-detail', kwargs={'pk': 'a'})]:
+                with self.subTest(url=url):
+                    response = self.client.get(url, format='json')
+                    self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_query_budget(self):
+        """Testa que a listagem de clientes com a lista de favoritos executa o mesmo número de queries"""
+        with override_settings(FAST_SERIALIZATION=True), self.assertNumQueries(4):
+            response = self.client.get(reverse('customer-list'), format='json')
+        self.assertEqual(len(response.data.get('results')[1].get('wishList')), 6)
+
+    def test_values_serializer(self):
+        """Testa o ValuesSerializer diretamente contra os serializers"""
+        request = APIRequestFactory().get('/')
+        context = {'request': request}
+        cases = [
+            (ProductSerializer, Product.objects.all()),
+            (CustomerSerializerWithRelatedObject, Customer.objects.order_by('id')),
+            (WishlistSerializerWithRelatedObject, Wishlist.objects.order_by('id')),
+        ]
+        for serializer_class, queryset in cases:
+            with self.subTest(serializer=serializer_class.__name__):
+                expected = JSONRenderer().render(serializer_class(queryset, many=True, context=context).data)
+                values_serializer = ValuesSerializer(serializer_class(context=context))
+                data = values_serializer.to_representation(values_serializer.values(queryset))
+                self.assertEqual(JSONRenderer().render(data), expected)
+
+
+class ExportAPITestCase(LuizaLabsAPITestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.customers = [Customer.objects.create(name='Cliente, "{}"'.format(i), email='cliente{}@luizalabs.com'.format(i))
+                          for i in range(3)]
+        self.products = [Product.objects.create(title='Produto {}'.format(i), price=i + .5, brand='Marca',
+                                                image='http://blob.luizalabs.com/images/img_{}.png'.format(i),
+                                                review_score=i or None)
+                         for i in range(7)]
+        self.customers[0].wish_list.add(*self.products[:4])
+        self.customers[1].wish_list.add(self.products[0])
+
+    def export(self, basename, **params):
+        response = self.client.get(reverse('{}-export'.format(basename)), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_export_ndjson(self):
+        """Testa a exportação dos produtos em NDJSON, ordenados pelo id"""
+        response, content = self.export('product')
+        self.assertTrue(response['Content-Type'].startswith('application/x-ndjson'))
+
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [product.id for product in self.products])
+        self.assertEqual(rows[0], {'id': self.products[0].id, 'sku': None, 'title': 'Produto 0', 'brand': 'Marca',
+                                   'price': .5, 'image': 'http://blob.luizalabs.com/images/img_0.png',
+                                   'reviewScore': None})
+
+    def test_export_csv(self):
+        """Testa a exportação dos clientes e da lista de favoritos em CSV"""
+        response, content = self.export('customer', output='csv')
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        rows = list(csv.reader(StringIO(content)))
+        self.assertEqual(rows[0], ['id', 'name', 'email'])
+        self.assertEqual(rows[1], [str(self.customers[0].id), 'Cliente, "0"', 'cliente0@luizalabs.com'])
+        self.assertEqual(len(rows), 4)
+
+        # o parâmetro format da API não altera a exportação
+        response, content = self.export('wishlist', output='csv', format='json')
+        rows = list(csv.reader(StringIO(content)))
+        self.assertEqual(rows[0], ['id', 'customer', 'product'])
+        self.assertEqual(len(rows), 6)
+
+    def test_export_streaming(self):
+        """Testa que a exportação é enviada em blocos e lida do cursor em partes"""
+        response = self.client.get(reverse('product-export'))
+        blocks = list(export_lines(export_rows(Product.objects.all(), ProductViewSet.export_fields, chunk_size=2),
+                                   ProductViewSet.export_fields, 'ndjson', flush_size=3))
+        self.assertEqual(len(blocks), 3)
+        self.assertEqual(''.join(blocks).encode(), b''.join(response.streaming_content))
+
+    def test_invalid_output(self):
+        """Testa que um formato inválido retorna erro de validação"""
+        response = self.client.get(reverse('product-export'), {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_requires_authentication(self):
+        """Testa que a exportação exige autenticação"""
+        self.client.logout()
+        response = self.client.get(reverse('product-export'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_export_command(self):
+        """Testa o comando de exportação, para a saída padrão e para arquivo"""
+        out, err = StringIO(), StringIO()
+        call_command('export', 'wishlists', stdout=out, stderr=err)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(set(rows[0]), {'id', 'customer', 'product'})
+        self.assertIn('5 linhas', err.getvalue())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'produtos.csv')
+            call_command('export', 'products', output='csv', file=path, chunk_size=2, stderr=StringIO())
+            with open(path, encoding='utf-8', newline='') as stream:
+                rows = list(csv.reader(stream))
+        self.assertEqual(rows[0], ['id', 'sku', 'title', 'brand', 'price', 'image', 'reviewScore'])
+        self.assertEqual(len(rows), 8)
+
+
+class ImportProductsTestCase(TestCase):
+    def setUp(self):
+        product_cache.clear()
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8', newline='') as stream:
+            stream.write(content)
+        return path
+
+    def import_products(self, path, **options):
+        out = StringIO()
+        call_command('import_products', path, stdout=out, **options)
+        return out.getvalue()
+
+    def test_import_csv(self):
+        """Testa a importação de um CSV, com linhas rejeitadas e SKU repetido"""
+        path = self.write_file('produtos.csv', (
+            'sku,title,brand,price,image,reviewScore\n'
+            'A1,Produto 1,Marca,10.5,http://blob.luizalabs.com/images/img_1.png,4.5\n'
+            'A2,Produto 2,Marca,abc,http://blob.luizalabs.com/images/img_2.png,\n'
+            'A3,Produto 3,,3,imagem,\n'
+            'A4,Produto 4,Marca,4,http://blob.luizalabs.com/images/img_4.png,\n'
+            'A1,Produto 1 alterado,Marca,11,http://blob.luizalabs.com/images/img_1.png,\n'
+        ))
+        output = self.import_products(path, batch_size=2)
+        self.assertIn('5 linhas lidas', output)
+        self.assertIn('2 incluídas', output)
+        self.assertIn('2 rejeitadas', output)
+
+        # prevalece a última linha do SKU repetido
+        product = Product.objects.get(sku='A1')
+        self.assertEqual((product.title, product.price, product.review_score), ('Produto 1 alterado', 11, None))
+        self.assertEqual(Product.objects.get(sku='A4').price, 4)
+
+        with open(path + '.rejects.ndjson', encoding='utf-8') as stream:
+            rejects = [json.loads(line) for line in stream]
+        self.assertEqual([reject['line'] for reject in rejects], [3, 4])
+        self.assertEqual(set(rejects[0]['errors']), {'price'})
+        self.assertEqual(set(rejects[1]['errors']), {'brand', 'image'})
+        self.assertEqual(rejects[1]['row']['sku'], 'A3')
+
+    def test_upsert(self):
+        """Testa que a importação atualiza apenas os produtos alterados, e invalida o cache"""
+        product = Product.objects.create(sku='B1', title='Produto 1', price=1, brand='Marca',
+                                         image='http://blob.luizalabs.com/images/img_1.png')
+        Product.objects.create(sku='B2', title='Produto 2', price=2, brand='Marca',
+                               image='http://blob.luizalabs.com/images/img_2.png')
+        product_cache.set_many({product.id: {'title': 'Produto 1'}})
+
+        path = self.write_file('produtos.ndjson', '\n'.join([
+            json.dumps({'sku': 'B1', 'title': 'Produto 1', 'brand': 'Marca', 'price': 1.5,
+                        'image': 'http://blob.luizalabs.com/images/img_1.png'}),
+            json.dumps({'sku': 'B2', 'title': 'Produto 2', 'brand': 'Marca', 'price': 2,
+                        'image': 'http://blob.luizalabs.com/images/img_2.png'}),
+            json.dumps({'sku': 'B3', 'title': 'Produto 3', 'brand': 'Marca', 'price': 3,
+                        'image': 'http://blob.luizalabs.com/images/img_3.png', 'reviewScore': 5}),
+            '{"sku": "B4", ',
+            '[1, 2]',
+        ]) + '\n')
+        output = self.import_products(path, reject_file=os.path.join(self.directory.name, 'rejeitados.ndjson'))
+        self.assertIn('1 incluídas, 1 atualizadas, 1 sem alteração, 2 rejeitadas (0 de produtos removidos)', output)
+        self.assertIn('rejeitados.ndjson', output)
+
+        self.assertEqual(Product.objects.get(sku='B1').price, 1.5)
+        self.assertEqual(Product.objects.get(sku='B3').review_score, 5)
+        self.assertIsNone(product_cache.get(product.id))
+
+    def test_import_deleted_product(self):
+        """Testa que as linhas com o SKU de um produto removido são rejeitadas, sem alterar o produto"""
+        product = Product.objects.create(sku='D1', title='Produto 1', price=1, brand='Marca',
+                                         image='http://blob.luizalabs.com/images/img_1.png')
+        soft_delete(product)
+        path = self.write_file('produtos.csv', (
+            'sku,title,brand,price,image,reviewScore\n'
+            'D1,Produto 1 novo,Marca,2,http://blob.luizalabs.com/images/img_1.png,\n'
+            'D2,Produto 2,Marca,2,http://blob.luizalabs.com/images/img_2.png,\n'
+        ))
+        output = self.import_products(path)
+        self.assertIn('1 incluídas, 0 atualizadas, 0 sem alteração, 1 rejeitadas (1 de produtos removidos)', output)
+
+        product = Product.all_objects.get(sku='D1')
+        self.assertEqual((product.title, product.price), ('Produto 1', 1))
+        self.assertIsNotNone(product.deleted_at)
+        with open(path + '.rejects.ndjson', encoding='utf-8') as stream:
+            rejects = [json.loads(line) for line in stream]
+        self.assertEqual([(reject['line'], set(reject['errors']), reject['row']['sku']) for reject in rejects],
+                         [(2, {'sku'}, 'D1')])
+
+    def test_import_without_sku(self):
+        """Testa que as linhas sem SKU são rejeitadas, em vez de agrupadas em um único produto"""
+        path = self.write_file('produtos.csv', (
+            'sku,title,brand,price,image,reviewScore\n'
+            ',Produto 1,Marca,1,http://blob.luizalabs.com/images/img_1.png,\n'
+            ' ,Produto 2,Marca,2,http://blob.luizalabs.com/images/img_2.png,\n'
+            'E3,Produto 3,Marca,3,http://blob.luizalabs.com/images/img_3.png,\n'
+        ))
+        output = self.import_products(path)
+        self.assertIn('1 incluídas, 0 atualizadas, 0 sem alteração, 2 rejeitadas (0 de produtos removidos)', output)
+        self.assertEqual(list(Product.objects.values_list('sku', flat=True)), ['E3'])
+
+        with open(path + '.rejects.ndjson', encoding='utf-8') as stream:
+            rejects = [json.loads(line) for line in stream]
+        self.assertEqual([(reject['line'], set(reject['errors'])) for reject in rejects], [(2, {'sku'}), (3, {'sku'})])
+
+        with self.assertRaises(ValueError):
+            Product.objects.import_rows([(1, None, 'Produto 1', 'Marca', 1, 'http://a.com/1.png', None)])
+
+    def test_export_and_import(self):
+        """Testa que o arquivo exportado pode ser importado novamente sem alterações"""
+        for i in range(3):
+            Product.objects.create(sku='C{}'.format(i), title='Produto {}'.format(i), price=i, brand='Marca',
+                                   image='http://blob.luizalabs.com/images/img_{}.png'.format(i), review_score=i or None)
+
+        path = os.path.join(self.directory.name, 'produtos.csv')
+        call_command('export', 'products', output='csv', file=path, stderr=StringIO())
+        output = self.import_products(path)
+        self.assertIn('0 incluídas, 0 atualizadas, 3 sem alteração, 0 rejeitadas', output)
+
+
+class ProductFilterAPITestCase(LuizaLabsAPITestCase):
+    def setUp(self):
+        super().setUp()
+        product_cache.clear()
+        cache.clear()
+
+        data = [
+            ('Geladeira Frost Free Inox', 'Brastemp', 3500, 4.5),
+            ('Geladeira Duplex Branca', 'Consul', 2100, 3.9),
+            ('Fogão 4 bocas', 'Consul', 900, None),
+            ('Smartphone Galaxy', 'Samsung', 1900, 4.8),
+            ('Televisão 50 polegadas', 'Samsung', 2100, 4.1),
+        ]
+        self.products = [Product.objects.create(title=title, brand=brand, price=price, review_score=review_score,
+                                                image='http://blob.luizalabs.com/images/img_{}.png'.format(i))
+                         for i, (title, brand, price, review_score) in enumerate(data)]
+
+    def list_titles(self, **params):
+        response = self.client.get(reverse('product-list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product['title'] for product in response.data.get('results')]
+
+    def test_filter_brand(self):
+        """Testa o filtro por uma ou mais marcas"""
+        self.assertEqual(self.list_titles(brand='Consul'), ['Fogão 4 bocas', 'Geladeira Duplex Branca'])
+        self.assertEqual(len(self.list_titles(brand='Consul,Samsung')), 4)
+
+    def test_filter_price_and_review_score(self):
+        """Testa os filtros de faixa de preço e nota mínima"""
+        self.assertEqual(self.list_titles(price_min=1900, price_max=2100, ordering='price'),
+                         ['Smartphone Galaxy', 'Geladeira Duplex Branca', 'Televisão 50 polegadas'])
+        self.assertEqual(self.list_titles(review_score_min=4.5, ordering='-review_score'),
+                         ['Smartphone Galaxy', 'Geladeira Frost Free Inox'])
+
+        response = self.client.get(reverse('product-list'), {'price_min': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ordering_tiebreak(self):
+        """Testa que produtos com o mesmo preço são desempatados pelo id"""
+        self.assertEqual(self.list_titles(ordering='-price', brand='Consul,Samsung')[:2],
+                         ['Televisão 50 polegadas', 'Geladeira Duplex Branca'])
+
+    # A listagem de produtos é paginada por número de página; o cursor é testado com os filtros e ordenações de Product
+    @mock.patch.object(ProductViewSet, 'pagination_class', KeysetPagination)
+    def test_cursor_pages(self):
+        """Testa que a paginação por cursor percorre todos os produtos ordenados por preço, com preços repetidos"""
+        titles = []
+        url = reverse('product-list') + '?ordering=price&page_size=2'
+        while url:
+            response = self.client.get(url, format='json')
+            self.assertNotIn('count', response.data)
+            titles += [product['title'] for product in response.data.get('results')]
+            url = response.data.get('next')
+        self.assertEqual(titles, [product.title for product in Product.objects.order_by('price', 'id')])
+
+    @mock.patch.object(ProductViewSet, 'pagination_class', KeysetPagination)
+    def test_cursor_pages_nulls_and_ties(self):
+        """Testa que o cursor percorre os produtos sem avaliação e com valores repetidos, nos dois sentidos"""
+        self.products += [Product.objects.create(title='Produto {}'.format(i), brand='Marca', price=2100,
+                                                 review_score=None if i % 2 else 4.1,
+                                                 image='http://blob.luizalabs.com/images/img_p{}.png'.format(i))
+                          for i in range(6)]
+
+        for ordering in ('review_score', '-review_score', 'price', '-price'):
+            with self.subTest(ordering=ordering):
+                expected = [product.title for product in Product.objects.order_by(ordering, ordering[:-len(
+                    ordering.lstrip('-'))] + 'id')]
+
+                titles, responses = [], []
+                url = reverse('product-list') + '?ordering={}&page_size=3'.format(ordering)
+                while url:
+                    response = self.client.get(url, format='json')
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+                    responses.append(response)
+                    titles += [product['title'] for product in response.data.get('results')]
+                    url = response.data.get('next')
+                self.assertEqual(titles, expected)
+
+                # volta da última página até a primeira pelo link previous
+                titles = []
+                url = responses[-1].data.get('previous')
+                while url:
+                    response = self.client.get(url, format='json')
+                    titles = [product['title'] for product in response.data.get('results')] + titles
+                    url = response.data.get('previous')
+                self.assertEqual(titles + [product['title'] for product in responses[-1].data.get('results')],
+                                 expected)
+
+    def test_search(self):
+        """Testa a busca textual no título e na marca, com radicais em português"""
+        self.assertEqual(self.list_titles(search='geladeiras'),
+                         ['Geladeira Duplex Branca', 'Geladeira Frost Free Inox'])
+        self.assertEqual(self.list_titles(search='geladeira -inox'), ['Geladeira Duplex Branca'])
+        self.assertEqual(self.list_titles(search='samsung galaxy'), ['Smartphone Galaxy'])
+
+        # o tsvector é atualizado quando o título muda
+        self.client.patch(reverse('product-detail', kwargs={'pk': self.products[2].id}),
+                          {'title': 'Fogão de piso'}, format='json')
+        self.assertEqual(self.list_titles(search='piso'), ['Fogão de piso'])
+
+    def test_search_imported_product(self):
+        """Testa que os produtos incluídos pela importação também são encontrados"""
+        Product.objects.import_rows([(1, 'SKU-1', 'Micro-ondas 30 litros', 'Electrolux', 600, 'http://a.com/1.png', None)])
+        self.assertEqual(self.list_titles(search='micro-ondas'), ['Micro-ondas 30 litros'])
+        self.assertEqual(self.list_titles(search='SKU-1'), ['Micro-ondas 30 litros'])
+
+    def test_fuzzy(self):
+        """Testa a busca aproximada por trigramas, tolerante a erros de digitação"""
+        self.assertEqual(self.list_titles(fuzzy='Smartfone Galaxi'), ['Smartphone Galaxy'])
+
+    def test_admin_search(self):
+        """Testa que a busca do admin usa a busca textual"""
+        User.objects.create_superuser('admin', 'admin@luizalabs.com', API_PASS)
+        self.client.login(username='admin', password=API_PASS)
+        response = self.client.get(reverse('admin:api_product_changelist'), {'q': 'televisao'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+        response = self.client.get(reverse('admin:api_product_changelist'), {'q': 'televisão'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+    def test_filters_use_indexes(self):
+        """Testa que cada combinação de filtro e ordenação suportada é atendida por um índice"""
+        cases = [
+            ({'brand': 'Consul'}, ['-id']),
+            ({'brand': 'Consul', 'price_min': 100, 'price_max': 1000}, ['price', 'id']),
+            ({'brand': 'Consul'}, ['-review_score', '-id']),
+            ({'price_min': 100, 'price_max': 1000}, ['-id']),
+            ({}, ['price', 'id']),
+            ({'review_score_min': 4}, ['-review_score', '-id']),
+            ({'search': 'geladeira'}, ['-id']),
+            ({'fuzzy': 'geladera'}, ['-id']),
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+        for params, ordering in cases:
+            with self.subTest(params=params, ordering=ordering):
+                queryset = ProductFilter(params, queryset=Product.objects.all()).qs.order_by(*ordering)[:10]
+                self.assertNotIn('Seq Scan', queryset.explain())
+
+
+class ProductWishlistCountAPITestCase(LuizaLabsAPITestCase):
+    def setUp(self):
+        super().setUp()
+        product_cache.clear()
+
+        # cria massa de teste diretamente na base
+        self.customers = [Customer.objects.create(name='Cliente {}'.format(i), email='cliente{}@luizalabs.com'.format(i))
+                          for i in range(4)]
+        self.products = [Product.objects.create(title='Produto {}'.format(i), price=i, brand='Marca',
+                                                image='http://blob.luizalabs.com/images/img_{}.png'.format(i))
+                         for i in range(5)]
+
+    def merged_counts(self):
+        """Soma as parcelas pendentes e retorna o contador de cada produto"""
+        Product.objects.merge_wishlist_counts()
+        self.assertFalse(ProductWishlistCount.objects.exists())
+        return dict(Product.objects.filter(pk__in=[product.pk for product in self.products])
+                    .values_list('id', 'wishlist_count'))
+
+    def expected_counts(self):
+        counts = dict.fromkeys([product.pk for product in self.products], 0)
+        for product_id in Wishlist.objects.values_list('product_id', flat=True):
+            counts[product_id] += 1
+        return counts
+
+    def test_count_api_operations(self):
+        """Testa o contador nas inclusões e remoções pela API, inclusive em lote"""
+        customers, products = self.customers, self.products
+        for customer in customers:
+            response = self.client.post(reverse('wishlist-list'),
+                                        {'customer': customer.id, 'product': products[0].id}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # a inclusão duplicada não altera o contador
+        response = self.client.post(reverse('wishlist-list'),
+                                    {'customer': customers[0].id, 'product': products[0].id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        items = [{'customer': customer.id, 'product': product.id} for customer in customers[:2] for product in products]
+        response = self.client.post(reverse('wishlist-bulk-add'), {'items': items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        items = [{'customer': customers[0].id, 'product': product.id} for product in products[1:]]
+        response = self.client.post(reverse('wishlist-bulk-remove'), {'items': items + items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.delete(reverse('customer-wishlist-detail', kwargs={'customer_pk': customers[3].id,
+                                                                                  'product_pk': products[0].id}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        counts = self.merged_counts()
+        self.assertEqual(counts, self.expected_counts())
+        self.assertEqual(counts[products[0].id], 3)
+        self.assertEqual(counts[products[1].id], 1)
+
+    def test_count_orm_operations(self):
+        """Testa o contador nas alterações feitas pelo ORM (ex.: admin e Customer.wish_list)"""
+        customers, products = self.customers, self.products
+        customers[0].wish_list.add(*products)
+        products[0].customer_set.add(*customers[1:])
+        customers[1].wish_list.remove(products[0])
+        customers[2].wish_list.clear()
+
+        item = Wishlist.objects.create(customer=customers[3], product=products[1])
+        item.product = products[2]
+        item.save()
+        item.product = products[3]
+        item.save()
+
+        # a remoção considera o produto gravado, e não o alterado na instância
+        item = Wishlist.objects.get(customer=customers[0], product=products[4])
+        item.product = products[1]
+        item.delete()
+
+        # a inclusão que viola a chave única é desfeita junto com o contador
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Wishlist.objects.create(customer=customers[0], product=products[0])
+
+        response = self.client.patch(reverse('wishlist-detail', kwargs={'pk': customers[0].wishlist_set.get(
+            product=products[3]).pk}), {'product': products[4].id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.merged_counts(), self.expected_counts())
+
+    def test_shards(self):
+        """Testa que as inclusões do mesmo produto são distribuídas entre as parcelas"""
+        items = [{'customer': customer.id, 'product': self.products[0].id} for customer in self.customers]
+        self.client.post(reverse('wishlist-bulk-add'), {'items': items}, format='json')
+        for customer in self.customers:
+            Wishlist.objects.count_products({self.products[0].id: 1})
+
+        shards = ProductWishlistCount.objects.filter(product=self.products[0])
+        self.assertLessEqual(shards.count(), ProductWishlistCount.shards)
+        self.assertEqual(sum(shards.values_list('delta', flat=True)), 8)
+        self.assertEqual(self.merged_counts()[self.products[0].id], 8)
+
+        # as parcelas são somadas ao valor atual do contador
+        Wishlist.objects.count_products({self.products[0].id: -3})
+        self.assertEqual(self.merged_counts()[self.products[0].id], 5)
+
+    def test_stale_product_save(self):
+        """Testa que salvar um produto carregado antes da soma das parcelas mantém o contador somado"""
+        product = Product.objects.get(pk=self.products[0].pk)
+        products = Product.objects.filter(pk=product.pk)
+        self.customers[0].wish_list.add(product)
+        self.customers[1].wish_list.add(product)
+        self.assertEqual(self.merged_counts()[product.pk], 2)
+
+        product.title = 'Produto alterado'
+        product.save()
+        response = self.client.put(reverse('product-detail', kwargs={'pk': product.pk}), {
+            'title': 'Produto alterado pela API', 'price': 1, 'brand': 'Marca',
+            'image': 'http://blob.luizalabs.com/images/img_0.png'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(products.values_list('title', 'wishlist_count').get(), ('Produto alterado pela API', 2))
+        self.assertTrue(search_products(products, 'alterado').exists())
+
+    def test_reconcile(self):
+        """Testa o recálculo dos contadores a partir das listas de favoritos"""
+        self.customers[0].wish_list.add(*self.products[:3])
+        self.customers[1].wish_list.add(self.products[0])
+        Product.objects.filter(pk=self.products[3].pk).update(wishlist_count=10)
+        Product.objects.filter(pk=self.products[0].pk).update(wishlist_count=1)
+
+        out = StringIO()
+        call_command('reconcile_wishlist_counts', stdout=out)
+        self.assertIn('4 produtos corrigidos', out.getvalue())
+        self.assertFalse(ProductWishlistCount.objects.exists())
+        self.assertEqual(self.merged_counts(), self.expected_counts())
+
+        # sem diferenças, nenhum produto é alterado
+        self.assertEqual(Product.objects.reconcile_wishlist_counts(), 0)
+
+    def test_merge_command(self):
+        """Testa o comando que soma as parcelas pendentes"""
+        self.customers[0].wish_list.add(*self.products[:2])
+
+        out = StringIO()
+        call_command('merge_wishlist_counts', stdout=out)
+        self.assertIn('2 produtos atualizados', out.getvalue())
+
+    def test_delete_product_with_pending_counts(self):
+        """Testa a remoção de um produto com parcelas pendentes, que são descartadas"""
+        Wishlist.objects.count_products({self.products[0].id: 1})
+        response = self.client.delete(reverse('product-detail', kwargs={'pk': self.products[0].id}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        call_command('purge_deleted', stdout=StringIO())
+        self.assertEqual(Product.objects.merge_wishlist_counts(), 0)
+
+    def test_top(self):
+        """Testa a listagem dos produtos mais favoritados"""
+        customers, products = self.customers, self.products
+        for count, product in zip([1, 4, 2, 2], products):
+            product.customer_set.add(*customers[:count])
+        Product.objects.merge_wishlist_counts()
+
+        url = reverse('product-top')
+        for fast_serialization in (False, True):
+            with self.subTest(fast_serialization=fast_serialization), \
+                    override_settings(FAST_SERIALIZATION=fast_serialization):
+                # autenticação (2) e produtos (1)
+                with self.assertNumQueries(3):
+                    response = self.client.get(url, {'limit': 3})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual([(item['id'], item['wishlistCount']) for item in response.data],
+                                 [(products[1].id, 4), (products[3].id, 2), (products[2].id, 2)])
+                self.assertEqual(response.data[0]['title'], 'Produto 1')
+
+        response = self.client.get(url)
+        self.assertEqual(len(response.data), 4)
+
+        for limit in ('0', '101', 'abc'):
+            response = self.client.get(url, {'limit': limit})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # o contador não faz parte do produto serializado nas demais operações
+        response = self.client.get(reverse('product-detail', kwargs={'pk': products[1].id}))
+        self.assertNotIn('wishlistCount', response.data)
+
+    def test_top_uses_index(self):
+        """Testa que a listagem dos mais favoritados é lida pelo índice do contador"""
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        queryset = Product.objects.filter(wishlist_count__gt=0).order_by('-wishlist_count', '-id')[:10]
+        self.assertIn('api_product_wishlist_count_idx', queryset.explain())
+
+
+@override_settings(WISHLIST_SNAPSHOT=True)
+class WishlistSnapshotAPITestCase(LuizaLabsAPITestCase):
+    def setUp(self):
+        super().setUp()
+        product_cache.clear()
+
+        # cria massa de teste diretamente na base
+        self.customers = [Customer.objects.create(name='Cliente {}'.format(i), email='cliente{}@luizalabs.com'.format(i))
+                          for i in range(3)]
+        self.products = [Product.objects.create(title='Produto {}'.format(i), price=i * 10.5, brand='Marca',
+                                                image='http://blob.luizalabs.com/images/img_{}.png'.format(i),
+                                                review_score=i or None, sku='S{}'.format(i))
+                         for i in range(5)]
+        self.customers[0].wish_list.add(*self.products[:3])
+        self.customers[1].wish_list.add(self.products[0])
+        self.url = reverse('customer-detail', kwargs={'pk': self.customers[0].id})
+
+    def get_content(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.content
+
+    def test_same_content(self):
+        """Testa que a resposta com a lista serializada é idêntica, byte a byte, à do serializer"""
+        for customer in self.customers:
+            url = reverse('customer-detail', kwargs={'pk': customer.id})
+            with self.subTest(customer=customer.name):
+                with override_settings(WISHLIST_SNAPSHOT=False):
+                    expected = self.get_content(url)
+                self.assertEqual(self.get_content(url), expected)
+                self.assertEqual(self.get_content(url), expected)
+                self.assertEqual(self.get_content(url + '?format=json'), self.get_content(url + '?format=json'))
+
+    def test_query_budget(self):
+        """Testa que a lista serializada é lida com o cliente em uma única query"""
+        self.client.get(self.url)
+
+        # autenticação (2), validadores da requisição condicional (1) e cliente com a lista (1)
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data.get('wishList')), 3)
+
+    def test_rebuild_on_change(self):
+        """Testa que a lista é serializada novamente após inclusões, remoções e alterações dos produtos"""
+        def product_ids():
+            return [product['id'] for product in self.client.get(self.url).data.get('wishList')]
+
+        self.assertEqual(product_ids(), [product.id for product in reversed(self.products[:3])])
+
+        self.client.post(reverse('wishlist-list'), {'customer': self.customers[0].id, 'product': self.products[3].id},
+                         format='json')
+        self.assertIn(self.products[3].id, product_ids())
+
+        self.client.post(reverse('wishlist-bulk-remove'),
+                         {'items': [{'customer': self.customers[0].id, 'product': self.products[0].id}]}, format='json')
+        self.assertNotIn(self.products[0].id, product_ids())
+
+        self.client.delete(reverse('customer-wishlist-detail', kwargs={'customer_pk': self.customers[0].id,
+                                                                       'product_pk': self.products[3].id}))
+        self.assertNotIn(self.products[3].id, product_ids())
+
+        # os clientes que possuem o produto alterado são atualizados após o commit
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('product-detail', kwargs={'pk': self.products[1].id}),
+                                         {'title': 'Produto alterado'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        titles = [product['title'] for product in self.client.get(self.url).data.get('wishList')]
+        self.assertIn('Produto alterado', titles)
+
+        # a importação não dispara os signals do modelo
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'produtos.csv')
+            with open(path, 'w', encoding='utf-8') as stream:
+                stream.write('sku,title,brand,price,image,reviewScore\n'
+                             'S2,Produto importado,Marca,1,http://blob.luizalabs.com/images/img_2.png,\n')
+            call_command('import_products', path, stdout=StringIO())
+        titles = [product['title'] for product in self.client.get(self.url).data.get('wishList')]
+        self.assertIn('Produto importado', titles)
+
+    def test_stale_customer_save(self):
+        """Testa que salvar um cliente carregado antes de uma remoção não torna válida a lista serializada anterior"""
+        def product_ids():
+            return [product['id'] for product in self.client.get(self.url).data.get('wishList')]
+
+        customer = Customer.objects.get(pk=self.customers[0].pk)
+        self.assertEqual(len(product_ids()), 3)
+
+        response = self.client.post(reverse('wishlist-bulk-remove'), {'items': [
+            {'customer': customer.id, 'product': product.id} for product in self.products[:2]]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        customer.name = 'Cliente alterado'
+        customer.save()
+        self.assertEqual(product_ids(), [self.products[2].id])
+
+        # a versão não diminui nem com uma alteração explícita
+        version = Customer.objects.get(pk=customer.pk).wishlist_version
+        Customer.objects.filter(pk=customer.pk).update(wishlist_version=0)
+        self.assertEqual(Customer.objects.get(pk=customer.pk).wishlist_version, version)
+        self.assertEqual(product_ids(), [self.products[2].id])
+
+    def test_not_found(self):
+        """Testa a consulta de um cliente inexistente"""
+        response = self.client.get(reverse('customer-detail', kwargs={'pk': 9999999}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_delete_customer(self):
+        """Testa que a lista serializada é removida com o cliente"""
+        self.client.get(reverse('customer-detail', kwargs={'pk': self.customers[2].id}))
+        self.assertTrue(CustomerWishlistSnapshot.objects.filter(customer=self.customers[2]).exists())
+
+        response = self.client.delete(reverse('customer-detail', kwargs={'pk': self.customers[2].id}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        call_command('purge_deleted', stdout=StringIO())
+        self.assertFalse(CustomerWishlistSnapshot.objects.exists())
+
+    def test_commands(self):
+        """Testa a reconstrução e a verificação das listas serializadas"""
+        out = StringIO()
+        call_command('rebuild_wishlist_snapshots', stdout=out)
+        self.assertIn('3 listas reconstruídas', out.getvalue())
+
+        out = StringIO()
+        call_command('rebuild_wishlist_snapshots', stdout=out)
+        self.assertIn('0 listas reconstruídas', out.getvalue())
+
+        # uma alteração que não incrementa a versão da lista torna a lista divergente
+        Product.objects.filter(pk=self.products[0].pk).update(title='Alterado sem signal')
+        self.customers[1].wish_list.add(self.products[4])
+
+        with self.assertRaises(CommandError):
+            call_command('check_wishlist_snapshots', stdout=StringIO())
+
+        out = StringIO()
+        call_command('check_wishlist_snapshots', '--fix', stdout=out)
+        self.assertIn('3 listas verificadas: 1 desatualizadas, 1 divergentes (reconstruídas)', out.getvalue())
+
+        call_command('rebuild_wishlist_snapshots', '--all', stdout=StringIO())
+        out = StringIO()
+        call_command('check_wishlist_snapshots', stdout=out)
+        self.assertIn('3 listas verificadas: 0 desatualizadas, 0 divergentes', out.getvalue())
+
+
+class AsyncReadViewAPITestCase(LuizaLabsAPITestCase):
+    def setUp(self):
+        super().setUp()
+        product_cache.clear()
+
+        # cria massa de teste diretamente na base
+        self.customers = [Customer.objects.create(name='Cliente {}'.format(i), email='cliente{}@luizalabs.com'.format(i))
+                          for i in range(4)]
+        self.products = [Product.objects.create(title='Produto {}'.format(i), price=i * 10.5, brand='Marca',
+                                                image='http://blob.luizalabs.com/images/img_{}.png'.format(i),
+                                                review_score=i or None)
+                         for i in range(5)]
+        for customer in self.customers[:3]:
+            customer.wish_list.add(*self.products[:3])
+        self.async_client.force_login(User.objects.get(username=API_USER))
+
+    def assertSameResponse(self, url):
+        async_url = url.replace('/api/', '/api/async/', 1)
+        expected = self.client.get(url)
+        response = self.client.get(async_url)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response['Content-Type'], expected['Content-Type'])
+
+        # os links de paginação apontam para a própria operação
+        self.assertEqual(response.content.replace(b'/api/async/', b'/api/'), expected.content)
+        return response
+
+    def test_same_response(self):
+        """Testa que as operações assíncronas retornam as mesmas respostas, byte a byte, das síncronas"""
+        urls = [
+            reverse('product-list'),
+            reverse('product-list') + '?page_size=2&ordering=price&brand=Marca',
+            reverse('product-list') + '?page=2&page_size=2',
+            reverse('product-detail', kwargs={'pk': self.products[1].id}),
+            reverse('product-detail', kwargs={'pk': 9999999}),
+            reverse('product-detail', kwargs={'pk': 'abc'}),
+            reverse('customer-list') + '?page_size=2',
+            reverse('customer-detail', kwargs={'pk': self.customers[0].id}),
+            reverse('customer-detail', kwargs={'pk': self.customers[3].id}),
+            reverse('wishlist-list'),
+            reverse('wishlist-detail', kwargs={'pk': Wishlist.objects.order_by('id').first().id}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertSameResponse(url)
+
+    def test_cursor_pages(self):
+        """Testa que os links de paginação percorrem todas as páginas pela operação assíncrona"""
+        url = reverse('async-product-list') + '?page_size=2'
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.json()
+            self.assertTrue(data['next'] is None or '/api/async/product/' in data['next'])
+            ids += [product['id'] for product in data['results']]
+            url = data['next']
+        self.assertEqual(ids, [product.id for product in reversed(self.products)])
+
+    def test_permissions(self):
+        """Testa que as operações assíncronas exigem autenticação, com a mesma resposta das síncronas"""
+        self.client.logout()
+        for url in (reverse('product-list'), reverse('customer-detail', kwargs={'pk': self.customers[0].id})):
+            with self.subTest(url=url):
+                response = self.assertSameResponse(url)
+                self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        # autenticação básica
+        self.client.credentials(HTTP_AUTHORIZATION='Basic ' + base64.b64encode(
+            '{}:{}'.format(API_USER, API_PASS).encode()).decode())
+        self.assertEqual(self.client.get(reverse('async-product-list')).status_code, status.HTTP_200_OK)
+
+    @override_settings(FAST_SERIALIZATION=False)
+    def test_object_permissions(self):
+        """Testa que as permissões por objeto são verificadas na consulta assíncrona, como na síncrona"""
+        class FirstCustomerPermission(permissions.IsAuthenticated):
+            def has_object_permission(self, request, view, obj):
+                return obj.pk == self.customer_pk
+
+        FirstCustomerPermission.customer_pk = self.customers[0].pk
+        with mock.patch.object(CustomerViewSet, 'permission_classes', [FirstCustomerPermission]):
+            for customer, expected in ((self.customers[0], status.HTTP_200_OK),
+                                       (self.customers[1], status.HTTP_403_FORBIDDEN)):
+                with self.subTest(customer=customer.pk):
+                    response = self.assertSameResponse(reverse('customer-detail', kwargs={'pk': customer.id}))
+                    self.assertEqual(response.status_code, expected)
+
+    def test_read_only(self):
+        """Testa que as operações assíncronas aceitam apenas leitura"""
+        response = self.client.post(reverse('async-product-list'), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def test_query_budget(self):
+        """Testa o número de queries das operações assíncronas"""
+        # autenticação (2), COUNT(*) (1) e página de produtos (1)
+        with self.assertNumQueries(4):
+            self.client.get(reverse('async-product-list'))
+
+        # autenticação (2), página de clientes (1) e listas de favoritos (1)
+        with self.assertNumQueries(4):
+            self.client.get(reverse('async-customer-list'))
+
+    async def test_async_client(self):
+        """Testa as operações assíncronas pelo cliente ASGI"""
+        # As requisições são sequenciais: no TestCase todas as queries devem usar a conexão da thread do teste. As
+        # requisições simultâneas são testadas pelo comando bench_asgi (BenchASGITransactionTestCase)
+        for product in self.products:
+            response = await self.async_client.get(reverse('async-product-detail', kwargs={'pk': product.id}))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()['id'], product.id)
+
+
+class BenchASGITransactionTestCase(TransactionTestCase):
+    def test_bench_command(self):
+        """Testa a execução do comando de comparação entre WSGI e ASGI"""
+        User.objects.create_user(API_USER, 'api.user@luizalabs.com', API_PASS)
+        Product.objects.create(title='Produto', price=1, brand='Marca', image='http://blob.luizalabs.com/images/img.png')
+
+        out = StringIO()
+        call_command('bench_asgi', '--user', API_USER, '--connections', '2', '--idle', '3', '--requests', '4',
+                     stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[:3] for line in lines[1:]],
+                         [['wsgi', '4', '0'], ['asgi-sync', '4', '0'], ['asgi', '4', '0']])
+
+        with self.assertRaises(CommandError):
+            call_command('bench_asgi', '--user', API_USER, '--modes', 'http2', stdout=StringIO())
+
+
+class DatabasePoolTestCase(TestCase):
+    def connect(self):
+        import psycopg2
+        return psycopg2.connect(**connection.get_connection_params())
+
+    def backend_pid(self, raw_connection):
+        with raw_connection.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def terminate(self, pid):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+        sleep(0.1)
+
+    def create_wrapper(self, **settings_dict):
+        # Mesmo alias da conexão padrão, usado pelos sinais do django.contrib.postgres
+        wrapper = DatabaseWrapper(dict(connection.settings_dict, **settings_dict), alias=connection.alias)
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_pool_reuses_connections(self):
+        """Testa que a conexão devolvida ao pool é reutilizada"""
+        pool = ConnectionPool(max_size=2, timeout=1)
+        self.addCleanup(pool.close)
+
+        raw_connection, created = pool.acquire(self.connect)
+        self.assertTrue(created)
+        raw_connection.autocommit = True
+        pid = self.backend_pid(raw_connection)
+        pool.release(raw_connection)
+
+        raw_connection, created = pool.acquire(self.connect)
+        self.assertFalse(created)
+        self.assertEqual(self.backend_pid(raw_connection), pid)
+
+        stats = pool.stats()
+        self.assertEqual((stats['size'], stats['idle'], stats['in_use']), (1, 0, 1))
+        self.assertEqual((stats['acquired'], stats['created'], stats['reused']), (2, 1, 1))
+        pool.release(raw_connection)
+
+    def test_pool_max_size_and_timeout(self):
+        """Testa o limite de conexões do pool e a espera pela liberação de uma conexão"""
+        pool = ConnectionPool(max_size=1, timeout=0.05)
+        self.addCleanup(pool.close)
+
+        raw_connection, created = pool.acquire(self.connect)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(self.connect)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+        # Liberada por outra thread durante a espera
+        pool.timeout = 5
+        thread = Thread(target=lambda: sleep(0.1) or pool.release(raw_connection))
+        thread.start()
+        reused, created = pool.acquire(self.connect)
+        thread.join()
+        self.assertIs(reused, raw_connection)
+        self.assertFalse(created)
+        self.assertGreater(pool.stats()['wait_seconds_max'], 0.05)
+        pool.release(reused)
+
+    def test_pool_discards_unusable_connections(self):
+        """Testa que conexões em uma transação, fechadas ou encerradas pelo servidor são descartadas"""
+        pool = ConnectionPool(max_size=1, timeout=1, health_checks=True)
+        self.addCleanup(pool.close)
+
+        # Em uma transação
+        raw_connection, created = pool.acquire(self.connect)
+        self.backend_pid(raw_connection)
+        pool.release(raw_connection)
+        self.assertTrue(raw_connection.closed)
+
+        # Fechada
+        raw_connection, created = pool.acquire(self.connect)
+        raw_connection.close()
+        pool.release(raw_connection)
+
+        # Encerrada pelo servidor enquanto ociosa no pool: descartada pelo health check
+        raw_connection, created = pool.acquire(self.connect)
+        raw_connection.autocommit = True
+        pid = self.backend_pid(raw_connection)
+        pool.release(raw_connection)
+        self.terminate(pid)
+        raw_connection, created = pool.acquire(self.connect)
+        self.assertTrue(created)
+        raw_connection.autocommit = True
+        self.assertNotEqual(self.backend_pid(raw_connection), pid)
+        pool.release(raw_connection)
+
+        stats = pool.stats()
+        self.assertEqual((stats['discarded'], stats['created'], stats['size']), (3, 4, 1))
+
+    def test_backend_pool(self):
+        """Testa o pool de conexões no backend: a conexão fechada pelo Django volta para o pool"""
+        wrapper = self.create_wrapper(POOL={'MAX_SIZE': 1, 'TIMEOUT': 0.05})
+        self.addCleanup(lambda: wrapper.pool.close())
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            pid = cursor.fetchone()[0]
+
+        # Com a conexão em uso, outro wrapper (outra thread) aguarda e falha
+        other = self.create_wrapper(POOL={'MAX_SIZE': 1, 'TIMEOUT': 0.05})
+        with self.assertRaises(OperationalError):
+            other.ensure_connection()
+
+        wrapper.close()
+        with other.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            self.assertEqual(cursor.fetchone()[0], pid)
+
+        # Uma conexão fechada com uma transação aberta não volta para o pool
+        other.set_autocommit(False)
+        with other.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        other.close()
+        stats = wrapper.pool.stats()
+        self.assertIs(other.pool, wrapper.pool)
+        self.assertEqual((stats['created'], stats['reused'], stats['timeouts'], stats['discarded'], stats['size']),
+                         (1, 1, 1, 1, 0))
+
+    def test_backend_health_checks(self):
+        """Testa que a conexão persistente encerrada pelo servidor é reaberta na próxima requisição"""
+        for health_checks in (False, True):
+            with self.subTest(health_checks=health_checks):
+                wrapper = self.create_wrapper(CONN_MAX_AGE=None, CONN_HEALTH_CHECKS=health_checks)
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT pg_backend_pid()')
+                    pid = cursor.fetchone()[0]
+
+                # Fim da requisição, a conexão persistente é mantida
+                wrapper.close_if_unusable_or_obsolete()
+                self.assertIsNotNone(wrapper.connection)
+                self.terminate(pid)
+
+                if not health_checks:
+                    with self.assertRaises(OperationalError):
+                        with wrapper.cursor() as cursor:
+                            cursor.execute('SELECT 1')
+                    continue
+
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT pg_backend_pid()')
+                    self.assertNotEqual(cursor.fetchone()[0], pid)
+
+    def test_pool_stats_admin_only(self):
+        """Testa que os contadores dos pools podem ser consultados apenas por administradores"""
+        User.objects.create_user(API_USER, 'api.user@luizalabs.com', API_PASS)
+        self.client.login(username=API_USER, password=API_PASS)
+        self.assertEqual(self.client.get(reverse('db-pool-stats')).status_code, status.HTTP_403_FORBIDDEN)
+
+        User.objects.create_superuser('admin', 'admin@luizalabs.com', API_PASS)
+        self.client.login(username='admin', password=API_PASS)
+        response = self.client.get(reverse('db-pool-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), pool_stats())
+
+
+@override_settings(DATABASE_REPLICAS=dict(settings.DATABASE_REPLICAS, ALIASES=['replica1'], PIN_SECONDS=5))
+class ReplicaRouterAPITestCase(LuizaLabsAPITestCase):
+    """
+    A réplica dos testes é uma segunda conexão com o banco de dados de testes, que não enxerga os dados criados pelo
+    teste (ainda não confirmados): uma leitura na réplica não encontra os clientes criados.
+    """
+    databases = {'default', 'replica1'}
+
+    def setUp(self) -> None:
+        super().setUp()
+        cache.clear()
+        router.reset_replicas()
+        self.addCleanup(router.reset_replicas)
+        self.customer = Customer.objects.create(name='Cliente 1', email='cliente1@luizalabs.com')
+        self.product = Product.objects.create(title='Produto 1', price=1, brand='Marca',
+                                              image='http://blob.luizalabs.com/images/img_1.png')
+
+    def test_reads_use_replica(self):
+        """Testa que list e retrieve são executados na réplica, e a autenticação no banco principal"""
+        with CaptureQueriesContext(connections['replica1']) as queries:
+            response = self.client.get(reverse('customer-list'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [])
+        self.assertTrue(any('api_customer' in query['sql'] for query in queries))
+        self.assertFalse(any('auth_user' in query['sql'] or 'django_session' in query['sql'] for query in queries))
+
+        url = reverse('customer-wishlist-list', kwargs={'customer_pk': self.customer.pk})
+        self.assertEqual(self.client.get(reverse('product-list'), format='json').data['results'], [])
+        self.assertEqual(self.client.get(url, format='json').data['results'], [])
+        self.assertEqual(self.client.get(reverse('customer-detail', kwargs={'pk': self.customer.pk}),
+                                         format='json').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(router.replica_stats(), {'replica1': {'available': True, 'lag': 0}})
+
+        # Fora das operações de leitura da API, as leituras são feitas no banco principal
+        self.assertIsNone(router.current_replica())
+        self.assertTrue(Customer.objects.filter(pk=self.customer.pk).exists())
+
+    def test_writes_pin_primary(self):
+        """Testa que, após uma escrita, as leituras do usuário e do cliente alterado são feitas no banco principal"""
+        url = reverse('customer-wishlist-list', kwargs={'customer_pk': self.customer.pk})
+        response = self.client.post(url, {'product': self.product.pk}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.get(reverse('customer-list'), format='json')
+        self.assertEqual([customer['id'] for customer in response.data['results']], [self.customer.pk])
+
+        # Outro usuário lê da réplica, exceto o cliente alterado
+        User.objects.create_user('other', 'other@luizalabs.com', API_PASS)
+        self.client.login(username='other', password=API_PASS)
+        self.assertEqual(self.client.get(reverse('customer-list'), format='json').data['results'], [])
+        response = self.client.get(reverse('customer-detail', kwargs={'pk': self.customer.pk}), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([product['id'] for product in response.data['wishList']], [self.product.pk])
+        self.assertEqual([item['product']['id'] for item in self.client.get(url, format='json').data['results']],
+                         [self.product.pk])
+
+        # Encerrado o período, o cliente volta a ser lido da réplica
+        cache.clear()
+        self.assertEqual(self.client.get(url, format='json').data['results'], [])
+
+    def test_body_writes_pin_customers(self):
+        """Testa que os clientes informados no corpo das escritas de /api/wishlist/ são lidos no banco principal"""
+        customers = [self.customer, Customer.objects.create(name='Cliente 2', email='cliente2@luizalabs.com')]
+        response = self.client.post(reverse('wishlist-list'), {'customer': customers[0].pk, 'product': self.product.pk},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(reverse('wishlist-bulk-add'), {'items': [
+            {'customer': customers[1].pk, 'product': self.product.pk}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Outro usuário lê os dois clientes alterados no banco principal
+        User.objects.create_user('other', 'other@luizalabs.com', API_PASS)
+        self.client.login(username='other', password=API_PASS)
+        self.assertEqual(self.client.get(reverse('customer-list'), format='json').data['results'], [])
+        for customer in customers:
+            with self.subTest(customer=customer.name):
+                url = reverse('customer-wishlist-list', kwargs={'customer_pk': customer.pk})
+                self.assertEqual([item['product']['id'] for item in self.client.get(url, format='json').data['results']],
+                                 [self.product.pk])
+
+    def test_pin_cache_check(self):
+        """Testa que a verificação da configuração rejeita um cache do processo para a leitura das próprias escritas"""
+        self.assertEqual([error.id for error in check_replica_pin_cache(None)], ['api.E001'])
+        shared = {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'api_cache'}
+        with override_settings(CACHES=dict(settings.CACHES, shared=shared),
+                               DATABASE_REPLICAS=dict(settings.DATABASE_REPLICAS, CACHE_ALIAS='shared')):
+            self.assertEqual(check_replica_pin_cache(None), [])
+        with override_settings(DATABASE_REPLICAS=dict(settings.DATABASE_REPLICAS, ALIASES=[])):
+            self.assertEqual(check_replica_pin_cache(None), [])
+
+    def test_lagging_replica_is_dropped(self):
+        """Testa que uma réplica com atraso acima do limite não recebe leituras"""
+        with override_settings(DATABASE_REPLICAS=dict(settings.DATABASE_REPLICAS, MAX_LAG=-1)):
+            response = self.client.get(reverse('customer-list'), format='json')
+        self.assertEqual([customer['id'] for customer in response.data['results']], [self.customer.pk])
+        self.assertEqual(router.replica_stats(), {'replica1': {'available': False, 'lag': 0}})
+
+    def test_failing_replica_is_dropped(self):
+        """Testa que uma réplica indisponível é descartada e a leitura é executada no banco principal"""
+        replica = connections['replica1']
+        error = OperationalError('could not connect to server')
+
+        # Indisponível na verificação
+        with mock.patch.object(replica, 'ensure_connection', side_effect=error):
+            response = self.client.get(reverse('customer-list'), format='json')
+        self.assertEqual([customer['id'] for customer in response.data['results']], [self.customer.pk])
+        self.assertFalse(router.replica_stats()['replica1']['available'])
+
+        # Falha durante a requisição, após a verificação
+        router.reset_replicas()
+        self.assertTrue(router.check_replica('replica1'))
+        with mock.patch.object(replica, 'ensure_connection', side_effect=error):
+            response = self.client.get(reverse('customer-detail', kwargs={'pk': self.customer.pk}), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(router.replica_stats()['replica1']['available'])
+
+
+@override_settings(INSTRUMENTATION={'ENABLED': True, 'SLOW_REQUEST_MS': 60000, 'SERVER_TIMING': True})
+class InstrumentationAPITestCase(LuizaLabsAPITestCase):
+    def setUp(self):
+        super().setUp()
+        product_cache.clear()
+        customer = Customer.objects.create(name='Cliente 1', email='cliente1@luizalabs.com')
+        customer.wish_list.add(Product.objects.create(title='Produto 1', price=1, brand='Marca',
+                                                      image='http://blob.luizalabs.com/images/img_1.png'))
+        self.async_client.force_login(User.objects.get(username=API_USER))
+
+    def parse_server_timing(self, response):
+        metrics = {}
+        for metric in response['Server-Timing'].split(', '):
+            name, *params = metric.split(';')
+            metrics[name] = dict(param.split('=', 1) for param in params)
+        return metrics
+
+    def test_server_timing(self):
+        """Testa o header Server-Timing com a quantidade de queries e os tempos de cada etapa"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('customer-list'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        metrics = self.parse_server_timing(response)
+        self.assertEqual(list(metrics), ['db', 'serialize', 'render', 'total'])
+        self.assertEqual(metrics['db']['desc'], '"{} queries"'.format(len(queries)))
+        durations = {name: float(params['dur']) for name, params in metrics.items()}
+        self.assertLessEqual(durations['db'] + durations['serialize'] + durations['render'], durations['total'])
+
+    def test_slow_request_log(self):
+        """Testa o log estruturado das requisições acima do limite, com o ViewSet e a action"""
+        # Abaixo do limite
+        with mock.patch('api.core.instrumentation.logger') as logger:
+            response = self.client.get(reverse('customer-list'), format='json')
+        self.assertIn('Server-Timing', response)
+        logger.warning.assert_not_called()
+
+        with override_settings(INSTRUMENTATION={'ENABLED': True, 'SLOW_REQUEST_MS': 0}), \
+                self.assertLogs('api.performance', 'WARNING') as logs:
+            self.client = self.client_class()
+            self.client.login(username=API_USER, password=API_PASS)
+            self.client.get(reverse('customer-wishlist-list', kwargs={'customer_pk': 1}), format='json')
+            self.client.post(reverse('customer-list'), {'name': 'Cliente 2', 'email': 'cliente2@luizalabs.com'},
+                             format='json')
+        records = [json.loads(line.split(':', 2)[2]) for line in logs.output]
+        self.assertEqual([(record['view'], record['method'], record['status']) for record in records],
+                         [('CustomerWishlistViewSet.list', 'GET', 200), ('CustomerViewSet.create', 'POST', 201)])
+        self.assertEqual(set(records[0]), {'method', 'path', 'status', 'view', 'total_ms', 'db_ms', 'queries',
+                                           'serialize_ms', 'render_ms'})
+
+    def test_disabled(self):
+        """Testa que, desabilitadas a instrumentação e as métricas, o middleware é removido da cadeia de middlewares"""
+        with override_settings(INSTRUMENTATION={'ENABLED': False}, METRICS={'ENABLED': False}):
+            self.client = self.client_class()
+            self.client.login(username=API_USER, password=API_PASS)
+            response = self.client.get(reverse('customer-list'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Server-Timing', response)
+        self.assertFalse(hasattr(response.wsgi_request, 'timings'))
+
+    async def test_async_view(self):
+        """Testa a instrumentação das operações assíncronas pelo cliente ASGI"""
+        response = await self.async_client.get(reverse('async-customer-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        metrics = self.parse_server_timing(response)
+        self.assertEqual(list(metrics), ['db', 'serialize', 'render', 'total'])
+        # autenticação (2), página de clientes (1) e listas de favoritos (1)
+        self.assertEqual(metrics['db']['desc'], '"4 queries"')
+
+
+def increment_metrics(directory, count):
+    """Executado em outro processo, como um worker do servidor"""
+    registry = MetricsRegistry(directory)
+    for _ in range(count):
+        registry.inc('api_requests_total', view='ProductViewSet', action='list', method='GET', status='200')
+
+
+class MetricsRegistryTestCase(TestCase):
+    def test_counters_and_histograms(self):
+        """Testa os contadores e histogramas atualizados por várias threads, no formato do Prometheus"""
+        registry = MetricsRegistry()
+
+        def work():
+            for value in (0.001, 0.02, 0.3, 30):
+                registry.observe('api_request_duration_seconds', value, view='CustomerViewSet', action='list')
+                registry.inc('api_requests_total', view='CustomerViewSet', action='list', method='GET', status='200')
+
+        threads = [Thread(target=work) for _ in range(4)]
+        deque(map(Thread.start, threads))
+        deque(map(Thread.join, threads))
+
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE api_requests_total counter', lines)
+        self.assertIn('api_requests_total{action="list",method="GET",status="200",view="CustomerViewSet"} 16.0',
+                      lines)
+        self.assertIn('# TYPE api_request_duration_seconds histogram', lines)
+        labels = 'action="list",view="CustomerViewSet"'
+        buckets = [line for line in lines if line.startswith('api_request_duration_seconds_bucket')]
+        self.assertEqual(buckets[0], 'api_request_duration_seconds_bucket{{{},le="0.005"}} 4.0'.format(labels))
+        self.assertIn('api_request_duration_seconds_bucket{{{},le="0.025"}} 8.0'.format(labels), buckets)
+        self.assertIn('api_request_duration_seconds_bucket{{{},le="0.5"}} 12.0'.format(labels), buckets)
+        self.assertEqual(buckets[-1], 'api_request_duration_seconds_bucket{{{},le="+Inf"}} 16.0'.format(labels))
+        self.assertIn('api_request_duration_seconds_count{{{}}} 16.0'.format(labels), lines)
+        # as threads encerradas reutilizam os shards, a ordem das somas (e o arredondamento) varia
+        total = next(line for line in lines if line.startswith('api_request_duration_seconds_sum{{{}}} '.format(labels)))
+        self.assertAlmostEqual(float(total.rsplit(' ', 1)[1]), 4 * (0.001 + 0.02 + 0.3 + 30))
+
+    def test_file_store_across_processes(self):
+        """Testa a soma das métricas de vários processos pelos arquivos do diretório compartilhado"""
+        with tempfile.TemporaryDirectory() as directory:
+            registry = MetricsRegistry(directory)
+            registry.inc('api_requests_total', view='ProductViewSet', action='list', method='GET', status='200')
+
+            # Muitas chaves, além do tamanho inicial do arquivo
+            for index in range(2000):
+                registry.inc('api_request_errors_total', view='ProductViewSet', action='action{}'.format(index))
+
+            processes = [multiprocessing.get_context('fork').Process(target=increment_metrics, args=(directory, 50))
+                         for _ in range(2)]
+            deque(map(multiprocessing.Process.start, processes))
+            for process in processes:
+                process.join()
+                self.assertEqual(process.exitcode, 0)
+
+            values = registry.collect()
+            key = registry.key('api_requests_total', view='ProductViewSet', action='list', method='GET', status='200')
+            self.assertEqual(values[key], 101)
+            self.assertEqual(values[registry.key('api_request_errors_total', view='ProductViewSet',
+                                                 action='action1999')], 1)
+            self.assertEqual(len(os.listdir(directory)), 3)
+
+    def test_reuse_thread_shards(self):
+        """Testa que o shard de uma thread encerrada é reutilizado pela próxima, sem perder os seus valores"""
+        with tempfile.TemporaryDirectory() as directory:
+            registry = MetricsRegistry(directory)
+            key = registry.key('api_requests_total', view='ProductViewSet', action='list', method='GET', status='200')
+
+            for _ in range(20):
+                thread = Thread(target=lambda: registry.inc('api_requests_total', view='ProductViewSet',
+                                                            action='list', method='GET', status='200'))
+                thread.start()
+                thread.join()
+
+            self.assertEqual(registry.collect()[key], 20)
+            self.assertEqual(len(os.listdir(directory)), 1)
+
+
+@override_settings(METRICS={'ENABLED': True, 'DIRECTORY': None})
+class MetricsAPITestCase(LuizaLabsAPITestCase):
+    def test_metrics_endpoint(self):
+        """Testa as métricas das actions dos ViewSets no endpoint do Prometheus, apenas para administradores"""
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        before = get_registry().collect()
+        key = MetricsRegistry.key('api_requests_total', view='CustomerViewSet', action='list', method='GET',
+                                  status='200')
+        for _ in range(3):
+            self.client.get(reverse('customer-list'), format='json')
+        self.client.get(reverse('customer-detail', kwargs={'pk': 9999}), format='json')
+        self.client.get(reverse('product-list'), format='json')
+
+        User.objects.create_superuser('admin', 'admin@luizalabs.com', API_PASS)
+        self.client.login(username='admin', password=API_PASS)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+
+        values = get_registry().collect()
+        self.assertEqual(values[key] - before.get(key, 0), 3)
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE api_request_queries histogram', lines)
+        for view, action, status_code in (('CustomerViewSet', 'retrieve', 404), ('ProductViewSet', 'list', 200)):
+            self.assertTrue(any(line.startswith('api_requests_total{{action="{}",method="GET",status="{}",view="{}"}}'
+                                                .format(action, status_code, view)) for line in lines))
+
+
+class TokenAPITestCase(LuizaLabsAPITestCase):
+    def bearer(self, token):
+        self.client.logout()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer {}'.format(token))
+
+    def test_token_create(self):
+        """Testa a emissão do token com usuário e senha e para o usuário autenticado por sessão"""
+        url = reverse('token-list')
+        response = self.client.post(url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['tokenType'], 'Bearer')
+        self.assertEqual(decode_token(response.data['token'])['n'], API_USER)
+
+        self.client.logout()
+        self.assertEqual(self.client.post(url, {}, format='json').status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.post(url, {'username': API_USER, 'password': 'errada'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {'username': API_USER}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {'username': API_USER, 'password': API_PASS}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Um token não emite outro token sem a senha
+        self.bearer(response.data['token'])
+        self.assertEqual(self.client.post(url, {}, format='json').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_authentication_without_queries(self):
+        """Testa a autenticação por token sem consultar os usuários e as sessões no banco de dados"""
+        admin = User.objects.create_superuser('admin', 'admin@luizalabs.com', API_PASS)
+        self.bearer(issue_token(admin)[0])
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('customer-list'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([query['sql'] for query in context.captured_queries
+                          if 'auth_user' in query['sql'] or 'django_session' in query['sql']], [])
+        response = self.client.get(reverse('user-list'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+        # O usuário sem a permissão de administrador no token não acessa as operações de administradores
+        self.bearer(issue_token(User.objects.get(username=API_USER))[0])
+        self.assertEqual(self.client.get(reverse('user-list')).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_invalid_token(self):
+        """Testa os tokens inválidos, expirados e revogados"""
+        user = User.objects.get(username=API_USER)
+        token = issue_token(user)[0]
+        for invalid in ('abc', token[:-2] + ('AA' if token[-2:] != 'AA' else 'BB'), token + ' extra'):
+            self.bearer(invalid)
+            self.assertEqual(self.client.get(reverse('customer-list')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        with override_settings(API_TOKEN={'LIFETIME': -10}):
+            expired = issue_token(user)[0]
+        self.bearer(expired)
+        response = self.client.get(reverse('customer-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+
+        self.bearer(token)
+        self.assertEqual(self.client.get(reverse('customer-list')).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.post(reverse('token-revoke'), {}, format='json').status_code,
+                         status.HTTP_204_NO_CONTENT)
+        response = self.client.get(reverse('customer-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(str(response.data['detail']), 'Token revogado.')
+
+    def test_token_revoke(self):
+        """Testa a revogação de um token informado, apenas do próprio usuário ou por administradores"""
+        user = User.objects.get(username=API_USER)
+        admin = User.objects.create_superuser('admin', 'admin@luizalabs.com', API_PASS)
+        token, other, admin_token = issue_token(user)[0], issue_token(user)[0], issue_token(admin)[0]
+
+        self.bearer(token)
+        response = self.client.post(reverse('token-revoke'), {'token': admin_token}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.post(reverse('token-revoke'), {'token': 'abc'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(reverse('token-revoke'), {'token': other}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get(reverse('customer-list')).status_code, status.HTTP_200_OK)
+
+        self.bearer(admin_token)
+        response = self.client.post(reverse('token-revoke'), {'token': token}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        for revoked in (token, other):
+            self.bearer(revoked)
+            self.assertEqual(self.client.get(reverse('customer-list')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_revoke_all(self):
+        """Testa a revogação de todos os tokens do usuário, sem revogar os tokens emitidos depois"""
+        user = User.objects.get(username=API_USER)
+        admin = User.objects.create_superuser('admin', 'admin@luizalabs.com', API_PASS)
+        tokens = [issue_token(user)[0] for _ in range(2)]
+
+        self.bearer(tokens[0])
+        response = self.client.post(reverse('token-revoke-all'), {'user': admin.pk}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.post(reverse('token-revoke-all'), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        for token in tokens:
+            self.bearer(token)
+            self.assertEqual(self.client.get(reverse('customer-list')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        token = issue_token(user)[0]
+        self.bearer(issue_token(admin)[0])
+        response = self.client.post(reverse('token-revoke-all'), {'user': user.pk}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.bearer(token)
+        self.assertEqual(self.client.get(reverse('customer-list')).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.bearer(issue_token(user)[0])
+        self.assertEqual(self.client.get(reverse('customer-list')).status_code, status.HTTP_200_OK)
+
+    def test_token_revoke_cache_eviction(self):
+        """Testa que as revogações continuam valendo após a remoção das entradas do cache, ex.: por outro processo"""
+        user = User.objects.get(username=API_USER)
+        token, other = issue_token(user)[0], issue_token(user)[0]
+        self.bearer(token)
+        self.assertEqual(self.client.post(reverse('token-revoke'), {}, format='json').status_code,
+                         status.HTTP_204_NO_CONTENT)
+
+        # O LocMemCache descarta entradas quando atinge MAX_ENTRIES (300)
+        cache.set_many({'api:test-fill:{}'.format(index): index for index in range(400)})
+        self.assertIsNone(cache.get('api:token-revoked:{}'.format(decode_token(token)['j'])))
+        self.assertEqual(self.client.get(reverse('customer-list')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.bearer(other)
+        self.assertEqual(self.client.post(reverse('token-revoke-all'), {}, format='json').status_code,
+                         status.HTTP_204_NO_CONTENT)
+        cache.clear()
+        self.assertEqual(self.client.get(reverse('customer-list')).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.bearer(issue_token(user)[0])
+        self.assertEqual(self.client.get(reverse('customer-list')).status_code, status.HTTP_200_OK)
+
+    def test_user_changes_revoke_tokens(self):
+        """Testa a revogação dos tokens do usuário alterado ou removido, exceto pelo login"""
+        user = User.objects.get(username=API_USER)
+        token = issue_token(user)[0]
+        self.client.login(username=API_USER, password=API_PASS)
+        self.bearer(token)
+        self.assertEqual(self.client.get(reverse('customer-list')).status_code, status.HTTP_200_OK)
+
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get(reverse('customer-list')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        token = issue_token(user)[0]
+        self.assertTrue(decode_token(token)['s'])
+        user.delete()
+        self.bearer(token)
+        self.assertEqual(self.client.get(reverse('customer-list')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class SoftDeleteAPITestCase(LuizaLabsAPITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.customers = [Customer.objects.create(name='Cliente {}'.format(i), email='cliente{}@luizalabs.com'.format(i))
+                          for i in range(3)]
+        self.products = [Product.objects.create(title='Produto {}'.format(i), price=i, brand='Marca',
+                                                image='http://blob.luizalabs.com/images/img_{}.png'.format(i))
+                         for i in range(3)]
+        for customer in self.customers:
+            customer.wish_list.add(*self.products[:2])
+        self.customers[0].wish_list.add(self.products[2])
+        Product.objects.merge_wishlist_counts()
+
+    def purge(self, *args):
+        out = StringIO()
+        call_command('purge_deleted', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_stale_save(self):
+        """Testa que salvar um cliente ou produto carregado antes da remoção falha, sem restaurá-lo"""
+        customer = Customer.objects.get(pk=self.customers[0].pk)
+        product = Product.objects.get(pk=self.products[0].pk)
+        for instance, name in ((customer, 'customer-detail'), (product, 'product-detail')):
+            with self.subTest(model=instance._meta.model_name):
+                response = self.client.delete(reverse(name, kwargs={'pk': instance.pk}))
+                self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+                with self.assertRaises(ObjectDoesNotExist), transaction.atomic():
+                    instance.save()
+                self.assertFalse(type(instance).objects.filter(pk=instance.pk).exists())
+                self.assertTrue(type(instance).all_objects.filter(pk=instance.pk, deleted_at__isnull=False).exists())
+
+    def test_delete_product(self):
+        """Testa que o produto removido deixa de ser listado e é removido das listas de favoritos em lotes"""
+        product = self.products[0]
+        versions = dict(Customer.objects.values_list('pk', 'wishlist_version'))
+        self.assertEqual(self.client.get(reverse('product-detail', kwargs={'pk': product.id})).status_code,
+                         status.HTTP_200_OK)
+        response = self.client.delete(reverse('product-detail', kwargs={'pk': product.id}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        # oculto imediatamente, com as listas de favoritos ainda não removidas
+        self.assertEqual(Wishlist.objects.filter(product=product).count(), 3)
+        self.assertEqual(self.client.get(reverse('product-detail', kwargs={'pk': product.id})).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertNotIn(product.id, [item['id'] for item in self.get_all_products().data['results']])
+        response = self.client.get(reverse('wishlist-list'))
+        self.assertNotIn(product.id, [item['product']['id'] for item in response.data['results']])
+        self.assertEqual(len(response.data['results']), 4)
+        response = self.client.get(reverse('customer-detail', kwargs={'pk': self.customers[0].id}))
+        self.assertEqual([item['id'] for item in response.data['wishList']], [self.products[2].id, self.products[1].id])
+        response = self.client.get(reverse('customer-wishlist-list', kwargs={'customer_pk': self.customers[0].id}))
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.post(reverse('customer-wishlist-list', kwargs={'customer_pk': self.customers[0].id}),
+                                    {'product': product.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.delete(reverse('product-detail', kwargs={'pk': product.id})).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+        job = DeletionJob.objects.get()
+        self.assertEqual((job.model, job.object_id, job.status, job.total), ('product', product.id, 'pending', 3))
+        self.assertIn('3 itens estimados', self.purge('--batch-size', '2', '--progress-interval', '0'))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.deleted, job.attempts, job.progress), ('done', 3, 1, 100.0))
+        self.assertFalse(Product.all_objects.filter(pk=product.id).exists())
+        self.assertFalse(Wishlist.objects.filter(product_id=product.id).exists())
+        for customer in Customer.objects.all():
+            self.assertEqual(customer.wishlist_version, versions[customer.pk] + 1)
+        self.assertEqual(self.purge('--status'), 'Nenhuma remoção pendente\n')
+
+    @override_settings(WISHLIST_SNAPSHOT=True, WISHLIST_MEMBERSHIP_CACHE={'ENABLED': True, 'EXACT_MAX_SIZE': 1})
+    def test_delete_product_cached_wishlists(self):
+        """Testa que o produto removido deixa as listas serializadas e o cache das listas antes da remoção definitiva"""
+        product, customer = self.products[0], self.customers[0]
+        detail = reverse('customer-detail', kwargs={'pk': customer.id})
+        contains = reverse('customer-wishlist-contains', kwargs={'customer_pk': customer.id})
+        params = {'products': ','.join(str(item.id) for item in self.products)}
+        self.assertIn(product.id, [item['id'] for item in self.client.get(detail).data['wishList']])
+
+        # listas com até EXACT_MAX_SIZE produtos (cliente 1) inteiras, as maiores (cliente 0) como filtro de Bloom
+        for item in (customer, self.customers[1]):
+            url = reverse('customer-wishlist-contains', kwargs={'customer_pk': item.id})
+            self.assertTrue(self.client.get(url, params).data['products'][str(product.id)])
+
+        self.assertEqual(self.client.delete(reverse('product-detail', kwargs={'pk': product.id})).status_code,
+                         status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Wishlist.objects.filter(product=product).count(), 3)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(detail)
+        self.assertEqual([item['id'] for item in response.data['wishList']], [self.products[2].id, self.products[1].id])
+        self.assertTrue(any('INSERT INTO api_customerwishlistsnapshot' in query['sql']
+                            for query in queries.captured_queries))
+        self.assertEqual(self.client.get(contains, params).data['products'],
+                         {str(self.products[0].id): False, str(self.products[1].id): True,
+                          str(self.products[2].id): True})
+        url = reverse('customer-wishlist-contains', kwargs={'customer_pk': self.customers[1].id})
+        self.assertFalse(self.client.get(url, params).data['products'][str(product.id)])
+
+        # a lista serializada novamente não é invalidada pelo produto removido
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(self.client.get(detail).data['wishList']), 2)
+        self.assertFalse(any('INSERT INTO api_customerwishlistsnapshot' in query['sql']
+                             for query in queries.captured_queries))
+
+        # sem o marcador das remoções (ex.: removido do cache) as listas são lidas novamente
+        cache.delete(wishlist_membership_cache.deleted_key)
+        self.assertFalse(self.client.get(contains, params).data['products'][str(product.id)])
+
+    def test_delete_customer(self):
+        """Testa que o cliente removido deixa de ser listado e a sua lista de favoritos é removida"""
+        customer = self.customers[0]
+        response = self.client.delete(reverse('customer-detail', kwargs={'pk': customer.id}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        self.assertEqual(self.client.get(reverse('customer-detail', kwargs={'pk': customer.id})).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertEqual(len(self.get_all_customers().data['results']), 2)
+        self.assertEqual(len(self.client.get(reverse('wishlist-list')).data['results']), 4)
+        response = self.client.get(reverse('customer-wishlist-list', kwargs={'customer_pk': customer.id}))
+        self.assertEqual(response.data['results'], [])
+
+        # o e-mail continua em uso até a remoção definitiva
+        response = self.client.post(reverse('customer-list'), {'name': 'Novo', 'email': customer.email}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertEqual(DeletionJob.objects.get().total, 3)
+        self.purge()
+        self.assertFalse(Customer.all_objects.filter(pk=customer.id).exists())
+        Product.objects.merge_wishlist_counts()
+        self.assertEqual([product.wishlist_count for product in Product.objects.order_by('id')], [2, 2, 0])
+        response = self.client.post(reverse('customer-list'), {'name': 'Novo', 'email': customer.email}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_claim(self):
+        """Testa a reserva dos jobs, inclusive com a reserva expirada"""
+        for product in self.products[:2]:
+            self.client.delete(reverse('product-detail', kwargs={'pk': product.id}))
+        first, second = DeletionJob.objects.claim(60), DeletionJob.objects.claim(60)
+        self.assertEqual([first.object_id, second.object_id], [product.id for product in self.products[:2]])
+        self.assertIsNone(DeletionJob.objects.claim(60))
+
+        DeletionJob.objects.filter(pk=first.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        job = DeletionJob.objects.claim(60)
+        self.assertEqual((job.pk, job.status, job.attempts), (first.pk, 'running', 2))
+
+    @override_settings(DELETION_JOBS={'MAX_ATTEMPTS': 2})
+    def test_failure(self):
+        """Testa que um erro desfaz apenas o lote em andamento e o job é executado novamente"""
+        self.client.delete(reverse('product-detail', kwargs={'pk': self.products[0].id}))
+        purge = WishlistManager.purge
+        calls = []
+
+        def failing_purge(manager, *args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise OperationalError('falha')
+            return purge(manager, *args)
+
+        with mock.patch.object(WishlistManager, 'purge', failing_purge):
+            job = run_job(DeletionJob.objects.claim(60), batch_size=2)
+        self.assertEqual((job.status, job.deleted, job.error), ('pending', 2, 'OperationalError: falha'))
+        self.assertEqual(Wishlist.objects.filter(product=self.products[0]).count(), 1)
+
+        with mock.patch.object(WishlistManager, 'purge', side_effect=OperationalError('falha')):
+            job = run_job(DeletionJob.objects.claim(60), batch_size=2)
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('falhou', self.purge('--status'))
+
+
+class SparseFieldsetAPITestCase(LuizaLabsAPITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        product_cache.clear()
+        self.customers = [Customer.objects.create(name='Cliente {}'.format(i), email='cliente{}@luizalabs.com'.format(i))
+                          for i in range(3)]
+        self.products = [Product.objects.create(title='Produto {}'.format(i), price=i, brand='Marca',
+                                                image='http://blob.luizalabs.com/images/img_{}.png'.format(i))
+                         for i in range(3)]
+        for customer in self.customers:
+            customer.wish_list.add(*self.products)
+        Product.objects.merge_wishlist_counts()
+
+    def get(self, name, params, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name, kwargs=kwargs), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data, [query['sql'] for query in queries.captured_queries]
+
+    def test_customer_fields(self):
+        """Testa a seleção dos campos do cliente e da lista de favoritos, com apenas as colunas pedidas carregadas"""
+        data, queries = self.get('customer-list', {'fields': 'id,wishList.id,wishList.title'})
+        self.assertEqual(list(data['results'][0]), ['id', 'wishList'])
+        self.assertEqual([list(product) for product in data['results'][0]['wishList']], [['id', 'title']] * 3)
+        self.assertFalse(any('"api_customer"."email"' in sql or '"api_product"."price"' in sql for sql in queries))
+
+        # sem a lista de favoritos: autenticação (2) e clientes (1), sem a query dos produtos
+        data, queries = self.get('customer-list', {'fields': 'name'})
+        self.assertEqual(data['results'][0], {'name': 'Cliente 2'})
+        self.assertEqual(len(queries), 3)
+
+        data, queries = self.get('customer-detail', {'exclude': 'email,wishList.url,wishList.image'},
+                                 pk=self.customers[0].id)
+        self.assertEqual(list(data), ['id', 'name', 'wishList'])
+        self.assertEqual(list(data['wishList'][0]), ['id', 'sku', 'title', 'brand', 'price', 'reviewScore'])
+        self.assertFalse(any('"api_product"."image"' in sql for sql in queries))
+
+    def test_nested_fields(self):
+        """Testa a seleção dos campos dos objetos aninhados da lista de favoritos"""
+        data, queries = self.get('wishlist-list', {'fields': 'id,product.title'})
+        self.assertEqual(list(data['results'][0]), ['id', 'product'])
+        self.assertEqual(list(data['results'][0]['product']), ['title'])
+        self.assertFalse(any('"api_customer"."name"' in sql or '"api_product"."brand"' in sql for sql in queries))
+
+        data, queries = self.get('customer-wishlist-list', {'fields': 'product.id,product.url'},
+                                 customer_pk=self.customers[0].id)
+        self.assertEqual(list(data['results'][0]['product']), ['id', 'url'])
+
+    def test_product_cache(self):
+        """Testa que o cache armazena os produtos inteiros e os campos pedidos são selecionados na resposta"""
+        data, queries = self.get('product-detail', {'fields': 'id,title'}, pk=self.products[0].id)
+        self.assertEqual(data, {'id': self.products[0].id, 'title': 'Produto 0'})
+
+        data, queries = self.get('product-detail', {}, pk=self.products[0].id)
+        self.assertIn('url', data)
+        self.assertEqual(product_cache.stats()['local_hits'], 1)
+
+        data, queries = self.get('product-list', {'exclude': 'url,image'})
+        self.assertEqual(len(data['results']), 3)
+        self.assertNotIn('url', data['results'][0])
+        self.assertIn('title', data['results'][0])
+
+        data, queries = self.get('product-top', {'fields': 'id,wishlistCount'})
+        self.assertTrue(all(list(product) == ['id', 'wishlistCount'] for product in data))
+
+    def test_ordering_columns(self):
+        """Testa que as colunas da ordenação são carregadas com as colunas pedidas, sem queries por objeto"""
+        data, queries = self.get('customer-list', {'fields': 'id', 'ordering': 'email', 'page_size': 2})
+        self.assertEqual(len(queries), 3)
+        self.assertIsNotNone(data['next'])
+
+        # autenticação (2), COUNT(*) (1), ids da página (1) e produtos ausentes no cache (1)
+        data, queries = self.get('product-list', {'fields': 'id', 'ordering': 'price', 'page_size': 2})
+        self.assertEqual(len(queries), 5)
+        self.assertEqual([product['id'] for product in data['results']], [product.id for product in self.products[:2]])
+
+    @override_settings(WISHLIST_SNAPSHOT=True)
+    def test_snapshot(self):
+        """Testa a seleção dos campos da lista de favoritos serializada"""
+        url = reverse('customer-detail', kwargs={'pk': self.customers[0].id})
+        for params in ({'fields': 'id,wishList.title,wishList.url'}, {'exclude': 'wishList.url'}, {'fields': 'name'}):
+            with self.subTest(params=params):
+                with override_settings(WISHLIST_SNAPSHOT=False):
+                    expected = self.client.get(url, params).content
+                self.assertEqual(self.client.get(url, params).content, expected)
+
+    def test_invalid_fields(self):
+        """Testa que os campos inexistentes retornam 400"""
+        url = reverse('customer-list')
+        for params, param in (({'fields': 'id,phone'}, 'fields'), ({'exclude': 'wishList.phone'}, 'exclude'),
+                              ({'fields': 'name.first'}, 'fields'), ({'fields': 'wishList..id'}, 'fields')):
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn(param, response.data)
+
+        response = self.client.get(reverse('product-detail', kwargs={'pk': self.products[0].id}), {'fields': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_schema(self):
+        """Testa que os parâmetros fields e exclude estão documentados nas leituras"""
+        schema = SchemaGenerator().get_schema(request=None, public=True)
+        operations = schema['paths']['/api/customer/']
+        names = [parameter['name'] for parameter in operations['get']['parameters']]
+        self.assertIn('fields', names)
+        self.assertIn('exclude', names)
+        self.assertNotIn('parameters', operations['post'])
+        self.assertIn('wishList.id', operations['get']['parameters'][names.index('fields')]['description'])
+
+
+class AdminTestCase(TestCase):
+    def setUp(self):
+        User.objects.create_superuser('admin', 'admin@luizalabs.com', API_PASS)
+        self.client.login(username='admin', password=API_PASS)
+        self.products = [Product.objects.create(title='Produto {}'.format(i), price=i, brand='Marca {}'.format(i % 3),
+                                                image='http://blob.luizalabs.com/images/img_{}.png'.format(i))
+                         for i in range(30)]
+        self.small = Customer.objects.create(name='Maria Souza', email='maria@luizalabs.com')
+        self.large = Customer.objects.create(name='Mariana Lima', email='mariana@luizalabs.com')
+
+        # incluídos um a um, na ordem dos produtos (a lista é exibida do item mais recente para o mais antigo)
+        for customer, count in ((self.small, 3), (self.large, 25)):
+            for product in self.products[:count]:
+                Wishlist.objects.create(customer=customer, product=product)
+        Customer.objects.create(name='João Silva', email='joao@luizalabs.com')
+
+    def get(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, [query['sql'] for query in queries.captured_queries]
+
+    def change_url(self, customer):
+        return reverse('admin:api_customer_change', args=[customer.id])
+
+    def test_customer_change_page(self):
+        """Testa que a página do cliente exibe uma página da lista de favoritos, com as mesmas queries para qualquer
+        tamanho da lista"""
+        self.get(self.change_url(self.small))
+        response, small_queries = self.get(self.change_url(self.small))
+        self.assertEqual(len(response.context['inline_admin_formsets'][0].formset.forms), 3)
+
+        response, large_queries = self.get(self.change_url(self.large))
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual(len(formset.forms), 20)
+        self.assertEqual(formset.page.paginator.num_pages, 2)
+        self.assertContains(response, '?wishlist_page=2')
+        self.assertEqual(len(large_queries), len(small_queries))
+
+        response, queries = self.get(self.change_url(self.large), {'wishlist_page': 2})
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual([form.instance.product for form in formset.forms], self.products[:5][::-1])
+        self.assertEqual(len(queries), len(small_queries))
+
+        # os produtos são incluídos pela busca (autocomplete), sem um <select> com todos os produtos
+        self.assertNotContains(response, '<option value="{}"'.format(self.products[-1].id))
+        self.assertContains(response, 'data-ajax--url="/admin/autocomplete/"')
+
+    def test_customer_change_wishlist(self):
+        """Testa a remoção de um produto da página exibida e a inclusão de um produto pelo admin"""
+        wishlist = Wishlist.objects.get(customer=self.large, product=self.products[0])
+        data = {
+            'name': self.large.name,
+            'email': self.large.email,
+            'wishlist_set-TOTAL_FORMS': 1,
+            'wishlist_set-INITIAL_FORMS': 1,
+            'wishlist_set-0-id': wishlist.id,
+            'wishlist_set-0-customer': self.large.id,
+            'wishlist_set-0-DELETE': 'on',
+            'wishlist_set-2-TOTAL_FORMS': 1,
+            'wishlist_set-2-INITIAL_FORMS': 0,
+            'wishlist_set-2-0-customer': self.large.id,
+            'wishlist_set-2-0-product': self.products[29].id,
+        }
+        response = self.client.post('{}?wishlist_page=2'.format(self.change_url(self.large)), data)
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(set(self.large.wish_list.all()), set(self.products[1:25] + self.products[29:]))
+
+    def test_product_changelist(self):
+        """Testa que a listagem de produtos não executa DISTINCT nem COUNT(*) sem limite"""
+        response, queries = self.get(reverse('admin:api_product_changelist'))
+        self.assertEqual(response.context['cl'].result_count, 30)
+        self.assertEqual([choice[0] for choice in response.context['cl'].filter_specs[0].lookup_choices],
+                         ['Marca 0', 'Marca 1', 'Marca 2'])
+        self.assertFalse(any('DISTINCT' in sql for sql in queries))
+        self.assertTrue(all('LIMIT' in sql for sql in queries if 'COUNT(' in sql))
+
+        response, queries = self.get(reverse('admin:api_product_changelist'), {'brand': 'Marca 1'})
+        self.assertEqual(response.context['cl'].result_count, 10)
+        self.assertEqual({product.brand for product in response.context['cl'].result_list}, {'Marca 1'})
+
+    def test_brands(self):
+        """Testa a leitura das marcas distintas, sem os produtos removidos"""
+        self.assertEqual(list(Product.objects.brands()), ['Marca 0', 'Marca 1', 'Marca 2'])
+        self.assertEqual(list(Product.objects.brands(2)), ['Marca 0', 'Marca 1'])
+        Product.objects.filter(brand='Marca 0').update(deleted_at=timezone.now())
+        self.assertEqual(list(Product.objects.brands()), ['Marca 1', 'Marca 2'])
+
+    def test_search_customers(self):
+        """Testa a busca de clientes pelo prefixo das palavras do nome e pelo e-mail exato"""
+        def search(value):
+            return sorted(customer.name for customer in search_customers(Customer.objects.all(), value))
+        self.assertEqual(search('mari'), ['Maria Souza', 'Mariana Lima'])
+        self.assertEqual(search('Mari sou'), ['Maria Souza'])
+        self.assertEqual(search('joão'), ['João Silva'])
+        self.assertEqual(search('mariana@luizalabs.com'), ['Mariana Lima'])
+        self.assertEqual(search('mariana@'), [])
+        self.assertEqual(search('!!'), [])
+
+        response, queries = self.get(reverse('admin:api_customer_changelist'), {'q': 'mari'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+        self.assertFalse(any('LIKE' in sql for sql in queries))
+
+    def test_product_autocomplete(self):
+        """Testa a busca de produtos usada na inclusão de produtos na lista de favoritos"""
+        response, queries = self.get(reverse('admin:autocomplete'), {
+            'term': 'produto', 'app_label': 'api', 'model_name': 'wishlist', 'field_name': 'product'})
+        data = response.json()
+        self.assertEqual(len(data['results']), 20)
+        self.assertTrue(data['pagination']['more'])
+        self.assertFalse(any('LIKE' in sql for sql in queries))
+
+    def test_estimated_count_paginator(self):
+        """Testa que a contagem exata é executada apenas quando a estimativa é pequena"""
+        queryset = Product.objects.order_by('id')
+        with mock.patch('api.core.admin.estimate_count', return_value=50000), \
+                CaptureQueriesContext(connection) as queries:
+            self.assertEqual(EstimatedCountPaginator(queryset, 10).count, 50000)
+        self.assertEqual(len(queries), 0)
+
+        with mock.patch('api.core.admin.estimate_count', return_value=5):
+            self.assertEqual(EstimatedCountPaginator(queryset, 10).count, 30)
+
+            # a contagem exata é limitada e a estimativa é usada quando a contagem atinge o limite
+            paginator = EstimatedCountPaginator(queryset, 10)
+            paginator.exact_count_limit = 20
+            self.assertEqual(paginator.count, 20)
+
+
+class BenchTestCase(TestCase):
+    def setUp(self):
+        User.objects.create_superuser('admin', 'admin@luizalabs.com', API_PASS)
+
+    def test_scenarios_cover_router(self):
+        """Testa se existe um cenário para cada action dos ViewSets do router"""
+        actions = {(basename, action) for prefix, viewset, basename in api_router.registry
+                   for route in api_router.get_routes(viewset) for action in route.mapping.values()
+                   if hasattr(viewset, action)}
+        self.assertEqual(actions - {(scenario.basename, scenario.action) for scenario in SCENARIOS.values()}, set())
+
+    def test_bench_command(self):
+        """Testa a geração do conjunto de dados e a execução de todos os cenários, sem alterar o conjunto de dados"""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command('bench', '--seed', '--products', '30', '--customers', '10', '--wishlists', '60',
+                         '--requests', '2', '--warmup', '1', '--sample-size', '20', '--output', output,
+                         stdout=StringIO(), stderr=StringIO())
+            with open(output) as stream:
+                results = json.load(stream)
+
+        self.assertEqual(results['dataset'], {'products': 30, 'customers': 10, 'wishlists': 60})
+        self.assertEqual((Product.objects.count(), Customer.objects.count(), Wishlist.objects.count(),
+                          User.objects.count()), (30, 10, 60, 1))
+        self.assertEqual(Product.objects.aggregate(total=Sum('wishlist_count'))['total'], 60)
+
+        self.assertEqual(list(results['scenarios']), list(SCENARIOS))
+        for name, result in results['scenarios'].items():
+            self.assertEqual(result['errors'], 0, name)
+            self.assertEqual(result['requests'], 2, name)
+            self.assertGreater(result['queries'], 0, name)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+
+    def test_baseline(self):
+        """Testa a comparação com os resultados de referência"""
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, 'baseline.json')
+            arguments = ['--seed', '--products', '5', '--customers', '2', '--wishlists', '4', '--scenarios',
+                         'product-list,customer-list', '--requests', '3', '--warmup', '1', '--baseline', baseline]
+            with self.assertRaises(CommandError):
+                call_command('bench', *arguments, stdout=StringIO(), stderr=StringIO())
+
+            call_command('bench', *arguments, '--update-baseline', stdout=StringIO(), stderr=StringIO())
+            with open(baseline) as stream:
+                results = json.load(stream)
+            self.assertEqual(list(results['scenarios']), ['customer-list', 'product-list'])
+
+            results['scenarios']['product-list']['p50_ms'] = 0
+            results['scenarios']['customer-list']['queries'] -= 1
+            with open(baseline, 'w') as stream:
+                json.dump(results, stream)
+            stderr = StringIO()
+            with self.assertRaises(CommandError):
+                call_command('bench', *arguments, '--min-delta-ms', '0', stdout=StringIO(), stderr=stderr)
+            self.assertIn('product-list: p50_ms', stderr.getvalue())
+            self.assertIn('customer-list: queries', stderr.getvalue())
+
+    def test_compare(self):
+        """Testa as regressões de latência, vazão, queries e erros, com a tolerância"""
+        previous = {'p50_ms': 10.0, 'p95_ms': 20.0, 'throughput': 100.0, 'queries': 3.0, 'errors': 0}
+        baseline = {'scenarios': {'product-list': previous}}
+
+        def regressions(**changes):
+            current = dict(previous, **changes)
+            return compare({'scenarios': {'product-list': current, 'product-top': current}}, baseline, .2, 1.0, .5)
+
+        self.assertEqual(regressions(p50_ms=11.9, p95_ms=23.9, throughput=84.0, queries=3.4), [])
+        self.assertEqual(regressions(p50_ms=12.1), ['product-list: p50_ms 12.1 > 10.0'])
+        self.assertEqual(regressions(p95_ms=24.1), ['product-list: p95_ms 24.1 > 20.0'])
+        self.assertEqual(regressions(throughput=83.0), ['product-list: throughput 83.0 < 100.0'])
+        self.assertEqual(regressions(queries=4.0), ['product-list: queries 4.0 > 3.0'])
+        self.assertEqual(regressions(errors=1), ['product-list: errors 1 > 0'])
+
+
+class SeedTestCase(TestCase):
+    arguments = ['--products', '50', '--customers', '10', '--wishlists', '120', '--batch-size', '25']
+
+    def seed(self, *arguments):
+        call_command('seed', *self.arguments, *arguments, stdout=StringIO(), stderr=StringIO())
+
+    def pairs(self):
+        return set(Wishlist.objects.values_list('customer__email', 'product__sku'))
+
+    def test_seed(self):
+        """Testa a geração do conjunto de dados, os contadores dos produtos e a distribuição das listas"""
+        self.seed()
+        self.assertEqual((Product.objects.count(), Customer.objects.count(), Wishlist.objects.count()), (50, 10, 120))
+        self.assertEqual(Customer.objects.values('email').distinct().count(), 10)
+        self.assertEqual(Product.objects.aggregate(total=Sum('wishlist_count'))['total'], 120)
+
+        # Produtos e tamanhos de lista desiguais (Zipf)
+        counts = sorted(Product.objects.values_list('wishlist_count', flat=True), reverse=True)
+        self.assertGreater(counts[0], counts[len(counts) // 2] * 2)
+        sizes = Counter(Wishlist.objects.values_list('customer_id', flat=True))
+        self.assertGreater(max(sizes.values()), min(sizes.values()))
+
+        with self.assertRaises(CommandError):
+            self.seed()
+
+    def test_deterministic_resume_and_truncate(self):
+        """Testa se a geração é determinística, continua uma geração interrompida e remove os dados anteriores"""
+        self.seed()
+        pairs = self.pairs()
+
+        # Interrompida durante as listas: os lotes contém listas inteiras dos últimos clientes
+        last = Customer.objects.order_by('-pk').values_list('pk', flat=True)[:4]
+        Wishlist.objects.filter(customer_id__in=list(last)).delete()
+        self.seed('--resume')
+        self.assertEqual(self.pairs(), pairs)
+        self.assertEqual(Product.objects.aggregate(total=Sum('wishlist_count'))['total'], 120)
+
+        Product.objects.create(title='Produto', price=1, brand='Marca', image='http://blob.luizalabs.com/img.png')
+        # As chaves estrangeiras são verificadas no fim da transação do teste, o que impede o TRUNCATE
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        self.seed('--truncate')
+        self.assertEqual(self.pairs(), pairs)
+        self.assertEqual(Product.objects.count(), 50)
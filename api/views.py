@@ -1,23 +1,92 @@
+from collections import Counter
+from datetime import datetime, timezone
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db.models import F, Max, OuterRef, Subquery
 from rest_framework import viewsets
 from rest_framework import permissions
+from rest_framework import filters
 from rest_framework import mixins
-from drf_spectacular.utils import extend_schema
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated, NotFound, PermissionDenied, \
+    ValidationError
+from django_filters.rest_framework import DjangoFilterBackend
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter
 
+from api.core.authentication import decode_token, issue_token, revoke_token, revoke_user_tokens
+from api.core.cache import SerializerCacheMixin, product_cache
+from api.core.conditional import ConditionalGetMixin
+from api.core.deletion import soft_delete
+from api.core.export import ExportMixin
+from api.core.fields import SparseFieldsetMixin
+from api.core.instrumentation import InstrumentedViewMixin
+from api.core.membership import wishlist_membership_cache
+from api.core.metrics import PrometheusRenderer, get_registry
+from api.core.optimizer import QuerySetOptimizerMixin
+from api.core.pagination import KeysetPagination
+from api.core.replica import ReplicaReadMixin
+from api.core.snapshot import AnyArray, WishlistSnapshotMixin
+from api.core.values import ValuesListMixin, ValuesSerializerMixin
+from api.db.pool import pool_stats
+from api.filters import ProductFilter, StableOrderingFilter
 from api.models import Customer, Wishlist, Product
 from api.serializers import UserSerializer, CustomerSerializer, CustomerSerializerWithRelatedObject, \
-    WishlistSerializer, WishlistSerializerWithRelatedObject, ProductSerializer
+    WishlistSerializer, WishlistSerializerWithRelatedObject, ProductSerializer, CustomerWishlistSerializer, \
+    CustomerWishlistSerializerWithRelatedObject, WishlistBulkSerializer, WishlistBulkResultSerializer, \
+    ProductTopSerializer, WishlistMembershipSerializer, TokenObtainSerializer, TokenSerializer, TokenRevokeSerializer, TokenRevokeAllSerializer
+
+
+def get_customer_validators(customer_pk):
+    """
+    Validadores para requisições condicionais de um cliente com a sua lista de favoritos: a versão da lista e a data
+    da última alteração do cliente ou de um dos produtos da lista, obtidos com uma única query.
+
+    Com WISHLIST_SNAPSHOT, a alteração de um produto incrementa a versão da lista dos clientes, e a lista não é lida
+    com os produtos: apenas os produtos removidos, que só alteram a versão na remoção definitiva, são buscados na lista
+    do cliente, a partir do índice parcial de deleted_at.
+    """
+    if getattr(settings, 'WISHLIST_SNAPSHOT', False):
+        deleted = Product.all_objects.filter(deleted_at__isnull=False).values('pk')
+        products_updated_at = Subquery(
+            Wishlist.objects.filter(AnyArray(F('product_id'), Subquery(deleted)), customer_id=OuterRef('pk'))
+            .order_by('-product__deleted_at').values('product__deleted_at')[:1])
+    else:
+        products_updated_at = Max('wish_list__updated_at')
+
+    validators = Customer.objects.filter(pk=customer_pk).annotate(
+        products_updated_at=products_updated_at
+    ).values_list('updated_at', 'wishlist_version', 'products_updated_at').first()
+    if validators is None:
+        return None
+
+    updated_at, wishlist_version, products_updated_at = validators
+    last_modified = max(updated_at, products_updated_at or updated_at)
+    return (customer_pk, wishlist_version, last_modified), last_modified
 
 
 @extend_schema(tags=['Cliente'])
-class CustomerViewSet(viewsets.ModelViewSet):
+class CustomerViewSet(InstrumentedViewMixin, ReplicaReadMixin, ConditionalGetMixin, ExportMixin, WishlistSnapshotMixin,
+                      SparseFieldsetMixin, ValuesSerializerMixin, QuerySetOptimizerMixin, viewsets.ModelViewSet):
     """
     Operação para gerenciamento de cliente, este operação pode ser acessado apenas por usuários autenticados
     """
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
     permission_classes = [permissions.IsAuthenticated, ]
-    pagination_class = None
+    pagination_class = KeysetPagination
+
+    # A paginação por cursor exige que a ordenação seja por um campo único e indexado
+    filter_backends = [filters.OrderingFilter, ]
+    ordering_fields = ['id', 'email']
+    ordering = ['-id']
+    export_fields = (('id', 'id'), ('name', 'name'), ('email', 'email'))
+    snapshot_serializer_class = CustomerSerializer
+    replica_customer_kwarg = 'pk'
 
     """
     Quando a action for list ou retrieve, use um Serializer diferente que inclua o objetos
@@ -27,38 +96,239 @@ class CustomerViewSet(viewsets.ModelViewSet):
             return CustomerSerializerWithRelatedObject
         return super().get_serializer_class()
 
+    def get_conditional_validators(self):
+        customer_pk = self.get_lookup_value()
+        return get_customer_validators(customer_pk) if customer_pk is not None else None
+
+    def perform_destroy(self, instance):
+        # O cliente deixa de ser listado e a sua lista de favoritos é removida em segundo plano
+        soft_delete(instance)
+
 
 @extend_schema(tags=['Lista de produto favorito'])
-class WishListViewSet(viewsets.ModelViewSet):
+class WishListViewSet(InstrumentedViewMixin, ReplicaReadMixin, ConditionalGetMixin, ExportMixin, SparseFieldsetMixin,
+                      ValuesSerializerMixin, QuerySetOptimizerMixin, viewsets.ModelViewSet):
     """
     Operação para gerenciamento de lista de produtos favoritos, este operação pode ser acessado apenas por usuários autenticados
     """
-    queryset = Wishlist.objects.all()
+    # Os itens de clientes e produtos removidos deixam de ser listados antes da remoção em segundo plano
+    queryset = Wishlist.objects.filter(customer__deleted_at__isnull=True, product__deleted_at__isnull=True)
     serializer_class = WishlistSerializer
     permission_classes = [permissions.IsAuthenticated, ]
-    pagination_class = None
-    
+    pagination_class = KeysetPagination
+
+    # A paginação por cursor exige que a ordenação seja por um campo único e indexado
+    filter_backends = [filters.OrderingFilter, ]
+    ordering_fields = ['id']
+    ordering = ['-id']
+    export_fields = (('id', 'id'), ('customer', 'customer_id'), ('product', 'product_id'))
+
     """
     Quando a action for list ou retrieve, use um Serializer diferente que inclua os objetos
     """
     def get_serializer_class(self):
         if self.action in ['list', 'retrieve']:
             return WishlistSerializerWithRelatedObject
+        if self.action in ['bulk_add', 'bulk_remove']:
+            return WishlistBulkSerializer
         return super().get_serializer_class()
 
+    def get_conditional_validators(self):
+        pk = self.get_lookup_value()
+        validators = Wishlist.objects.filter(pk=pk).values_list(
+            'updated_at', 'customer__updated_at', 'product__updated_at').first() if pk is not None else None
+        if validators is None:
+            return None
+        return (pk, ) + validators, max(validators)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.pin_customers([serializer.instance.customer_id])
+
+    def perform_update(self, serializer):
+        # O item pode ser transferido para outro cliente, os dois clientes são alterados
+        customer_id = serializer.instance.customer_id
+        super().perform_update(serializer)
+        self.pin_customers([customer_id, serializer.instance.customer_id])
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        self.pin_customers([instance.customer_id])
+
+    def bulk_response(self, items, statuses):
+        results = [dict(item, status=item_status) for item, item_status in zip(items, statuses)]
+        return Response(WishlistBulkResultSerializer({'items': results, 'totals': Counter(statuses)}).data)
+
+    @extend_schema(responses=WishlistBulkResultSerializer)
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_add(self, request):
+        """
+        Inclui vários produtos favoritos em uma única requisição. Cada item retorna o status inserted, duplicate,
+        missing_customer ou missing_product.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['items']
+
+        statuses = Wishlist.objects.bulk_add((item['customer'], item['product']) for item in items)
+        self.pin_customers(item['customer'] for item, item_status in zip(items, statuses)
+                           if item_status == Wishlist.objects.INSERTED)
+        return self.bulk_response(items, statuses)
+
+    @extend_schema(responses=WishlistBulkResultSerializer)
+    @action(detail=False, methods=['post'], url_path='bulk-delete')
+    def bulk_remove(self, request):
+        """
+        Remove vários produtos favoritos em uma única requisição. Cada item retorna o status removed ou not_found.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['items']
+
+        statuses = Wishlist.objects.bulk_remove((item['customer'], item['product']) for item in items)
+        self.pin_customers(item['customer'] for item, item_status in zip(items, statuses)
+                           if item_status == Wishlist.objects.REMOVED)
+        return self.bulk_response(items, statuses)
+
+
+@extend_schema(tags=['Lista de produto favorito'],
+               parameters=[OpenApiParameter('customer_pk', OpenApiTypes.INT, OpenApiParameter.PATH,
+                                            description='Id do cliente')])
+class CustomerWishlistViewSet(InstrumentedViewMixin, ReplicaReadMixin, ConditionalGetMixin, SparseFieldsetMixin,
+                              ValuesListMixin, QuerySetOptimizerMixin, mixins.ListModelMixin, mixins.CreateModelMixin,
+                              mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Operação para gerenciamento da lista de produtos favoritos de um cliente, este operação pode ser acessado apenas 
+    por usuários autenticados. Para remover um produto da lista, informe o id do produto.
+    """
+    queryset = Wishlist.objects.filter(customer__deleted_at__isnull=True, product__deleted_at__isnull=True)
+    serializer_class = CustomerWishlistSerializer
+    permission_classes = [permissions.IsAuthenticated, ]
+    pagination_class = KeysetPagination
+    lookup_field = 'product'
+    lookup_url_kwarg = 'product_pk'
+    conditional_actions = ('list', )
+    replica_customer_kwarg = 'customer_pk'
+    replica_actions = ('list', 'contains')
+    contains_max_products = 200
+
+    def get_customer_pk(self):
+        try:
+            return int(self.kwargs['customer_pk'])
+        except ValueError:
+            raise NotFound()
+
+    """
+    A listagem usa o índice (customer_id, id) de Wishlist, por isso não consulta a tabela de clientes
+    """
+    def get_queryset(self):
+        return super().get_queryset().filter(customer_id=self.get_customer_pk())
+
+    """
+    Quando a action for list, use um Serializer diferente que inclua o produto
+    """
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return CustomerWishlistSerializerWithRelatedObject
+        return super().get_serializer_class()
+
+    def get_conditional_validators(self):
+        return get_customer_validators(self.get_customer_pk())
+
+    @extend_schema(parameters=[OpenApiParameter(
+        'products', OpenApiTypes.STR, OpenApiParameter.QUERY, required=True,
+        description='Ids dos produtos separados por vírgula (ex.: 1,2,3), no máximo {}'.format(contains_max_products))],
+        responses=WishlistMembershipSerializer)
+    @action(detail=False, methods=['get'])
+    def contains(self, request, customer_pk=None):
+        """
+        Informa quais dos produtos estão na lista de favoritos do cliente (ex.: a marcação dos produtos de uma página
+        da vitrine), com uma única query IN pelo índice (cliente, produto). Com WISHLIST_MEMBERSHIP_CACHE habilitado,
+        a lista do cliente fica no cache e os produtos fora dela são respondidos sem queries.
+        """
+        try:
+            product_ids = [int(pk) for pk in request.query_params.get('products', '').split(',') if pk.strip()]
+        except ValueError:
+            product_ids = None
+        if not product_ids or len(product_ids) > self.contains_max_products:
+            raise ValidationError({'products': ['Informe de 1 a {} ids de produtos separados por vírgula.'.format(
+                self.contains_max_products)]})
+
+        customer_pk = self.get_customer_pk()
+        found = wishlist_membership_cache.contains(self.get_queryset(), customer_pk, product_ids)
+        return Response(WishlistMembershipSerializer({
+            'customer': customer_pk, 'products': {str(pk): pk in found for pk in product_ids}}).data)
+
+    def perform_create(self, serializer):
+        try:
+            serializer.save(customer_id=self.get_customer_pk())
+        except ValidationError as exc:
+            # O cliente é informado na URL
+            if 'customer' in exc.detail:
+                raise NotFound()
+            raise
+
 
 @extend_schema(tags=['Produto'])
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(InstrumentedViewMixin, ReplicaReadMixin, ConditionalGetMixin, ExportMixin, SerializerCacheMixin,
+                     QuerySetOptimizerMixin, viewsets.ModelViewSet):
     """
     Operação para gerenciamento de produtos, este operação pode ser acessado apenas por usuários autenticados
     """
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAuthenticated, ]
+    serializer_cache = product_cache
+
+    # Os filtros e ordenações suportados correspondem aos índices de Product
+    filter_backends = [DjangoFilterBackend, StableOrderingFilter, ]
+    filterset_class = ProductFilter
+    ordering_fields = ['id', 'price', 'review_score']
+    ordering = ['-id']
+    export_fields = (('id', 'id'), ('sku', 'sku'), ('title', 'title'), ('brand', 'brand'), ('price', 'price'), ('image', 'image'),
+                     ('reviewScore', 'review_score'))
+    values_serializer_actions = ('list', 'retrieve', 'top')
+    top_limit = 10
+    top_max_limit = 100
+
+    def get_serializer_class(self):
+        if self.action == 'top':
+            return ProductTopSerializer
+        return super().get_serializer_class()
+
+    def get_conditional_validators(self):
+        pk = self.get_lookup_value()
+        updated_at = Product.objects.filter(pk=pk).values_list('updated_at', flat=True).first() \
+            if pk is not None else None
+        if updated_at is None:
+            return None
+        return (pk, updated_at), updated_at
+
+    def perform_destroy(self, instance):
+        # O produto deixa de ser listado e é removido das listas de favoritos em segundo plano
+        soft_delete(instance)
+
+    @extend_schema(parameters=[OpenApiParameter('limit', OpenApiTypes.INT,
+                                                description='Quantidade de produtos, padrão 10 e máximo 100')])
+    @action(detail=False, methods=['get'], pagination_class=None, filter_backends=[])
+    def top(self, request):
+        """
+        Produtos presentes em mais listas de favoritos, em ordem decrescente, lidos pelo índice do contador. O contador
+        é atualizado periodicamente (manage.py merge_wishlist_counts).
+        """
+        try:
+            limit = int(request.query_params.get('limit', self.top_limit))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= self.top_max_limit:
+            raise ValidationError({'limit': ['Informe um número entre 1 e {}.'.format(self.top_max_limit)]})
+
+        queryset = self.get_queryset().filter(wishlist_count__gt=0).order_by('-wishlist_count', '-id')[:limit]
+        return Response([data for pk, data in self.serialize_queryset(queryset)])
 
 
 @extend_schema(tags=['Usuário'])
-class UserViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+class UserViewSet(InstrumentedViewMixin, SparseFieldsetMixin, QuerySetOptimizerMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
     """
     Operação de gerenciamento de usuários, este operação pode ser acessado apenas por superusuários (admins)
     Nota: Este Operação foi criado apenas para de cumprir o requisito de autorização, uma vez que ele só pode ser acessado por admin
@@ -67,3 +337,110 @@ class UserViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.Des
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
     pagination_class = None
+
+
+@extend_schema(tags=['Usuário'])
+class TokenViewSet(InstrumentedViewMixin, viewsets.GenericViewSet):
+    """
+    Emissão e revogação de tokens de acesso. O token é enviado no header Authorization: Bearer <token> e verificado
+    com um HMAC, sem consultar o banco de dados, até a sua expiração (API_TOKEN_LIFETIME segundos) ou revogação.
+    """
+    serializer_class = TokenObtainSerializer
+    permission_classes = [permissions.IsAuthenticated, ]
+    pagination_class = None
+
+    def get_permissions(self):
+        # A emissão aceita usuário e senha sem autenticação
+        if self.action == 'create':
+            return [permissions.AllowAny()]
+        return super().get_permissions()
+
+    def get_serializer_class(self):
+        if self.action == 'revoke':
+            return TokenRevokeSerializer
+        if self.action == 'revoke_all':
+            return TokenRevokeAllSerializer
+        return super().get_serializer_class()
+
+    @extend_schema(responses={201: TokenSerializer})
+    def create(self, request):
+        """
+        Emite um token de acesso para o usuário e a senha informados (o único momento em que a senha é verificada),
+        ou para o usuário autenticado por sessão ou autenticação básica. Um token não emite outro token.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data.get('user')
+        if user is None:
+            if not request.user.is_authenticated or isinstance(request.auth, dict):
+                raise NotAuthenticated('Informe o usuário e a senha.')
+            user = request.user
+
+        token, expires_at = issue_token(user)
+        data = {'token': token, 'tokenType': 'Bearer',
+                'expiresAt': datetime.fromtimestamp(expires_at, tz=timezone.utc)}
+        return Response(TokenSerializer(data).data, status=status.HTTP_201_CREATED)
+
+    @extend_schema(responses={204: None})
+    @action(detail=False, methods=['post'])
+    def revoke(self, request):
+        """
+        Revoga o token informado ou, sem o token, o token usado na requisição. Apenas administradores revogam tokens
+        de outros usuários.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if 'token' in serializer.validated_data:
+            try:
+                claims = decode_token(serializer.validated_data['token'])
+            except AuthenticationFailed as exc:
+                raise ValidationError({'token': [exc.detail]})
+        elif isinstance(request.auth, dict):
+            claims = request.auth
+        else:
+            raise ValidationError({'token': ['Informe o token.']})
+
+        if claims['u'] != request.user.pk and not request.user.is_staff:
+            raise PermissionDenied()
+        revoke_token(claims)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @extend_schema(responses={204: None})
+    @action(detail=False, methods=['post'], url_path='revoke-all')
+    def revoke_all(self, request):
+        """
+        Revoga todos os tokens emitidos até agora para o usuário autenticado ou, para administradores, para o usuário
+        informado.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_pk = serializer.validated_data.get('user', request.user.pk)
+        if user_pk != request.user.pk and not request.user.is_staff:
+            raise PermissionDenied()
+        revoke_user_tokens(user_pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@extend_schema(tags=['Banco de dados'], responses=OpenApiTypes.OBJECT)
+class DatabasePoolStatsView(InstrumentedViewMixin, APIView):
+    """
+    Contadores dos pools de conexões do processo, por banco de dados, este operação pode ser acessado apenas por
+    superusuários (admins)
+    """
+    permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(pool_stats())
+
+
+@extend_schema(tags=['Métricas'], responses={(200, 'text/plain'): OpenApiTypes.STR})
+class MetricsView(APIView):
+    """
+    Métricas agregadas das actions dos ViewSets (requisições, erros, histogramas de duração e de queries) no formato
+    texto do Prometheus, este operação pode ser acessado apenas por superusuários (admins)
+    """
+    permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+    renderer_classes = [PrometheusRenderer]
+
+    def get(self, request):
+        return Response(get_registry().render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -27,13 +27,17 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
+    'django_filters',
     'drf_spectacular',
     'api',
 ]
 
 MIDDLEWARE = [
+    # Primeiro middleware, para medir a requisição inteira (api.core.instrumentation)
+    'api.core.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,15 +82,144 @@ if None in (DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT):
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # PostgreSQL com health check das conexões persistentes e pool de conexões (api.db)
+        'ENGINE': 'api.db',
         'NAME': DB_NAME,
         'USER': DB_USER,
         'PASSWORD': DB_PASSWORD,
         'HOST': DB_HOST,
         'PORT': DB_PORT,
+        # Segundos que a conexão é mantida aberta entre as requisições, 0 fecha a conexão ao final de cada requisição
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'false').lower() in ('1', 'true', 'yes'),
+        # Pool de conexões do processo, desabilitado com MAX_SIZE 0
+        'POOL': {
+            'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', 0)),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        },
+        # O PgBouncer em modo transaction não mantém cursores entre as transações
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_PGBOUNCER', 'false').lower() in ('1', 'true', 'yes'),
+    }
+}
+
+# Réplicas de leitura: hosts separados por vírgula, no formato host ou host:porta, com o mesmo banco de dados, usuário
+# e senha do banco principal
+DB_REPLICA_HOSTS = [host.strip() for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host.strip()]
+
+# Nos testes unitários, uma réplica espelha o banco de dados de testes (TEST MIRROR) por uma segunda conexão, que não
+# enxerga as alterações ainda não confirmadas, como uma réplica atrasada. Os testes habilitam as réplicas com
+# override_settings(DATABASE_REPLICAS=...)
+TESTING = (len(sys.argv) > 1 and sys.argv[1] == 'test')
+if TESTING and not DB_REPLICA_HOSTS:
+    DB_REPLICA_HOSTS = [DB_HOST + (':' + DB_PORT if DB_PORT else '')]
+
+for index, replica_host in enumerate(DB_REPLICA_HOSTS, 1):
+    replica_host, _, replica_port = replica_host.rpartition(':')
+    if not replica_port.isdigit():
+        replica_host, replica_port = replica_host + (':' if replica_host else '') + replica_port, DB_PORT
+    DATABASES['replica{}'.format(index)] = dict(
+        DATABASES['default'], HOST=replica_host, PORT=replica_port, REPLICA=True,
+        OPTIONS={'connect_timeout': int(os.getenv('DB_REPLICA_CONNECT_TIMEOUT', 2))},
+        TEST={'MIRROR': 'default'},
+    )
+
+DATABASE_ROUTERS = ['api.db.router.ReplicaRouter']
+
+DATABASE_REPLICAS = {
+    'ALIASES': [] if TESTING else ['replica{}'.format(index) for index in range(1, len(DB_REPLICA_HOSTS) + 1)],
+    # Atraso máximo, em segundos, para uma réplica receber leituras
+    'MAX_LAG': float(os.getenv('DB_REPLICA_MAX_LAG', 10)),
+    # Intervalo, em segundos, entre as verificações de atraso e disponibilidade de cada réplica em cada processo
+    'CHECK_INTERVAL': float(os.getenv('DB_REPLICA_CHECK_INTERVAL', 5)),
+    # Tempo, em segundos, que as leituras de quem acabou de fazer uma alteração são feitas no banco principal
+    'PIN_SECONDS': float(os.getenv('DB_REPLICA_PIN_SECONDS', 5)),
+    'CACHE_ALIAS': 'default',
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
+# Cache de produtos serializados: LRU em memória do processo (LOCAL_*) sobre o cache compartilhado (ALIAS)
+PRODUCT_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': int(os.getenv('PRODUCT_CACHE_TIMEOUT', 300)),
+    # Incrementar sempre que o formato do ProductSerializer mudar
+    'VERSION': 2,
+    'LOCAL_MAX_SIZE': int(os.getenv('PRODUCT_CACHE_LOCAL_MAX_SIZE', 10000)),
+    'LOCAL_TIMEOUT': int(os.getenv('PRODUCT_CACHE_LOCAL_TIMEOUT', 5)),
+}
+
+# Cache do conjunto de produtos favoritos de cada cliente, usado em /api/customer/{id}/wishlist/contains/
+# (api.core.membership): listas com até EXACT_MAX_SIZE produtos são armazenadas inteiras, as maiores como filtro de
+# Bloom, que descarta sem queries os produtos fora da lista
+WISHLIST_MEMBERSHIP_CACHE = {
+    'ENABLED': os.getenv('WISHLIST_MEMBERSHIP_CACHE', 'false').lower() in ('1', 'true', 'yes'),
+    'ALIAS': 'default',
+    'TIMEOUT': int(os.getenv('WISHLIST_MEMBERSHIP_CACHE_TIMEOUT', 300)),
+    'EXACT_MAX_SIZE': int(os.getenv('WISHLIST_MEMBERSHIP_EXACT_MAX_SIZE', 1000)),
+    'FALSE_POSITIVE_RATE': 0.01,
+}
+
+# Serializa as listagens e consultas de produtos, clientes e listas de favoritos diretamente de .values(), sem
+# instanciar os modelos (api.core.values)
+FAST_SERIALIZATION = os.getenv('FAST_SERIALIZATION', 'false').lower() in ('1', 'true', 'yes')
+
+# Consulta o cliente com a lista de favoritos já serializada, armazenada em CustomerWishlistSnapshot (api.core.snapshot)
+WISHLIST_SNAPSHOT = os.getenv('WISHLIST_SNAPSHOT', 'false').lower() in ('1', 'true', 'yes')
+
+
+# Instrumentação das requisições: header Server-Timing com o tempo das queries, da serialização e da renderização, e
+# log das requisições lentas no logger api.performance (api.core.instrumentation)
+INSTRUMENTATION = {
+    'ENABLED': os.getenv('INSTRUMENTATION', 'false').lower() in ('1', 'true', 'yes'),
+    'SLOW_REQUEST_MS': float(os.getenv('SLOW_REQUEST_MS', 500)),
+    'SERVER_TIMING': os.getenv('SERVER_TIMING', 'true').lower() in ('1', 'true', 'yes'),
+}
+
+# Métricas agregadas das actions dos ViewSets, no formato do Prometheus em /metrics (api.core.metrics). Com vários
+# processos (ex.: workers do gunicorn), DIRECTORY deve ser um diretório compartilhado por eles, esvaziado ao iniciar o
+# servidor
+METRICS = {
+    'ENABLED': os.getenv('METRICS', 'false').lower() in ('1', 'true', 'yes'),
+    'DIRECTORY': os.getenv('METRICS_DIR') or None,
+}
+
+# Remoção definitiva, em segundo plano, dos clientes e produtos removidos (api.core.deletion, manage.py purge_deleted):
+# itens das listas de favoritos removidos por transação, reserva de um job, em segundos, e tentativas
+DELETION_JOBS = {
+    'BATCH_SIZE': int(os.getenv('DELETION_BATCH_SIZE', 1000)),
+    'LEASE_SECONDS': 60,
+    'MAX_ATTEMPTS': 3,
+}
+
+# Tokens de acesso assinados (api.core.authentication): validade, em segundos, e cache da verificação das revogações,
+# que ficam no banco de dados. Um token revogado pode ser aceito por até CACHE_TIMEOUT segundos nos processos que
+# já o verificaram
+API_TOKEN = {
+    'LIFETIME': int(os.getenv('API_TOKEN_LIFETIME', 3600)),
+    'CACHE_ALIAS': 'default',
+    'CACHE_TIMEOUT': int(os.getenv('API_TOKEN_CACHE_TIMEOUT', 5)),
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.performance': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -136,8 +269,15 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
     ],
+    # O token vem primeiro para não consultar a sessão nas requisições com o token
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'api.core.authentication.BearerTokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'api.core.pagination.CustomPageNumberPagination',
-    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Documenta os parâmetros fields e exclude das leituras (SparseFieldsetMixin)
+    'DEFAULT_SCHEMA_CLASS': 'api.core.fields.SparseFieldsetSchema',
 }
 
 if not DEBUG:
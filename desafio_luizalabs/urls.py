@@ -3,15 +3,21 @@ from django.urls import include, path
 from django.views import generic
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
-from api.routers import router
+from api.routers import async_urlpatterns, router
+from api.views import DatabasePoolStatsView, MetricsView
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
 
     path('', generic.RedirectView.as_view(pattern_name='api-root')),
+    path('api/async/', include(async_urlpatterns)),
+    path('api/db-pool-stats/', DatabasePoolStatsView.as_view(), name='db-pool-stats'),
     path('api/', include(router.urls)),
 
+    # Métricas no formato do Prometheus, apenas para administradores
+    path('metrics', MetricsView.as_view(), name='metrics'),
+
     path('schema/', SpectacularAPIView.as_view(), name='schema'),
     path('swagger-ui/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
 